@@ -1,15 +1,44 @@
+import ast
+import heapq
+import json
+import re
+import sys
 import pandas as pd
-from difflib import SequenceMatcher
 from pydash import get as _get
 from loguru import logger
+from clusterstore import make_signature
+from errorsignature import make_error_signature
+from fieldaccess import compile_path, compile_projection
+from lshindex import MinHashLSHIndex
+from parallelmatch import ParallelMatcher
+from similarity import DEFAULT_SIMILARITY_BACKEND, SIMILARITY_BACKENDS
+from tfidfindex import TfidfIndex
+from runmetrics import metrics
+from templateminer import mask_message, mine_templates
+from filter_latest_workflow import LatestWorkflowFilter
+from defaultparams import GetSourceFilesParameters
+from typing import Any, Callable, Iterable, Iterator
 
 # Defaults
 DEFAULT_SIMILARITY_RATIO = 1
+DEFAULT_CLUSTERING_ENGINE = "exhaustive"
+CLUSTERING_ENGINES = ["exhaustive", "lsh", "parallel", "tfidf"]
+# Worker processes of the "parallel" engine; the number of CPUs if 0
+DEFAULT_WORKERS = 0
+DEFAULT_MESSAGE_KEY = "message"
+MESSAGE_KEYS = ["message", "template", "signature"]
+PARTIAL_SCHEMA_VERSION = 1
 ANALYSIS_FIELDS = ["id", "createdAt", "lastUpdatedAt", "tasks"]
 
 # For truncating error messages to speed up the error comparison process. Comparing strings with SequenceMatcher is linear w.r.t. string length on average case but quadratic on worst case. This behavior may be too slow with full messages with large numbers of messages and message groups
 ERROR_MESSAGE_TRUNCATION_LENGTH = 300
 
+# The "parallel" engine compares workflows with the existing groups in batches. Batches
+# start small, as all groups made within a batch are compared serially, and double up to
+# the maximum size.
+PARALLEL_MIN_BATCH_SIZE = 64
+PARALLEL_MAX_BATCH_SIZE = 4096
+
 # Ordering:
 #   grab task-script "output" logs
 #   if no output, grab "logs" because when windows task-scripts fail, output is stored in "logs"
@@ -22,27 +51,210 @@ DEFAULT_EXTRACT_FIELDS = {
     "file_id": "inputFile.fileId",
 }
 
-TASK_EVAL_FIELDS = ["tasks", "supersededTasks"]
+# Extracted fields that are only needed if another field is empty: { field: other field }.
+# "task_log" and "masterScriptLogs" are only used as the error when there is no
+# "task_output", so they are dropped from fetched workflows that have a task output, and
+# the task log is only parsed if there is none.
+FALLBACK_FIELDS = {"task_log": "task_output", "masterScriptLogs": "task_output"}
+
+# Fields of raw workflow results read besides the extract fields: by the latest-workflow
+# filter, the workflow cache and the aggregation itself. Fetched workflows are reduced to
+# these and the extract fields (see `make_workflow_projection`).
+PROJECTION_FIELDS = [
+    "id",
+    "status",
+    "createdAt",
+    "lastUpdatedAt",
+    "protocolVersion",
+    "inputFile.fileKey",
+]
+
+# Levels of the log entries that hold an error, lowercased
+LOG_ERROR_LEVELS = {"error", "critical", "fatal"}
+
+# Paths into the "log" string of a task, which holds one log entry per line
+TASK_LOG_PATH = re.compile(r"^((?:tasks|supersededTasks)\.-?\d+\.log)(?:\.(.+))?$")
+
+
+def parse_task_log(log: str) -> list:
+    """
+    Parses the log entries of a task log, one per line. Each line is parsed as JSON, or
+    as a Python literal if it is not valid JSON. Lines that are neither, including lines
+    too deeply nested to parse, are kept as strings. Log content is never evaluated as
+    code.
+    """
+    entries = []
+    for line in log.split("\n"):
+        if not line.strip():
+            continue
+        try:
+            entries.append(json.loads(line))
+        except (ValueError, RecursionError, MemoryError):
+            try:
+                entries.append(ast.literal_eval(line))
+            except (ValueError, SyntaxError, TypeError, RecursionError, MemoryError):
+                entries.append(line)
+    return entries
 
 
 def eval_task_log(tasks: list) -> list:
+    """
+    Returns a copy of the tasks with each task's "log" parsed with `parse_task_log`.
+    """
     return [
-        {
-            k: [eval(x) for x in v.split("\n")] if k == "log" else v
-            for k, v in task.items()
-        }
+        {k: parse_task_log(v) if k == "log" else v for k, v in task.items()}
         for task in tasks
     ]
 
 
-def workflow_result_to_dataframe(workflows: list, **extract_fields: str) -> pd.DataFrame:
+def compile_workflow_field(location: str) -> Callable[[dict], Any]:
+    """
+    Compiles `location` (using pydash.get() syntax) into an accessor function for workflow
+    results, so the path is parsed once rather than for every workflow. Task logs are
+    stored as strings; if `location` points into a task log, only that log is parsed, and
+    only when the accessor is called.
+    """
+    match = TASK_LOG_PATH.match(location)
+    if not match:
+        return compile_path(location)
+    get_log = compile_path(match.group(1))
+    get_entry = compile_path(match.group(2)) if match.group(2) else None
+
+    def accessor(workflow: dict):
+        log = get_log(workflow)
+        if isinstance(log, str):
+            log = parse_task_log(log)
+        return get_entry(log) if get_entry else log
+
+    return accessor
+
+
+def get_workflow_field(workflow, location: str):
+    """
+    Returns the value at `location` (using pydash.get() syntax) of a workflow result. See
+    `compile_workflow_field`.
+    """
+    return compile_workflow_field(location)(workflow)
+
+
+def make_workflow_projection(**extract_fields: str) -> Callable[[dict], dict]:
+    """
+    Returns a function that reduces a raw workflow result to the fields the WEA reads:
+    `PROJECTION_FIELDS` and the extract fields (`DEFAULT_EXTRACT_FIELDS` plus any given as
+    keyword arguments, like for `workflow_result_to_dataframe()`). Only the last task is
+    kept, so earlier and superseded tasks, and any other metadata, are dropped.
+
+    Workflows are summarized further by dropping the fallback fields (see
+    `FALLBACK_FIELDS`) of workflows whose field they fall back from is set, e.g. the task
+    and master script logs of a workflow with a task output. Most failed workflows have a
+    task output, so their logs, often the bulk of a workflow, are not kept.
+
+    The projected workflow is a plain dict that gives the same extracted fields as the
+    original, so it can be projected again, cached as JSON and extracted.
+    """
+    all_extract_fields = {**DEFAULT_EXTRACT_FIELDS, **extract_fields}
+    locations = PROJECTION_FIELDS + list(all_extract_fields.values())
+    project = compile_projection(locations)
+
+    # (primary field accessor, parent accessor, key of the fallback field)
+    fallbacks = []
+    for field, primary in FALLBACK_FIELDS.items():
+        if field not in all_extract_fields or primary not in all_extract_fields:
+            continue
+        location = all_extract_fields[field]
+        if (
+            any(
+                other.startswith(location + ".")
+                for other in locations
+                if other != location
+            )
+            or locations.count(location) > 1
+        ):
+            continue  # also read by another field
+        parent, _, key = location.rpartition(".")
+        fallbacks.append(
+            (
+                compile_path(all_extract_fields[primary]),
+                compile_path(parent) if parent else None,
+                key,
+            )
+        )
+
+    def project_workflow(workflow: dict) -> dict:
+        projected = project(workflow)
+        for get_primary, get_parent, key in fallbacks:
+            if not get_primary(projected):
+                continue
+            parent = get_parent(projected) if get_parent else projected
+            original = get_parent(workflow) if get_parent else workflow
+            # parents that were kept whole are shared with the original workflow
+            if isinstance(parent, dict) and parent is not original:
+                parent.pop(key, None)
+        return projected
+
+    return project_workflow
+
+
+def make_field_extractor(
+    columns: list = None, **extract_fields: str
+) -> Callable[[dict], dict]:
+    """
+    Returns a function that extracts the fields of interest of a single workflow result,
+    like one row of `workflow_result_to_dataframe()`. All paths are compiled once, up
+    front, so extracting a workflow is a single pass over the compiled accessors.
+
+    If `columns` is given, only those columns are extracted. A fallback field (see
+    `FALLBACK_FIELDS`) still looks at the field it falls back from, but that field is only
+    returned if it was asked for.
+    """
+    all_extract_fields = {**DEFAULT_EXTRACT_FIELDS, **extract_fields}
+    if columns is None:
+        columns = ANALYSIS_FIELDS + list(all_extract_fields.keys())
+    unknown = set(columns) - set(ANALYSIS_FIELDS) - set(all_extract_fields)
+    if unknown:
+        raise ValueError(f"Unknown workflow columns: {', '.join(sorted(unknown))}.")
+
+    analysis_fields = [field for field in ANALYSIS_FIELDS if field in columns]
+    needed = [field for field in all_extract_fields if field in columns]
+    for field in list(needed):
+        primary = FALLBACK_FIELDS.get(field)
+        if primary in all_extract_fields and primary not in needed:
+            needed.insert(needed.index(field), primary)
+    accessors = [
+        (
+            field,
+            compile_workflow_field(all_extract_fields[field]),
+            FALLBACK_FIELDS.get(field),
+        )
+        for field in needed
+    ]
+    dropped = [field for field in needed if field not in columns]
+
+    def extract(workflow: dict) -> dict:
+        record = {field: workflow.get(field) for field in analysis_fields}
+        for field, accessor, primary in accessors:
+            if primary and record.get(primary):
+                record[field] = None  # not needed, so not parsed
+            else:
+                record[field] = accessor(workflow)
+        for field in dropped:
+            del record[field]
+        return record
+
+    return extract
+
+
+def workflow_result_to_dataframe(
+    workflows: list, columns: list = None, **extract_fields: str
+) -> pd.DataFrame:
     """
     Convert the list of workflow results to a dataframe and subset on fields of interest.
 
     By default this converts the result to a dataframe and extracts the following fields
     from each record: "tasks", "masterScriptLogs", "id", "createdAt", "lastUpdatedAt".
     It will further process the result by unnesting the fields "output" and "log" from the
-    last element of "tasks".
+    last element of "tasks". The "log" is only parsed, and "task_log" and
+    "masterScriptLogs" only set, if there is no "output".
 
     You may add to the returned columns by setting keyword arguments with output column to
     extracted field (using pydash.get() syntax).
@@ -50,65 +262,385 @@ def workflow_result_to_dataframe(workflows: list, **extract_fields: str) -> pd.D
 
     >>> workflow_result_to_dataframe(workflows, md_department="inputFile.customMetadata.Department")
 
-    """
+    Workflows fetched with `get_pipeline_info()` only hold `PROJECTION_FIELDS` and the
+    default extract fields, so add any other path to `PROJECTION_FIELDS` before fetching.
+
+    To build only some of the columns, pass them as `columns`:
+
+    >>> workflow_result_to_dataframe(workflows, columns=["id", "tasks", "task_output"])
 
+    """
     all_extract_fields = {**DEFAULT_EXTRACT_FIELDS, **extract_fields}
+    if columns is None:
+        columns = ANALYSIS_FIELDS + list(all_extract_fields.keys())
 
-    workflow_dataframe = pd.DataFrame.from_dict(workflows)
+    extract = make_field_extractor(columns, **extract_fields)
+    return pd.DataFrame([extract(workflow) for workflow in workflows], columns=columns)
 
-    # Do some string to dict conversions on some fields for better access
-    for field in TASK_EVAL_FIELDS:
-        if field in workflow_dataframe:
-            workflow_dataframe[field] = workflow_dataframe[field].apply(eval_task_log)
 
-    for field, location in all_extract_fields.items():
-        workflow_dataframe[field] = workflow_dataframe.apply(
-            lambda x: _get(x, location), axis=1
-        )
+def extract_workflow_fields(workflow: dict, **extract_fields: str) -> dict:
+    """
+    Extracts the fields of interest of a single workflow result, like one row of
+    `workflow_result_to_dataframe()`. The rest of the workflow result is not kept, so
+    workflows can be processed one at a time as they are fetched. To extract many
+    workflows, use `make_field_extractor` to compile the paths once.
+    """
+    return make_field_extractor(**extract_fields)(workflow)
 
-    return workflow_dataframe[ANALYSIS_FIELDS + list(all_extract_fields.keys())]
 
+def get_workflow_error(workflow: dict, fields: list):
+    """
+    Returns the value of the first non-empty field of a workflow record, or None.
+    """
+    for field in fields:
+        error = workflow[field]
+        if error:
+            return error
+    return None
 
-def aggregate_workflow_errors(
-    workflows: pd.DataFrame,
-    similarity_ratio: float = DEFAULT_SIMILARITY_RATIO,
-    fields: list = list(DEFAULT_EXTRACT_FIELDS.keys()),
-    status: str = "failed",
-) -> dict:
-    errors = []
-    no_error_found_workflow_count = 0
-    file_id_list = []
 
-    logger.info(f"Aggregating workflows.")
+def get_error_message(error) -> str:
+    """
+    Returns the message used to compare an extracted error against other errors.
+    """
+    error_msg = str(_get(error, "result.message"))
+    if not error_msg:
+        error_msg = str(error)
+    return error_msg
 
-    status_statement = "error" if status.lower() == "failed" else "message"
 
-    workflow_count = 0
+def get_log_message(entries) -> str:
+    """
+    Returns the message of the last error entry of a parsed task log or master script log
+    (see `LOG_ERROR_LEVELS`), or of its last entry if none has an error level. Entries
+    without a "message" are used whole.
+    """
+    if not isinstance(entries, list):
+        return str(entries)
+    if not entries:
+        return ""
+    errors = [
+        entry
+        for entry in entries
+        if isinstance(entry, dict)
+        and str(entry.get("level", "")).lower() in LOG_ERROR_LEVELS
+    ]
+    entry = errors[-1] if errors else entries[-1]
+    if isinstance(entry, dict) and "message" in entry:
+        return str(entry["message"])
+    return str(entry)
+
+
+def get_error_text(error) -> str:
+    """
+    Returns the full text of an extracted error: the result message of a task output, or
+    the log message (see `get_log_message`) of an error from a task log or the master
+    script logs. Unlike `get_error_message`, errors without a result message are not
+    reduced to "None".
+    """
+    message = _get(error, "result.message")
+    if message is not None:
+        return str(message)
+    return get_log_message(error)
+
+
+def find_similar_group(
+    error_msg: str,
+    group_keys: list,
+    similarity_ratio: float,
+    candidates=None,
+    backend: str = DEFAULT_SIMILARITY_BACKEND,
+):
+    """
+    Returns the index of the first group whose message is at least `similarity_ratio`
+    similar to `error_msg`, or None if no such group exists. Similarity is measured by
+    the `backend` of `SIMILARITY_BACKENDS`.
+
+    If `candidates` (a sorted list of group indices) is given, only those groups are compared.
+    """
+    is_similar = SIMILARITY_BACKENDS[backend]
+    # Note the truncation of message length; this is useful since comparing strings with SequenceMatcher is linear on average case but quadratic on worst case. For large numbers of error messages, this may be problematic.
+    truncated_msg = error_msg[:ERROR_MESSAGE_TRUNCATION_LENGTH]
+    if candidates is None:
+        candidates = range(len(group_keys))
+    compared = 0
+    for index in candidates:
+        compared += 1
+        if is_similar(
+            truncated_msg,
+            group_keys[index][:ERROR_MESSAGE_TRUNCATION_LENGTH],
+            similarity_ratio,
+        ):
+            metrics.comparisons += compared
+            return index
+    metrics.comparisons += compared
+    return None
+
 
+def add_message_templates(
+    workflows: pd.DataFrame, fields: list = list(DEFAULT_EXTRACT_FIELDS.keys())
+) -> pd.DataFrame:
+    """
+    Adds the "template_id", "template" and "template_parameters" columns to the workflow
+    dataframe by mining log templates from each workflow's error message.
+
+    Variable tokens (UUIDs, timestamps, file keys, numbers, ...) are masked, so messages
+    that only differ in these values share a template and are grouped by a single lookup
+    when aggregating with `message_field="template"`.
+    """
+    logger.info(f"Mining message templates.")
+    messages = []
     for workflow in workflows.to_dict(orient="records"):
-        workflow_count += 1
-        if workflow_count % 100 == 0:
-            logger.info(
-                f"Aggregating workflow {workflow_count} of {len(workflows.index)}"
+        error = get_workflow_error(workflow, fields)
+        messages.append(get_error_message(error) if error else "")
+    templates = mine_templates(messages)
+    workflows = workflows.assign(
+        template_id=[template.template_id for template in templates],
+        template=[template.template for template in templates],
+        template_parameters=[template.parameters for template in templates],
+    )
+    logger.info(
+        f"{len(set(workflows['template_id']))} message templates found for {len(templates)} workflows."
+    )
+    return workflows
+
+
+def add_message_signatures(
+    workflows: pd.DataFrame, fields: list = list(DEFAULT_EXTRACT_FIELDS.keys())
+) -> pd.DataFrame:
+    """
+    Adds the "signature" column to the workflow dataframe: the signature of each
+    workflow's error text (see `get_error_text` and `make_error_signature`), so errors
+    from task logs and master script logs are signed by their log message.
+
+    Messages holding a stack trace are reduced to their exception type, masked final
+    message line and innermost frames, so tracebacks that only differ in their outer
+    frames, line numbers or variable values share a signature and are grouped by a single
+    lookup when aggregating with `message_field="signature"`. Other messages are kept as
+    they are.
+    """
+    logger.info(f"Extracting error message signatures.")
+    signatures = []
+    traced = 0
+    for workflow in workflows.to_dict(orient="records"):
+        error = get_workflow_error(workflow, fields)
+        message = get_error_text(error) if error else ""
+        signature = make_error_signature(message)
+        traced += signature != message
+        signatures.append(signature)
+    workflows = workflows.assign(signature=signatures)
+    logger.info(
+        f"{len(set(signatures))} signatures found for {len(signatures)} workflows, {traced} of them from stack traces."
+    )
+    return workflows
+
+
+class ErrorAggregator:
+    """
+    Incrementally groups workflows by their error message.
+
+    With a `similarity_ratio` of 1, only identical messages are grouped. Otherwise, each
+    message joins the first group whose message is at least `similarity_ratio` similar.
+    The "exhaustive" engine compares each new message against every group; the "lsh"
+    engine only compares against the candidate groups proposed by a MinHash LSH index,
+    which is much faster for many groups but may occasionally miss a borderline match.
+    The "parallel" engine compares batches of messages (see `prefetch`) with every group
+    across `workers` processes, and gives the same groups as the "exhaustive" engine.
+    The "tfidf" engine compares batches of messages as character n-gram TF-IDF vectors,
+    with a cosine similarity of at least `similarity_ratio`, using sparse-matrix products;
+    it needs scipy. Cosine similarities have no fixed relation to the ratios of the
+    other engines, so the same `similarity_ratio` gives very different groups. The other
+    engines measure similarity with the `similarity` backend (see `similarity.py`).
+
+    By default, messages are compared using the extracted error's result message. If
+    `message_field` is set, that field of the workflow record is compared instead, e.g.
+    "template" after `add_message_templates()` or "signature" after
+    `add_message_signatures()` has been applied.
+
+    Workflows can be added one at a time, e.g. as pages of workflows are fetched, and a
+    workflow can be removed again if it is superseded by a later workflow.
+
+    If `clusters` from a `ClusterStore` are given, they are added as empty groups first,
+    so messages are matched against known clusters before new groups are made, and
+    groups keep the ID of the cluster they match. With a `similarity_ratio` below 1, a
+    message with variable tokens is first compared with the group whose message has the
+    same signature (see `make_signature`), before any other group.
+    """
+
+    def __init__(
+        self,
+        similarity_ratio: float = DEFAULT_SIMILARITY_RATIO,
+        fields: list = list(DEFAULT_EXTRACT_FIELDS.keys()),
+        status: str = "failed",
+        engine: str = DEFAULT_CLUSTERING_ENGINE,
+        message_field: str = None,
+        clusters: list = None,
+        workers: int = DEFAULT_WORKERS,
+        similarity: str = DEFAULT_SIMILARITY_BACKEND,
+    ):
+        if engine not in CLUSTERING_ENGINES:
+            raise ValueError(
+                f"Unknown clustering engine {engine}. Valid engines are: {', '.join(CLUSTERING_ENGINES)}."
+            )
+        if similarity not in SIMILARITY_BACKENDS:
+            raise ValueError(
+                f"Unknown similarity backend {similarity}. Valid backends are: {', '.join(SIMILARITY_BACKENDS)}."
             )
+        self.similarity_ratio = similarity_ratio
+        self.similarity = similarity
+        self.fields = fields
+        self.status = status
+        self.message_field = message_field
+        self.status_statement = "error" if status.lower() == "failed" else "message"
+
+        self.lsh_index = None
+        if engine == "lsh" and similarity_ratio != DEFAULT_SIMILARITY_RATIO:
+            self.lsh_index = MinHashLSHIndex(similarity_ratio)
+            if not self.lsh_index.prunes:
+                logger.warning(
+                    f"The 'lsh' engine cannot prune candidate groups at a similarity ratio of {similarity_ratio}. Using the 'exhaustive' engine instead..."
+                )
+                self.lsh_index = None
+        self.parallel_matcher = None
+        if engine == "parallel" and similarity_ratio != DEFAULT_SIMILARITY_RATIO:
+            self.parallel_matcher = ParallelMatcher(
+                workers, truncation_length=ERROR_MESSAGE_TRUNCATION_LENGTH
+            )
+        self.tfidf_index = None
+        if engine == "tfidf" and similarity_ratio != DEFAULT_SIMILARITY_RATIO:
+            try:
+                self.tfidf_index = TfidfIndex(
+                    similarity_ratio, truncation_length=ERROR_MESSAGE_TRUNCATION_LENGTH
+                )
+            except ImportError as error:
+                logger.error(f"{error} Using the 'exhaustive' engine instead...")
+        # { message: (index of the first similar group or None, number of groups it was
+        # compared with, earlier messages of the batch it is similar to with the "tfidf"
+        # engine) }, for the messages of the latest prefetched batch
+        self.prematched = {}
+
+        # groups hold {"value": error, "count": int, "workflow_info": {seq: summary},
+        # "messages": {seq: message}, "seqs": heap of the seqs of "messages", which may
+        # still hold removed seqs, "cluster_id": int, "value_seq": seq of the workflow
+        # whose error is the value, "key_seq": seq of the workflow whose message the
+        # group is matched by, or None for known clusters}
+        self.groups = []
+        # comparison message of each group, computed once on creation
+        self.group_keys = []
+        self.exact_match_index = {}  # { "group message": index into groups }
+        self.file_ids = {}  # { seq: file ID }, in the order workflows were added
+        self.members = {}  # { workflow ID: (group index, seq) }
+        self.moved = {}  # { retired group index: index of the group it was moved to }
+        # { workflow ID: (seq, whether it has no error) }, of workflows with no tasks or
+        # no error
+        self.skipped = {}
+        self.retired = set()  # indices of the groups that are not matched anymore
+        self.reordered = False  # whether workflows were removed, see `remove`
+        self.no_error_found_workflow_count = 0
+        self._seq = 0
+
+        # { message signature: index into groups }; only used with known clusters
+        self.signature_index = None
+        if clusters is not None:
+            self.signature_index = {}
+            for cluster in clusters:
+                group_index = self.new_group(cluster["message"], None)
+                self.groups[group_index]["cluster_id"] = cluster["cluster_id"]
+                self.signature_index.setdefault(cluster["signature"], group_index)
+
+    def get_message(self, workflow: dict):
+        """
+        Returns the message a workflow record is grouped by, or None if it has no tasks or
+        no error.
+        """
+        if len(workflow["tasks"]) == 0:
+            return None
+        error = get_workflow_error(workflow, self.fields)
+        if not error:
+            return None
+        if self.message_field:
+            return str(workflow[self.message_field])
+        return get_error_message(error)
+
+    def prefetch(self, messages: Iterable[str]) -> None:
+        """
+        With the "parallel" engine, compares a batch of messages that are about to be
+        added with the existing groups across the worker processes, so that `find_group`
+        only has to compare them with the groups made since. With the "tfidf" engine,
+        compares them with the existing groups and with each other, so that `find_group`
+        needs no comparisons at all. Does nothing with the other engines.
+        """
+        if self.parallel_matcher is None and self.tfidf_index is None:
+            return
+        self.prematched = {}
+        messages = list(
+            dict.fromkeys(
+                message
+                for message in messages
+                if message is not None and message not in self.exact_match_index
+            )
+        )
+        group_count = len(self.group_keys)
+        if self.tfidf_index is not None and messages:
+            matches, earlier, compared = self.tfidf_index.match(messages, group_count)
+            metrics.comparisons += compared
+            self.prematched = {
+                message: (
+                    group_index,
+                    group_count,
+                    [messages[index] for index in earlier_indices],
+                )
+                for message, group_index, earlier_indices in zip(
+                    messages, matches, earlier
+                )
+            }
+            return
+        if not messages or not self.group_keys:
+            return
+        matches, compared = self.parallel_matcher.match(
+            messages, self.group_keys, self.similarity_ratio, backend=self.similarity
+        )
+        metrics.comparisons += compared
+        self.prematched = {
+            message: (group_index, group_count, None)
+            for message, group_index in zip(messages, matches)
+        }
+
+    def close(self) -> None:
+        """
+        Stops the worker processes of the "parallel" engine.
+        """
+        if self.parallel_matcher is not None:
+            self.parallel_matcher.close()
+            self.parallel_matcher = None
+
+    def add(self, workflow: dict, seq: int = None):
+        """
+        Adds a workflow record to its group. Returns the group index, or None if the
+        workflow has no tasks or no error.
 
+        Workflows are ordered by `seq`, the next one by default. A workflow that replaces
+        a removed one takes its `seq` (see `remove`), like it takes its place in
+        `filter_latest_workflow()`.
+        """
+        if seq is None:
+            seq = self._seq
+            self._seq += 1
         if len(workflow["tasks"]) == 0:
             logger.info(
                 f"No tasks found with workflow ID {workflow['id']}, skipping..."
             )
-            continue
+            self.skipped[workflow["id"]] = (seq, False)
+            return None
 
-        error = None
-        for field in fields:
-            error = workflow[field]
-            if error:
-                break
-        else:
+        error = get_workflow_error(workflow, self.fields)
+        if not error:
             logger.info(
-                f"No {status_statement} found for workflow id: {workflow['id']}, skipping..."
+                f"No {self.status_statement} found for workflow id: {workflow['id']}, skipping..."
             )
-            no_error_found_workflow_count += 1
-            continue
+            self.no_error_found_workflow_count += 1
+            self.skipped[workflow["id"]] = (seq, True)
+            return None
 
         workflow_summary = (
             workflow["id"],
@@ -117,61 +649,551 @@ def aggregate_workflow_errors(
             workflow["file_id"],
         )
 
-        found_similar_error = False
-
-        file_id_list.append(workflow["file_id"])
-
-        curr_error_msg = str(_get(error, "result.message"))
-        if not curr_error_msg:
-            curr_error_msg = str(error)
-
-        for existing_err in errors:
-            exist_err_msg = str(_get(existing_err, "value.result.message"))
-            if not exist_err_msg:
-                exist_err_msg = str(_get(existing_err, "value"))
-            if not exist_err_msg:
-                exist_err_msg = str(existing_err)
-
-            a = len(curr_error_msg)
-            b = curr_error_msg[:ERROR_MESSAGE_TRUNCATION_LENGTH]
-
-            if (
-                similarity_ratio == DEFAULT_SIMILARITY_RATIO
-                and curr_error_msg == exist_err_msg
-            ):
-                found_similar_error = True
-            elif curr_error_msg == exist_err_msg:
-                found_similar_error = True
-            elif (
-                # Note the truncation of message length; this is useful since comparing strings with SequenceMatcher is linear on average case but quadratic on worst case. For large numbers of error messages, this may be problematic.
-                similarity_ratio != DEFAULT_SIMILARITY_RATIO
-                and SequenceMatcher(
-                    None,
-                    curr_error_msg[:ERROR_MESSAGE_TRUNCATION_LENGTH],
-                    exist_err_msg[:ERROR_MESSAGE_TRUNCATION_LENGTH],
-                ).ratio()
-                >= similarity_ratio
-            ):
-                found_similar_error = True
-
-            if found_similar_error:
-                existing_err["count"] += 1
-                existing_err["workflow_info"].append(workflow_summary)
-                break
-
-        if not found_similar_error:
-            errors.append(
+        if self.message_field:
+            curr_error_msg = str(workflow[self.message_field])
+        else:
+            curr_error_msg = get_error_message(error)
+
+        group_index = self.find_group(curr_error_msg)
+        if group_index is None:
+            group_index = self.new_group(curr_error_msg, error)
+            self.groups[group_index]["key_seq"] = seq
+            logger.debug(
+                f"No same {self.status_statement} found. Added {error} to {self.status_statement} list as a new {self.status_statement}"
+            )
+
+        group = self.groups[group_index]
+        group["count"] += 1
+        group["workflow_info"][seq] = workflow_summary
+        self.add_member(group, seq, curr_error_msg)
+        self.file_ids[seq] = workflow["file_id"]
+        self.members[workflow["id"]] = (group_index, seq)
+        # the value of a known cluster first matched in this run, or of a group that a
+        # replacing workflow took the first place in
+        if group["value_seq"] is None or seq < group["value_seq"]:
+            group["value"], group["value_seq"] = error, seq
+        if group["key_seq"] is not None and seq < group["key_seq"]:
+            if curr_error_msg == self.group_keys[group_index]:
+                group["key_seq"] = seq
+            else:
+                group_index = self.move_group(group_index, curr_error_msg, seq)
+        return group_index
+
+    def remove(self, workflow_id: str):
+        """
+        Removes a previously added workflow from its group. Returns its `seq`, or None if
+        it was not added.
+
+        If the workflow was the group's first, the group takes the message it is matched
+        by from its next workflow, as if the removed workflow had never been added. Only
+        the error of a group's first workflow is kept, so the group keeps the removed
+        error as its value until a workflow with a lower `seq` is added to it, as the
+        workflow that replaces the removed one is. A group that becomes empty is retired,
+        so it is not matched anymore, unless it is a known cluster.
+        """
+        if workflow_id in self.skipped:
+            seq, no_error_found = self.skipped.pop(workflow_id)
+            self.no_error_found_workflow_count -= no_error_found
+            return seq
+        if workflow_id not in self.members:
+            return None
+        group_index, seq = self.members.pop(workflow_id)
+        while group_index in self.moved:
+            group_index = self.moved[group_index]
+        group = self.groups[group_index]
+        group["count"] -= 1
+        del group["workflow_info"][seq]
+        del group["messages"][seq]
+        del self.file_ids[seq]
+        self.reordered = True
+
+        if seq not in (group["value_seq"], group["key_seq"]):
+            return seq
+        first = self.first_seq(group)
+        if group["value_seq"] == seq:
+            if first is None:
+                group["value"] = None
+            group["value_seq"] = first
+        if group["key_seq"] == seq:
+            if first is None:
+                self.retire_group(group_index)
+            elif group["messages"][first] == self.group_keys[group_index]:
+                group["key_seq"] = first
+            else:
+                self.move_group(group_index, group["messages"][first], first)
+        return seq
+
+    @staticmethod
+    def add_member(group: dict, seq: int, message: str) -> None:
+        # equal messages of many workflows share one string
+        group["messages"][seq] = sys.intern(message)
+        heapq.heappush(group["seqs"], seq)
+
+    @staticmethod
+    def first_seq(group: dict):
+        """
+        Returns the lowest seq of the workflows in a group, or None if it is empty.
+        Removed seqs are dropped from the heap as they come up.
+        """
+        seqs = group["seqs"]
+        while seqs and seqs[0] not in group["messages"]:
+            heapq.heappop(seqs)
+        return seqs[0] if seqs else None
+
+    def retire_group(self, group_index: int) -> None:
+        """
+        Stops a group from being matched. Groups are never deleted, as the indices and
+        messages of the groups are shared with the clustering engines.
+        """
+        self.retired.add(group_index)
+        if self.exact_match_index.get(self.group_keys[group_index]) == group_index:
+            del self.exact_match_index[self.group_keys[group_index]]
+
+    def move_group(self, group_index: int, key: str, key_seq: int) -> int:
+        """
+        Moves the workflows of a group to a new group matched by `key`, the message of the
+        workflow `key_seq`, and retires the old group. Returns the new group index.
+        """
+        group = self.groups[group_index]
+        self.retire_group(group_index)
+        new_index = self.new_group(key, group["value"])
+        new_group = self.groups[new_index]
+        for field in (
+            "count",
+            "workflow_info",
+            "messages",
+            "seqs",
+            "cluster_id",
+            "value_seq",
+        ):
+            new_group[field] = group[field]
+        new_group["key_seq"] = key_seq
+        self.groups[group_index] = self.make_group(None)
+        # members are looked up through the moves, instead of updating each of them
+        self.moved[group_index] = new_index
+        return new_index
+
+    def add_group(
+        self, key: str, value, workflow_info: list, cluster_id: int = None
+    ) -> int:
+        """
+        Adds an already aggregated group, e.g. of a partial aggregate, whose workflows were
+        matched by the message `key`. The group is matched like a single message and its
+        workflows are added to the matching group, except those added before. Returns the
+        group index.
+        """
+        group_index = self.find_group(key)
+        created = group_index is None
+        if created:
+            group_index = self.new_group(key, value)
+        group = self.groups[group_index]
+        if group["cluster_id"] is None:
+            group["cluster_id"] = cluster_id
+        for workflow_summary in workflow_info:
+            workflow_summary = tuple(workflow_summary)
+            if workflow_summary[0] in self.members:
+                continue
+            seq = self._seq
+            self._seq += 1
+            if group["value_seq"] is None:
+                group["value"], group["value_seq"] = value, seq
+            if created and group["key_seq"] is None:
+                group["key_seq"] = seq
+            group["count"] += 1
+            group["workflow_info"][seq] = workflow_summary
+            self.add_member(group, seq, key)
+            self.file_ids[seq] = workflow_summary[3]
+            self.members[workflow_summary[0]] = (group_index, seq)
+        return group_index
+
+    def find_group(self, error_msg: str):
+        """
+        Returns the index of the group a message belongs to, or None.
+        """
+        # Identical messages always land in the same group: group keys never change
+        # once created, so a message equal to an existing key was already checked
+        # against (and did not match) every group created before that one.
+        group_index = self.exact_match_index.get(error_msg)
+        if group_index is None and self.similarity_ratio != DEFAULT_SIMILARITY_RATIO:
+            if self.signature_index is not None:
+                group_index = self.find_signature_group(error_msg)
+                if group_index is not None:
+                    return group_index
+            if self.tfidf_index is not None and error_msg not in self.prematched:
+                self.prefetch([error_msg])  # not prefetched with its batch
+            candidates = None
+            if self.lsh_index is not None:
+                candidates = self.lsh_index.query(
+                    error_msg[:ERROR_MESSAGE_TRUNCATION_LENGTH]
+                )
+            elif error_msg in self.prematched:
+                group_index, group_count, earlier = self.prematched[error_msg]
+                if group_index is not None and group_index not in self.retired:
+                    return group_index
+                if group_index is not None:
+                    # the group was retired since; compare with the groups after it
+                    candidates = range(group_index + 1, len(self.group_keys))
+                elif earlier is not None:
+                    # the first group made in the batch from a similar message
+                    for message in earlier:
+                        group_index = self.exact_match_index.get(message)
+                        if group_index is not None and group_index >= group_count:
+                            return group_index
+                    return None
+                else:
+                    # only the groups made after the batch was prefetched are left
+                    candidates = range(group_count, len(self.group_keys))
+            if self.retired:
+                candidates = [
+                    index
+                    for index in (
+                        candidates
+                        if candidates is not None
+                        else range(len(self.group_keys))
+                    )
+                    if index not in self.retired
+                ]
+            group_index = find_similar_group(
+                error_msg,
+                self.group_keys,
+                self.similarity_ratio,
+                candidates=candidates,
+                backend=self.similarity,
+            )
+        return group_index
+
+    def find_signature_group(self, error_msg: str):
+        """
+        Returns the index of the group whose message has the same signature as
+        `error_msg` and is similar to it, or None. Only messages with variable tokens are
+        looked up, as the signature of any other message only matches itself.
+        """
+        _, parameters = mask_message(error_msg)
+        if not parameters:
+            return None
+        group_index = self.signature_index.get(make_signature(error_msg))
+        if group_index is None or group_index in self.retired:
+            return None
+        return find_similar_group(
+            error_msg,
+            self.group_keys,
+            self.similarity_ratio,
+            candidates=[group_index],
+            backend=self.similarity,
+        )
+
+    def new_group(self, error_msg: str, error) -> int:
+        group_index = len(self.groups)
+        self.exact_match_index[error_msg] = group_index
+        if self.lsh_index is not None:
+            self.lsh_index.add(error_msg[:ERROR_MESSAGE_TRUNCATION_LENGTH], group_index)
+        if self.tfidf_index is not None:
+            self.tfidf_index.add(error_msg)
+        if self.signature_index is not None:
+            self.signature_index.setdefault(make_signature(error_msg), group_index)
+        self.group_keys.append(error_msg)
+        self.groups.append(self.make_group(error))
+        return group_index
+
+    @staticmethod
+    def make_group(error) -> dict:
+        return {
+            "value": error,
+            "count": 0,
+            "workflow_info": {},
+            "messages": {},
+            "seqs": [],
+            "cluster_id": None,
+            "value_seq": None,
+            "key_seq": None,
+        }
+
+    @property
+    def errors(self) -> list:
+        """
+        The non-empty groups, as {"value": error, "count": int, "workflow_info": list,
+        "key": message the group is matched by, "cluster_id": ID of its known cluster or
+        None}, in the order of their first workflow.
+        """
+        groups = [
+            (index, group)
+            for index, group in enumerate(self.groups)
+            if group["count"] > 0
+        ]
+        if self.signature_index is not None or self.reordered:
+            # known clusters come first in self.groups, whether they are found or not,
+            # and groups moved by `remove` come after the groups made since
+            groups.sort(key=lambda item: min(item[1]["workflow_info"]))
+        return [
+            {
+                "value": group["value"],
+                "count": group["count"],
+                "workflow_info": [
+                    group["workflow_info"][seq]
+                    for seq in (
+                        sorted(group["workflow_info"])
+                        if self.reordered
+                        else group["workflow_info"]
+                    )
+                ],
+                "key": self.group_keys[index],
+                "cluster_id": group["cluster_id"],
+            }
+            for index, group in groups
+        ]
+
+    @property
+    def group_count(self) -> int:
+        """
+        The number of non-empty groups.
+        """
+        return sum(1 for group in self.groups if group["count"] > 0)
+
+    @property
+    def file_id_list(self) -> list:
+        if self.reordered:
+            return [self.file_ids[seq] for seq in sorted(self.file_ids)]
+        return list(self.file_ids.values())
+
+    def log_summary(self) -> None:
+        logger.info(
+            f"There are {self.no_error_found_workflow_count} {self.status} workflows with no {self.status_statement} found"
+        )
+
+
+def iter_batches(items: list) -> Iterator[list]:
+    """
+    Splits a list into batches of `PARALLEL_MIN_BATCH_SIZE` items, doubling in size up to
+    `PARALLEL_MAX_BATCH_SIZE`.
+    """
+    start = 0
+    batch_size = PARALLEL_MIN_BATCH_SIZE
+    while start < len(items):
+        yield items[start : start + batch_size]
+        start += batch_size
+        batch_size = min(batch_size * 2, PARALLEL_MAX_BATCH_SIZE)
+
+
+def aggregate_workflow_errors(
+    workflows: pd.DataFrame,
+    similarity_ratio: float = DEFAULT_SIMILARITY_RATIO,
+    fields: list = list(DEFAULT_EXTRACT_FIELDS.keys()),
+    status: str = "failed",
+    engine: str = DEFAULT_CLUSTERING_ENGINE,
+    message_field: str = None,
+    clusters: list = None,
+    workers: int = DEFAULT_WORKERS,
+    similarity: str = DEFAULT_SIMILARITY_BACKEND,
+) -> dict:
+    """
+    Groups the workflows of a workflow dataframe by their error message. See
+    `ErrorAggregator` for how messages are compared, by which `similarity` backend, for
+    the known `clusters`, and for the `workers` of the "parallel" engine.
+
+    Returns:
+        (list): groups, as {"value": error, "count": int, "workflow_info": list, "key",
+            "cluster_id"}
+        (list): file IDs of the workflows with an error
+    """
+    aggregator = ErrorAggregator(
+        similarity_ratio,
+        fields=fields,
+        status=status,
+        engine=engine,
+        message_field=message_field,
+        clusters=clusters,
+        workers=workers,
+        similarity=similarity,
+    )
+
+    logger.info(f"Aggregating workflows.")
+
+    workflow_count = 0
+
+    records = workflows.to_dict(orient="records")
+    try:
+        for batch in iter_batches(records):
+            aggregator.prefetch(map(aggregator.get_message, batch))
+            for workflow in batch:
+                workflow_count += 1
+                if workflow_count % 100 == 0:
+                    logger.info(
+                        f"Aggregating workflow {workflow_count} of {len(workflows.index)}"
+                    )
+                aggregator.add(workflow)
+    finally:
+        aggregator.close()
+
+    aggregator.log_summary()
+    return aggregator.errors, aggregator.file_id_list
+
+
+def make_partial_aggregate(
+    errors: list,
+    similarity_ratio: float = DEFAULT_SIMILARITY_RATIO,
+    status: str = "failed",
+    message_key: str = DEFAULT_MESSAGE_KEY,
+    pipeline_config: dict = None,
+) -> dict:
+    """
+    Returns the aggregated errors of a shard of workflows, e.g. of a time window or a
+    pipeline, as a JSON-serializable partial aggregate, which `merge_partial_aggregates`
+    combines with those of other shards:
+
+        {
+            "schema_version": 1,
+            "similarity_ratio": <float>,
+            "status": "<FILTER>",
+            "message_key": "<MESSAGE_KEY>",
+            "pipeline": {<pipeline configuration>},
+            "groups": [
                 {
-                    "value": error,
-                    "count": 1,
-                    "workflow_info": [workflow_summary],
-                }
+                    "key": "<message the group is matched by>",
+                    "signature": "<signature of the key>",
+                    "value": <extracted error of the first workflow of the group>,
+                    "count": <int>,
+                    "workflow_info": [[id, created at, last updated at, file ID], ...],
+                    "cluster_id": <int or null>
+                },
+                ...
+            ]
+        }
+    """
+    return {
+        "schema_version": PARTIAL_SCHEMA_VERSION,
+        "similarity_ratio": similarity_ratio,
+        "status": status,
+        "message_key": message_key,
+        "pipeline": pipeline_config,
+        "groups": [
+            {
+                "key": error["key"],
+                "signature": make_signature(error["key"]),
+                "value": error["value"],
+                "count": error["count"],
+                "workflow_info": error["workflow_info"],
+                "cluster_id": error.get("cluster_id"),
+            }
+            for error in errors
+        ],
+    }
+
+
+def merge_partial_aggregates(
+    partials: Iterable[dict],
+    similarity_ratio: float = DEFAULT_SIMILARITY_RATIO,
+    engine: str = DEFAULT_CLUSTERING_ENGINE,
+    workers: int = DEFAULT_WORKERS,
+    similarity: str = DEFAULT_SIMILARITY_BACKEND,
+) -> tuple:
+    """
+    Merges partial aggregates (see `make_partial_aggregate`) of different shards of
+    workflows into one aggregate. Groups are matched by their keys like single messages
+    in `ErrorAggregator`, in the order of the partials, and a workflow that is in several
+    partials is only counted once.
+
+    With a `similarity_ratio` of 1, merging the partials of consecutive shards gives the
+    same groups as aggregating all their workflows at once. With a lower ratio, a shard's
+    group is matched by its key only, so it may join a group that some of its workflows
+    would not have joined one by one, and there may be fewer groups than in a single run.
+
+    Returns:
+        (list): groups, like `aggregate_workflow_errors`
+        (list): file IDs of the workflows with an error
+    """
+    aggregator = ErrorAggregator(
+        similarity_ratio, engine=engine, workers=workers, similarity=similarity
+    )
+    try:
+        for partial in partials:
+            if partial.get("schema_version") != PARTIAL_SCHEMA_VERSION:
+                raise ValueError(
+                    f"Unsupported partial aggregate schema version {partial.get('schema_version')}."
+                )
+            aggregator.prefetch(group["key"] for group in partial["groups"])
+            for group in partial["groups"]:
+                aggregator.add_group(
+                    group["key"],
+                    group["value"],
+                    group["workflow_info"],
+                    cluster_id=group.get("cluster_id"),
+                )
+    finally:
+        aggregator.close()
+    return aggregator.errors, aggregator.file_id_list
+
+
+def stream_aggregate_workflow_errors(
+    workflow_pages: Iterable[list],
+    pipeline_parameters: GetSourceFilesParameters,
+    similarity_ratio: float = DEFAULT_SIMILARITY_RATIO,
+    fields: list = list(DEFAULT_EXTRACT_FIELDS.keys()),
+    status: str = "failed",
+    engine: str = DEFAULT_CLUSTERING_ENGINE,
+    clusters: list = None,
+    workers: int = DEFAULT_WORKERS,
+    similarity: str = DEFAULT_SIMILARITY_BACKEND,
+    **extract_fields: str,
+) -> Iterator[ErrorAggregator]:
+    """
+    Filters, extracts and aggregates pages of raw workflow results as they arrive.
+
+    Each workflow goes through latest-workflow filtering, field extraction and grouping
+    one at a time, and only its extracted fields are kept, so no full list of workflows
+    is held in memory. If a workflow is superseded by a later workflow for the same input
+    file, it is removed from its group again and the later workflow takes its place (see
+    `ErrorAggregator.remove`), so the report is the same as with `filter_latest_workflow`
+    and `aggregate_workflow_errors`. Only workflows that were matched against a group
+    while a superseded workflow was still its first may be grouped differently, and a
+    group keeps the error of a superseded first workflow whose replacement joins another
+    group.
+
+    The aggregator is yielded after each page, so partial results (`aggregator.errors`)
+    are available before all pages have been fetched. With the "parallel" engine, the
+    workflows of each page are compared with the existing groups as one batch.
+    """
+    latest_filter = LatestWorkflowFilter(pipeline_parameters)
+    aggregator = ErrorAggregator(
+        similarity_ratio,
+        fields=fields,
+        status=status,
+        engine=engine,
+        clusters=clusters,
+        workers=workers,
+        similarity=similarity,
+    )
+
+    extract = make_field_extractor(**extract_fields)
+
+    logger.info(f"Aggregating workflows as they are fetched.")
+
+    workflow_count = 0
+    try:
+        for page in workflow_pages:
+            latest = []  # (superseded workflow ID or None, extracted workflow)
+            for workflow in page:
+                workflow_count += 1
+                is_latest, superseded_id = latest_filter.add(workflow)
+                if is_latest:
+                    latest.append((superseded_id, extract(workflow)))
+            aggregator.prefetch(
+                aggregator.get_message(workflow) for _, workflow in latest
             )
-            logger.debug(
-                f"No same {status_statement} found. Added {error} to {status_statement} list as a new {status_statement}"
+            for superseded_id, workflow in latest:
+                seq = None
+                if superseded_id is not None:
+                    seq = aggregator.remove(superseded_id)
+                aggregator.add(workflow, seq=seq)
+            logger.info(
+                f"{workflow_count} workflows aggregated into {aggregator.group_count} groups so far."
             )
+            yield aggregator
+    finally:
+        aggregator.close()
 
     logger.info(
-        f"There are {no_error_found_workflow_count} {status} workflows with no {status_statement} found"
+        f"{latest_filter.protocol_workflow_count} workflows found with protocol version {latest_filter.protocol_version}; {latest_filter.duplicates} duplicates found."
+        if latest_filter.check_protocol
+        else f"{latest_filter.duplicates} duplicates found."
     )
-    return errors, file_id_list
+    aggregator.log_summary()
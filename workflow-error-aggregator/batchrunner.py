@@ -0,0 +1,221 @@
+import copy
+import html
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+from loguru import logger
+
+from aggregate_workflow_errors import DEFAULT_SIMILARITY_RATIO, find_similar_group
+from defaultparams import GetSourceFilesParameters
+from fetchengine import make_session
+from htmlwriter import get_group_message, make_html_text
+from runmetrics import metrics
+from similarity import DEFAULT_SIMILARITY_BACKEND
+from workflowcache import WorkflowCache
+
+ROLLUP_OUTPUT_NAME = "rollup"  # file name of the cross-pipeline rollup outputs
+
+
+def read_batch_config(path: str) -> List[dict]:
+    """
+    Reads the pipelines of a batch from a config file, which is either:
+
+    - a text file with one pipeline ID per line; empty lines and lines starting with
+      "#" are ignored, or
+    - a JSON file (ending in ".json") with a list of pipelines, or an object with the
+      list under "pipelines". Each pipeline is a pipeline ID, or an object with a
+      "pipeline_id" and parameters that override the command line parameters for that
+      pipeline, named like their command line destinations, e.g. "limit" or "filter".
+
+    Returns:
+        (list): one dict per pipeline, with at least a "pipeline_id"
+    """
+    with open(path, "rt") as fin:
+        if not path.lower().endswith(".json"):
+            return [
+                {"pipeline_id": line.strip()}
+                for line in fin
+                if line.strip() and not line.strip().startswith("#")
+            ]
+        config = json.load(fin)
+    if isinstance(config, dict):
+        config = config.get("pipelines", [])
+    pipelines = []
+    for pipeline in config:
+        if isinstance(pipeline, str):
+            pipeline = {"pipeline_id": pipeline}
+        if not pipeline.get("pipeline_id"):
+            raise ValueError(f"Pipeline without a pipeline_id in {path}: {pipeline}")
+        pipelines.append(pipeline)
+    return pipelines
+
+
+def get_batch_pipelines(params: GetSourceFilesParameters) -> List[dict]:
+    """
+    Returns the pipelines to aggregate: those of the batch config file if one is set,
+    otherwise the comma-separated pipeline IDs of `params.pipeline_id`.
+    """
+    if params.batch_config:
+        return read_batch_config(params.batch_config)
+    return [
+        {"pipeline_id": pipeline_id.strip()}
+        for pipeline_id in params.pipeline_id.split(",")
+        if pipeline_id.strip()
+    ]
+
+
+def make_pipeline_params(
+    params: GetSourceFilesParameters, pipeline: dict
+) -> GetSourceFilesParameters:
+    """
+    Returns a copy of the parameters for a single pipeline of a batch, with the pipeline's
+    overrides applied. Its outputs are saved to a folder named after the pipeline ID.
+    """
+    pipeline_params = copy.copy(params)
+    for key, value in pipeline.items():
+        if not hasattr(params, key):
+            raise ValueError(
+                f"Unknown parameter {key} for pipeline {pipeline['pipeline_id']}."
+            )
+        setattr(pipeline_params, key, value)
+    pipeline_params.save_dir = os.path.join(params.save_dir, pipeline["pipeline_id"])
+    os.makedirs(pipeline_params.save_dir, exist_ok=True)
+    return pipeline_params
+
+
+def run_batch(
+    params: GetSourceFilesParameters,
+    pipelines: List[dict],
+    aggregate_pipeline: Callable,
+) -> dict:
+    """
+    Aggregates the errors of several pipelines in one process, then writes a rollup of
+    the error groups they have in common.
+
+    Up to `params.concurrency` pipelines are processed at once. They share one HTTP
+    session, which allows at most `params.concurrency` requests in flight across all
+    pipelines, and one workflow cache if `params.cache_path` is set.
+
+    Args:
+        params (GetSourceFilesParameters): parameters shared by all pipelines
+        pipelines (list): pipelines, as returned by `get_batch_pipelines`
+        aggregate_pipeline (Callable): called as aggregate_pipeline(params, session=...,
+            cache=...) for each pipeline; returns its aggregated errors or None
+
+    Returns:
+        (dict): { pipeline ID: aggregated errors }, for the pipelines that have errors
+    """
+    logger.info(f"Aggregating {len(pipelines)} pipelines.")
+    session = make_session(params.concurrency)
+    cache = WorkflowCache(params.cache_path) if params.cache_path else None
+
+    def run_pipeline(pipeline: dict):
+        pipeline_id = pipeline["pipeline_id"]
+        logger.info(f"Starting pipeline {pipeline_id}.")
+        with metrics.stage(f"pipeline {pipeline_id}"):
+            return aggregate_pipeline(
+                make_pipeline_params(params, pipeline), session=session, cache=cache
+            )
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(params.concurrency, 1)) as executor:
+        futures = {
+            pipeline["pipeline_id"]: executor.submit(run_pipeline, pipeline)
+            for pipeline in pipelines
+        }
+        for pipeline_id, future in futures.items():
+            try:
+                errors = future.result()
+            except Exception:
+                logger.exception(f"Pipeline {pipeline_id} failed. Continuing...")
+                continue
+            if errors:
+                results[pipeline_id] = errors
+            logger.info(
+                f"Pipeline {pipeline_id} done: {len(errors or [])} groups of errors."
+            )
+
+    rollup = make_rollup(results, params.similarity_ratio, params.similarity_backend)
+    write_rollup(rollup, params)
+    return results
+
+
+def make_rollup(
+    results: dict,
+    similarity_ratio: float = DEFAULT_SIMILARITY_RATIO,
+    similarity: str = DEFAULT_SIMILARITY_BACKEND,
+) -> list:
+    """
+    Groups the error groups of several pipelines by their message, with the same
+    `similarity_ratio` and `similarity` backend as within a pipeline, so that errors
+    common to several pipelines end up in one rollup group.
+
+    Returns:
+        (list): rollup groups as {"message": str, "count": int, "pipelines": {pipeline
+            ID: count}}, sorted by the number of pipelines, then by count
+    """
+    rollup = []
+    rollup_keys = []
+    exact_match_index = {}  # { message: index into rollup }
+    for pipeline_id, errors in results.items():
+        for error in errors:
+            message = get_group_message(error)
+            index = exact_match_index.get(message)
+            if index is None and similarity_ratio != DEFAULT_SIMILARITY_RATIO:
+                index = find_similar_group(
+                    message, rollup_keys, similarity_ratio, backend=similarity
+                )
+            if index is None:
+                index = len(rollup)
+                exact_match_index[message] = index
+                rollup_keys.append(message)
+                rollup.append({"message": message, "count": 0, "pipelines": {}})
+            group = rollup[index]
+            group["count"] += error["count"]
+            group["pipelines"][pipeline_id] = (
+                group["pipelines"].get(pipeline_id, 0) + error["count"]
+            )
+    rollup.sort(
+        key=lambda group: (len(group["pipelines"]), group["count"]), reverse=True
+    )
+    return rollup
+
+
+def write_rollup(rollup: list, params: GetSourceFilesParameters) -> None:
+    """
+    Writes the cross-pipeline rollup as JSON and as an html table to the save directory.
+    """
+    json_path = os.path.join(params.save_dir, f"{ROLLUP_OUTPUT_NAME}.json")
+    with open(json_path, "wt") as fout:
+        json.dump(rollup, fout, indent=2)
+
+    html_path = os.path.join(params.save_dir, f"{ROLLUP_OUTPUT_NAME}.html")
+    with open(html_path, "wt") as fout:
+        fout.write("<h1>Workflow Error Aggregator: Cross-Pipeline Rollup</h1>\n")
+        fout.write(
+            f"<p>Workflow Status: {html.escape(params.filter)}<br>\n"
+            f"Similarity Ratio: {params.similarity_ratio}</p>\n"
+        )
+        fout.write('<table border="1" class="dataframe">\n  <thead>\n')
+        fout.write('    <tr style="text-align: left;">\n')
+        fout.write('      <th style="min-width: 512px;">Message</th>\n')
+        fout.write('      <th style="min-width: 32px;">Count</th>\n')
+        fout.write('      <th style="min-width: 320px;">Pipelines (ID: count)</th>\n')
+        fout.write("    </tr>\n  </thead>\n  <tbody>\n")
+        for group in rollup:
+            pipelines = "<br>".join(
+                f"{html.escape(pipeline_id)}: {count}"
+                for pipeline_id, count in group["pipelines"].items()
+            )
+            fout.write('    <tr style="text-align: left; vertical-align: top;">\n')
+            fout.write(f"      <td>{make_html_text(group['message'])}</td>\n")
+            fout.write(f"      <td>{group['count']}</td>\n")
+            fout.write(f"      <td>{pipelines}</td>\n    </tr>\n")
+        fout.write("  </tbody>\n</table>\n")
+
+    shared = sum(1 for group in rollup if len(group["pipelines"]) > 1)
+    logger.info(
+        f"{len(rollup)} error groups across pipelines, {shared} of them in more than one pipeline. Rollup is saved to {json_path} and {html_path}"
+    )
@@ -0,0 +1,114 @@
+"""
+Benchmarks `filter_latest_workflow` on a heavily reprocessed pipeline, i.e. one where
+each input file has been processed many times, and checks that the latest workflows it
+selects match a reference implementation that parses every timestamp with dateutil.
+
+Run from the workflow-error-aggregator folder:
+
+    python benchmarks/benchmark_filter_latest_workflow.py --workflows 100000 --files 2000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dateutil import parser
+from loguru import logger
+
+from defaultparams import GetSourceFilesParameters
+from filter_latest_workflow import filter_latest_workflow
+
+START = datetime(2022, 11, 1, tzinfo=timezone.utc)
+
+
+def make_workflows(workflow_count: int, file_count: int, seed: int = 0) -> list:
+    """
+    Returns workflows spread over `file_count` input files, newest first like the TDP
+    search API. Some workflows share timestamps, and some use a "+00:00" offset instead of
+    "Z", so both tie-breaking and the slow timestamp path are exercised.
+    """
+    rnd = random.Random(seed)
+    workflows = []
+    for index in range(workflow_count):
+        created_at = START + timedelta(seconds=rnd.randrange(30 * 24 * 3600))
+        last_updated_at = created_at + timedelta(seconds=rnd.randrange(600))
+        timestamps = [
+            moment.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+            + ("+00:00" if index % 50 == 0 else "Z")
+            for moment in (created_at, last_updated_at)
+        ]
+        workflows.append(
+            {
+                "id": f"workflow-{index}",
+                "createdAt": timestamps[0],
+                "lastUpdatedAt": timestamps[1],
+                "protocolVersion": "v1.0.0" if index % 10 else "v0.9.0",
+                "inputFile": {"fileKey": f"raw/file-{rnd.randrange(file_count)}.csv"},
+            }
+        )
+    workflows.sort(key=lambda workflow: workflow["createdAt"][:19], reverse=True)
+    return workflows
+
+
+def reference_filter_latest_workflow(
+    workflows: list, pipeline_parameters: GetSourceFilesParameters
+) -> list:
+    """
+    Latest-workflow selection with every timestamp parsed by dateutil.
+    """
+    latest = {}  # { "input_file_key": workflow }
+    for workflow in workflows:
+        if workflow.get("protocolVersion") != pipeline_parameters.protocol_version:
+            continue
+        input_file_key = workflow["inputFile"]["fileKey"]
+        existing = latest.get(input_file_key)
+        if existing is None or parser.parse(workflow["createdAt"]) > parser.parse(
+            existing["lastUpdatedAt"]
+        ):
+            latest[input_file_key] = workflow
+    return list(latest.values())
+
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    arg_parser.add_argument("--workflows", type=int, default=100000)
+    arg_parser.add_argument("--files", type=int, default=2000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    logger.remove()  # keep the filter's own logging out of the timings
+    workflows = make_workflows(args.workflows, args.files, args.seed)
+    params = SimpleNamespace(
+        platform_version="v3.3", protocol_version="v1.0.0", filter="failed"
+    )
+
+    reference, reference_time = time_call(
+        reference_filter_latest_workflow, workflows, params
+    )
+    result, result_time = time_call(filter_latest_workflow, workflows, params)
+
+    matches = [workflow["id"] for workflow in result] == [
+        workflow["id"] for workflow in reference
+    ]
+    print(f"{len(workflows)} workflows over {args.files} input files")
+    print(f"dateutil reference:     {reference_time:8.3f} s")
+    print(f"filter_latest_workflow: {result_time:8.3f} s")
+    print(f"speedup: {reference_time / result_time:.1f}x, results match: {matches}")
+    if not matches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Benchmarks each stage of the WEA against a local mock TDP API serving synthetic workflows:
+fetch, filter_latest_workflow, workflow_result_to_dataframe, aggregate_workflow_errors and
+make_html_output.
+
+Each stage is timed (wall and CPU time) in one run. With --memory, the stages are run
+again under tracemalloc to record the peak memory allocated by each stage; this is a
+separate run because tracemalloc slows Python code down considerably.
+
+Run from the workflow-error-aggregator folder, e.g.:
+
+    python benchmarks/benchmark_pipeline.py --workflows 20000 --latency 0.05 --memory
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+
+from aggregate_workflow_errors import (
+    CLUSTERING_ENGINES,
+    aggregate_workflow_errors,
+    workflow_result_to_dataframe,
+)
+from defaultparams import WorkflowErrorAggregatorParameters
+from filter_latest_workflow import filter_latest_workflow
+from htmlwriter import make_html_output
+from similarity import SIMILARITY_BACKENDS
+from weaargparser import WeaArgParser
+from workflow_error_aggregator import get_pipeline_info
+
+from mocktdp import MockTDPServer
+from synthetic import make_pipeline_config, make_workflows
+
+STAGES = ["fetch", "filter", "dataframe", "aggregate", "html"]
+
+
+def make_params(args, url: str, save_dir: str):
+    """
+    Returns WEA parameters for a run against the mock API, parsed like command line
+    arguments so all defaults apply.
+    """
+    command_line_parser = WeaArgParser()
+    command_line_parser.parser_setup(WorkflowErrorAggregatorParameters())
+    return command_line_parser.parser.parse_args(
+        [
+            "--url",
+            url,
+            "--pipeline-id",
+            "benchmark-pipeline",
+            "--limit",
+            str(args.workflows),
+            "--sim-ratio",
+            str(args.similarity_ratio),
+            "--engine",
+            args.engine,
+            "--workers",
+            str(args.workers),
+            "--similarity",
+            args.similarity,
+            "--concurrency",
+            str(args.concurrency),
+            "--time-windows",
+            str(args.time_windows),
+            "--version",
+            args.platform_version,
+            "--save-dir",
+            save_dir,
+            "--html-output",
+            "benchmark",
+            "--log-root",
+            save_dir,
+        ]
+    )
+
+
+def run_stages(params, measure_memory: bool = False) -> dict:
+    """
+    Runs the WEA stages one after another.
+
+    Returns:
+        (dict): { stage: {"wall_time": s, "cpu_time": s, ["peak_memory": bytes]} }
+    """
+    state = {}
+
+    def fetch():
+        state["workflows"], state["pipeline_config"] = get_pipeline_info(params)
+
+    def filter_stage():
+        state["latest"] = filter_latest_workflow(state["workflows"], params)
+
+    def dataframe():
+        state["workflow_df"] = workflow_result_to_dataframe(state["latest"])
+
+    def aggregate():
+        state["errors"], _ = aggregate_workflow_errors(
+            state["workflow_df"],
+            params.similarity_ratio,
+            status=params.filter,
+            engine=params.clustering_engine,
+            workers=params.workers,
+            similarity=params.similarity_backend,
+        )
+
+    def html():
+        make_html_output(state["errors"], params, state["pipeline_config"])
+
+    stage_functions = dict(
+        zip(STAGES, [fetch, filter_stage, dataframe, aggregate, html])
+    )
+    results = {}
+    for stage, function in stage_functions.items():
+        if measure_memory:
+            tracemalloc.start()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        function()
+        results[stage] = {
+            "wall_time": time.perf_counter() - wall_start,
+            "cpu_time": time.process_time() - cpu_start,
+        }
+        if measure_memory:
+            results[stage]["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    results["counts"] = {
+        "workflows": len(state["workflows"]),
+        "latest_workflows": len(state["latest"]),
+        "groups": len(state["errors"]),
+    }
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    workload = arg_parser.add_argument_group("synthetic workload")
+    workload.add_argument("--workflows", type=int, default=10000)
+    workload.add_argument("--duplicate-rate", type=float, default=0.2)
+    workload.add_argument("--templates", type=int, default=50)
+    workload.add_argument("--message-length", type=int, default=200)
+    workload.add_argument("--log-ratio", type=float, default=0.2)
+    workload.add_argument("--seed", type=int, default=0)
+    api = arg_parser.add_argument_group("mock API")
+    api.add_argument("--latency", type=float, default=0.0)
+    api.add_argument("--jitter", type=float, default=0.0)
+    api.add_argument("--failure-rate", type=float, default=0.0)
+    api.add_argument("--platform-version", default="v3.6.1")
+    wea = arg_parser.add_argument_group("WEA settings")
+    wea.add_argument("--similarity-ratio", type=float, default=1.0)
+    wea.add_argument("--engine", choices=CLUSTERING_ENGINES, default="exhaustive")
+    wea.add_argument("--workers", type=int, default=0)
+    wea.add_argument(
+        "--similarity", choices=list(SIMILARITY_BACKENDS), default="sequence"
+    )
+    wea.add_argument("--concurrency", type=int, default=4)
+    wea.add_argument("--time-windows", type=int, default=0)
+    arg_parser.add_argument(
+        "--memory", action="store_true", help="also measure peak memory per stage"
+    )
+    arg_parser.add_argument("--output", help="path of a JSON file for the results")
+    args = arg_parser.parse_args()
+
+    logger.remove()  # keep the WEA's own logging out of the timings
+    workflows = make_workflows(
+        args.workflows,
+        duplicate_rate=args.duplicate_rate,
+        template_count=args.templates,
+        message_length=args.message_length,
+        log_ratio=args.log_ratio,
+        seed=args.seed,
+    )
+    with MockTDPServer(
+        workflows,
+        make_pipeline_config(),
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+    ) as server, tempfile.TemporaryDirectory() as save_dir:
+        params = make_params(args, server.url, save_dir)
+        results = run_stages(params)
+        if args.memory:
+            memory = run_stages(params, measure_memory=True)
+            for stage in STAGES:
+                results[stage]["peak_memory"] = memory[stage]["peak_memory"]
+        results["api"] = {
+            "requests": server.request_count,
+            "injected_failures": server.failure_count,
+            "bytes_sent": server.bytes_sent,
+        }
+    results["settings"] = vars(args)
+
+    print(
+        f"{results['counts']['workflows']} workflows fetched, "
+        f"{results['counts']['latest_workflows']} latest, "
+        f"{results['counts']['groups']} groups"
+    )
+    print(f"{'stage':<10} {'wall (s)':>10} {'cpu (s)':>10} {'peak (MiB)':>11}")
+    for stage in STAGES:
+        peak = results[stage].get("peak_memory")
+        peak = f"{peak / 2 ** 20:11.1f}" if peak is not None else f"{'-':>11}"
+        print(
+            f"{stage:<10} {results[stage]['wall_time']:10.3f} {results[stage]['cpu_time']:10.3f} {peak}"
+        )
+    print(
+        f"{results['api']['requests']} API requests, {results['api']['injected_failures']} injected failures"
+    )
+    if args.output:
+        with open(args.output, "wt") as fout:
+            json.dump(results, fout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
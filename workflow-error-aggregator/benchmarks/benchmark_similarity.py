@@ -0,0 +1,150 @@
+"""
+Benchmarks the similarity backends of `aggregate_workflow_errors` on synthetic workflows.
+
+For each similarity ratio and backend, the workflows are aggregated once, and the time,
+the number of comparisons and the number of groups are reported. Grouping accuracy is
+measured on pairs of workflows against the message templates the workflows were
+generated from: precision is the share of pairs grouped together that share a template,
+and recall the share of pairs sharing a template that are grouped together. Agreement is
+the share of workflows whose group is the same as with the "sequence" backend.
+
+Run from the workflow-error-aggregator folder, e.g.:
+
+    python benchmarks/benchmark_similarity.py --workflows 2000 --ratios 0.8 0.5
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+
+from aggregate_workflow_errors import (
+    aggregate_workflow_errors,
+    workflow_result_to_dataframe,
+)
+from runmetrics import metrics
+from similarity import SIMILARITY_BACKENDS
+
+from synthetic import make_workflows
+
+TEMPLATE_PATTERN = re.compile(r"Error(\d+):")
+
+
+def get_template_labels(workflows: list) -> dict:
+    """
+    Returns { workflow ID: index of the template its message was generated from }.
+    """
+    return {
+        workflow["id"]: TEMPLATE_PATTERN.search(json.dumps(workflow["tasks"])).group(1)
+        for workflow in workflows
+    }
+
+
+def get_group_labels(errors: list) -> dict:
+    """
+    Returns { workflow ID: index of its group }.
+    """
+    return {
+        workflow_summary[0]: index
+        for index, error in enumerate(errors)
+        for workflow_summary in error["workflow_info"]
+    }
+
+
+def count_pairs(counts) -> int:
+    return sum(count * (count - 1) // 2 for count in counts)
+
+
+def pair_scores(labels: dict, reference: dict) -> tuple:
+    """
+    Returns the pairwise precision and recall of `labels` against `reference`.
+    """
+    together = count_pairs(Counter(labels.values()).values())
+    reference_together = count_pairs(Counter(reference.values()).values())
+    both = count_pairs(
+        Counter((labels[key], reference[key]) for key in labels).values()
+    )
+    return both / together if together else 1.0, (
+        both / reference_together if reference_together else 1.0
+    )
+
+
+def agreement(labels: dict, reference: dict) -> float:
+    """
+    Returns the share of workflows whose group has the same workflows in both labelings.
+    """
+    members, reference_members = {}, {}
+    for key in labels:
+        members.setdefault(labels[key], set()).add(key)
+        reference_members.setdefault(reference[key], set()).add(key)
+    same = sum(
+        1 for key in labels if members[labels[key]] == reference_members[reference[key]]
+    )
+    return same / len(labels) if labels else 1.0
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    arg_parser.add_argument("--workflows", type=int, default=2000)
+    arg_parser.add_argument("--templates", type=int, default=50)
+    arg_parser.add_argument("--message-length", type=int, default=200)
+    arg_parser.add_argument("--ratios", type=float, nargs="+", default=[0.8, 0.5])
+    arg_parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=list(SIMILARITY_BACKENDS),
+        default=list(SIMILARITY_BACKENDS),
+    )
+    arg_parser.add_argument("--engine", default="exhaustive")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    logger.remove()  # keep the WEA's own logging out of the timings
+    workflows = make_workflows(
+        args.workflows,
+        duplicate_rate=0,
+        template_count=args.templates,
+        # errors that are only in the task log are all compared as the message "None"
+        log_ratio=0,
+        message_length=args.message_length,
+        seed=args.seed,
+    )
+    templates = get_template_labels(workflows)
+    workflow_df = workflow_result_to_dataframe(workflows)
+
+    print(
+        f"{len(workflows)} workflows from {args.templates} templates, engine {args.engine}"
+    )
+    print(
+        f"{'ratio':>5} {'backend':>12} {'time (s)':>9} {'comparisons':>12} {'groups':>7}"
+        f" {'precision':>9} {'recall':>7} {'agreement':>9}"
+    )
+    for ratio in args.ratios:
+        reference = None
+        for backend in args.backends:
+            comparisons = metrics.comparisons
+            start = time.perf_counter()
+            errors, _ = aggregate_workflow_errors(
+                workflow_df, ratio, engine=args.engine, similarity=backend
+            )
+            elapsed = time.perf_counter() - start
+            comparisons = metrics.comparisons - comparisons
+            labels = get_group_labels(errors)
+            if backend == "sequence" or reference is None:
+                reference = labels
+            precision, recall = pair_scores(labels, templates)
+            print(
+                f"{ratio:>5} {backend:>12} {elapsed:>9.2f} {comparisons:>12} {len(errors):>7}"
+                f" {precision:>9.3f} {recall:>7.3f} {agreement(labels, reference):>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Local mock of the TDP APIs used by the WEA, for benchmarks.
+
+Serves "pipeline/{id}", "workflow/search" (v3.2 and later) and "workflow/workflows"
+(v3.1) from a list of workflows, with configurable latency and failure injection.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockTDPServer:
+    """
+    Mock TDP API server running in a background thread. Use as a context manager:
+
+    >>> with MockTDPServer(workflows, pipeline_config, latency=0.05) as server:
+    ...     url = server.url  # e.g. "http://127.0.0.1:54321/v1/"
+
+    Args:
+        workflows (list): workflows to serve, newest first
+        pipeline_config (dict): response of "pipeline/{id}"
+        latency (float): seconds each response is delayed by
+        jitter (float): up to this many seconds are randomly added to the latency
+        failure_rate (float): fraction of requests that fail with a 500 error
+        seed (int): random seed for the jitter and failures
+    """
+
+    def __init__(
+        self,
+        workflows: list,
+        pipeline_config: dict,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.workflows = workflows
+        self.pipeline_config = pipeline_config
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.failure_count = 0
+        self.bytes_sent = 0
+        self.searches = {}  # { (status, start time, end time): matching workflows }
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    def __enter__(self) -> "MockTDPServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, body = mock.respond(self.path)
+                data = json.dumps(body).encode()
+                with mock.lock:
+                    mock.bytes_sent += len(data)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def respond(self, path: str):
+        """
+        Returns the status code and JSON body of the response to a request path.
+        """
+        with self.lock:
+            self.request_count += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.failure_rate
+            if failed:
+                self.failure_count += 1
+        time.sleep(delay)
+        if failed:
+            return 500, {
+                "statusCode": 500,
+                "error": "Internal Server Error",
+                "message": "Injected failure",
+            }
+
+        url = urlparse(path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        endpoint = url.path.split("/v1/", 1)[-1]
+        if endpoint.startswith("pipeline/"):
+            return 200, self.pipeline_config
+        if endpoint == "workflow/search":
+            workflows = self.search(query)
+            page, size = int(query.get("from", 0)), int(query.get("size", 100))
+            return 200, {
+                "hits": workflows[page * size : (page + 1) * size],
+                "total": len(workflows),
+            }
+        if endpoint == "workflow/workflows":
+            workflows = self.search(query)
+            page, size = int(query.get("page", 0)), int(query.get("limit", 100))
+            return 200, workflows[page * size : (page + 1) * size]
+        return 404, {"statusCode": 404, "error": "Not Found", "message": path}
+
+    def search(self, query: dict) -> list:
+        """
+        Returns the workflows matching the search parameters of a request, newest first.
+        "startTime" is inclusive and "endTime" exclusive; both are compared with
+        "createdAt" as strings.
+        """
+        status = query.get("filter")
+        start_time = query.get("startTime")
+        end_time = query.get("endTime")
+        key = (status, start_time, end_time)
+        with self.lock:
+            if key not in self.searches:
+                self.searches[key] = [
+                    workflow
+                    for workflow in self.workflows
+                    if (not status or workflow.get("status") == status)
+                    and (not start_time or workflow["createdAt"] >= start_time)
+                    and (not end_time or workflow["createdAt"] < end_time)
+                ]
+            return self.searches[key]
@@ -0,0 +1,138 @@
+"""
+Synthetic workflow generator for benchmarking the WEA.
+
+Workflows look like the results of the TDP "workflow/search" API, with only the fields
+the WEA reads. Their error messages are built from a number of templates, each with
+variable parts (UUIDs, file paths, numbers) so that no two messages are identical.
+"""
+
+import json
+import math
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+START = datetime(2022, 11, 1, tzinfo=timezone.utc)
+WORDS = (
+    "failed to parse value in column row header unit sample plate instrument "
+    "result file because the expected field was missing or invalid for schema"
+).split()
+PROTOCOL_VERSION = "v1.0.0"
+
+
+def make_templates(template_count: int, rnd: random.Random) -> list:
+    """
+    Returns message templates: lists of fixed words and "{uuid}", "{path}" and "{number}"
+    placeholders.
+    """
+    templates = []
+    for index in range(template_count):
+        words = [f"Error{index}:"] + rnd.sample(WORDS, 6)
+        for placeholder in ("{path}", "{number}", "{uuid}"):
+            words.insert(rnd.randrange(1, len(words) + 1), placeholder)
+        templates.append(words)
+    return templates
+
+
+def make_message(template: list, length: int, rnd: random.Random) -> str:
+    """
+    Fills in the placeholders of a template and pads the message with words from the
+    template up to about `length` characters.
+    """
+    values = {
+        "{uuid}": lambda: str(uuid.UUID(int=rnd.getrandbits(128))),
+        "{path}": lambda: f"/data/{rnd.randrange(10 ** 6)}/sample_{rnd.randrange(1000)}.csv",
+        "{number}": lambda: str(rnd.randrange(10**4)),
+    }
+    words = [values[word]() if word in values else word for word in template]
+    message = " ".join(words)
+    fixed_words = [word for word in template[1:] if word not in values]
+    while len(message) < length:
+        message += " " + fixed_words[len(message) % len(fixed_words)]
+    return message
+
+
+def make_workflows(
+    workflow_count: int = 10000,
+    duplicate_rate: float = 0.2,
+    template_count: int = 50,
+    message_length: int = 200,
+    log_ratio: float = 0.2,
+    status: str = "failed",
+    seed: int = 0,
+) -> list:
+    """
+    Generates synthetic workflows, newest first like the TDP search API.
+
+    Args:
+        workflow_count (int): number of workflows
+        duplicate_rate (float): fraction of workflows that reprocess the input file of an
+            earlier workflow
+        template_count (int): number of distinct message templates
+        message_length (int): median message length in characters; lengths follow a
+            log-normal distribution around it
+        log_ratio (float): fraction of workflows whose error is only in the task log
+            rather than in the task output
+        status (str): status of the workflows
+        seed (int): random seed
+
+    Returns:
+        (list): workflows
+    """
+    rnd = random.Random(seed)
+    templates = make_templates(max(template_count, 1), rnd)
+    file_keys = []
+    workflows = []
+    for index in range(workflow_count):
+        if file_keys and rnd.random() < duplicate_rate:
+            file_key, file_id = rnd.choice(file_keys)
+        else:
+            file_key = f"raw/instrument/file-{index}.csv"
+            file_id = str(uuid.UUID(int=rnd.getrandbits(128)))
+            file_keys.append((file_key, file_id))
+
+        length = int(message_length * math.exp(rnd.gauss(0, 0.5)))
+        message = make_message(rnd.choice(templates), length, rnd)
+        if rnd.random() < log_ratio:
+            output = {}
+            log = "\n".join(
+                [
+                    json.dumps({"level": "info", "message": "Task started"}),
+                    json.dumps({"level": "error", "message": message}),
+                ]
+            )
+        else:
+            output = {"result": {"message": message}}
+            log = json.dumps({"level": "info", "message": "Task started"})
+
+        created_at = START + timedelta(seconds=rnd.randrange(30 * 24 * 3600))
+        last_updated_at = created_at + timedelta(seconds=rnd.randrange(600))
+        workflows.append(
+            {
+                "id": str(uuid.UUID(int=rnd.getrandbits(128))),
+                "status": status,
+                "createdAt": created_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "lastUpdatedAt": last_updated_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "protocolVersion": PROTOCOL_VERSION,
+                "inputFile": {"fileKey": file_key, "fileId": file_id},
+                "tasks": [{"output": output, "log": log}],
+                "masterScriptLogs": [],
+            }
+        )
+    workflows.sort(key=lambda workflow: workflow["createdAt"], reverse=True)
+    return workflows
+
+
+def make_pipeline_config(pipeline_id: str = "benchmark-pipeline") -> dict:
+    return {
+        "id": pipeline_id,
+        "name": "Benchmark pipeline",
+        "description": "Synthetic pipeline for benchmarks",
+        "protocolSlug": "benchmark",
+        "protocolVersion": PROTOCOL_VERSION,
+        "createdAt": START.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "updatedAt": START.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "masterScriptSlug": "benchmark",
+        "masterScriptVersion": "v1.0.0",
+        "pipelineConfig": {},
+    }
@@ -0,0 +1,114 @@
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from hashlib import sha1
+
+from loguru import logger
+
+from templateminer import mask_message
+
+
+def make_signature(message: str) -> str:
+    """
+    Returns the signature of a message: a hash of the message with its variable tokens
+    (UUIDs, timestamps, file keys and paths, hex values and numbers) masked, so messages
+    that only differ in these values have the same signature.
+    """
+    masked, _ = mask_message(message)
+    return sha1(masked.encode("utf-8")).hexdigest()[:12]
+
+
+class ClusterStore:
+    """
+    On-disk SQLite store of the error clusters of each pipeline, which gives clusters
+    stable IDs across runs. The store may be shared by threads, like `WorkflowCache`.
+
+    Each cluster has an integer ID that is unique within its pipeline and never reused, a
+    representative message (the message it was first matched by), the signature of that
+    message, the number of workflows in it in the latest run that found it, and the times
+    of the first and latest runs that found it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS clusters (
+                    pipeline_id TEXT NOT NULL,
+                    cluster_id INTEGER NOT NULL,
+                    signature TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    first_seen TEXT NOT NULL,
+                    last_seen TEXT NOT NULL,
+                    PRIMARY KEY (pipeline_id, cluster_id)
+                )
+                """
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def get_clusters(self, pipeline_id: str) -> list:
+        """
+        Returns the clusters of a pipeline as {"cluster_id", "message", "signature"},
+        most recently seen first, so they are matched first.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                """
+                SELECT cluster_id, message, signature FROM clusters WHERE pipeline_id = ?
+                ORDER BY last_seen DESC, cluster_id
+                """,
+                (pipeline_id,),
+            ).fetchall()
+        return [
+            {"cluster_id": row[0], "message": row[1], "signature": row[2]}
+            for row in rows
+        ]
+
+    def update(self, pipeline_id: str, errors: list) -> None:
+        """
+        Saves the groups of a run: groups with a "cluster_id" update their cluster, and
+        the other groups become new clusters, whose IDs are set in their "cluster_id".
+
+        Args:
+            pipeline_id (str): pipeline the groups belong to
+            errors (list): groups, as returned by `aggregate_workflow_errors`
+        """
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT MAX(cluster_id) FROM clusters WHERE pipeline_id = ?",
+                (pipeline_id,),
+            ).fetchone()
+            next_id = (row[0] if row[0] is not None else -1) + 1
+            new_clusters = 0
+            for error in errors:
+                if error["cluster_id"] is None:
+                    error["cluster_id"] = next_id
+                    next_id += 1
+                    new_clusters += 1
+                    self.connection.execute(
+                        "INSERT INTO clusters VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            pipeline_id,
+                            error["cluster_id"],
+                            make_signature(error["key"]),
+                            error["key"],
+                            error["count"],
+                            now,
+                            now,
+                        ),
+                    )
+                else:
+                    self.connection.execute(
+                        "UPDATE clusters SET count = ?, last_seen = ? WHERE pipeline_id = ? AND cluster_id = ?",
+                        (error["count"], now, pipeline_id, error["cluster_id"]),
+                    )
+        logger.info(
+            f"{len(errors) - new_clusters} groups matched known clusters and {new_clusters} new clusters were saved to {self.path}."
+        )
@@ -6,7 +6,8 @@ class WorkflowErrorAggregatorParameters:
     User configuration for the workflow error aggregator program. Default parameters can be set here.
     """
 
-    PIPELINE_ID: str = ""
+    PIPELINE_ID: str = ""  # one pipeline ID, or several separated by commas
+    BATCH_CONFIG: str = ""  # path of a file listing the pipelines of a batch; see README
     BASE_URL: str = ""  # e.g. https://api.tetrascience-uat.com/v1/
     USER_TOKEN: str = ""
     ENV_URL: str = ""
@@ -16,8 +17,16 @@ class WorkflowErrorAggregatorParameters:
     LIMIT: int = 100  # how many workflows you want to fetch, time descending order
     FILTER: str = "failed"  # lower case
     SIMILARITY_RATIO: float = 0.5  # if you want to 100% match, set it to 1
+    CLUSTERING_ENGINE: str = "exhaustive"  # "exhaustive", "lsh", "parallel" or "tfidf"; only used if SIMILARITY_RATIO < 1
+    WORKERS: int = 0  # worker processes of the "parallel" engine; the number of CPUs if 0
+    SIMILARITY_BACKEND: str = "sequence"  # "sequence", "bounded", "levenshtein" or "jaccard"
+    MESSAGE_KEY: str = "message"  # "message", "template" or "signature"; what error messages are grouped by
     START_DATETIME: str = ""  # Formats: YYYY-MM-DDTHH:MM:SS or YYYY-MM-DD
     END_DATETIME: str = ""
+    CONCURRENCY: int = 4  # maximum number of concurrent API requests
+    TIME_WINDOWS: int = 0  # if > 0, split the search into this many time windows
+    WATCH_INTERVAL: int = 0  # if > 0, poll the pipelines every this many seconds until stopped
+    STREAM: bool = False  # If true, workflows are aggregated page by page as they are fetched.
     VERIFY_SSL: bool = True  # Some customer environments use self-signed certificates
     # which fail ssl verification
 
@@ -26,9 +35,20 @@ class WorkflowErrorAggregatorParameters:
     USE_LATEST_PIPELINE: bool = False  # If true, results are filtered based on the timestamp of the last pipeline update or START_DATETIME, whichever is later.
     PLATFORM_VERSION: str = "v3.6.1"  # Must have format of "vX.Y.Z", e.g. "v3.3.4"
     LOG_ROOT = "/tmp/"
+    CACHE_PATH: str = ""  # path to the local workflow cache (SQLite) file; no cache if empty
+    CLUSTER_STORE: str = ""  # path to the cluster store (SQLite) file for stable cluster IDs
     SAVE_DIR = "."
     HTML_OUTPUT_NAME = ENV + "_" + PIPELINE_ID + "_out"
     CSV_OUTPUT_NAME: str = ""
+    REPORT_MODE: str = "table"  # "table" or "paged"; layout of the html output
+    JSON_OUTPUT_NAME: str = ""  # file name of the JSON output; no JSON output if empty
+    PARTIAL_OUTPUT_NAME: str = ""  # file name of the partial aggregate; none if empty
+    MERGE_PARTIALS: list = []  # paths of partial aggregates to merge instead of fetching
+    EXPORT_OUTPUT_NAME: str = ""  # file name prefix of the columnar export; no export if empty
+    EXPORT_FORMAT: str = "parquet"  # "parquet", "arrow" or "feather"; requires pyarrow
+    METRICS_OUTPUT_NAME: str = ""  # file name of the JSON run metrics; none if empty
+    PROMETHEUS_TEXTFILE: str = ""  # path of a Prometheus textfile for the run metrics
+    METRICS_BASELINE: str = ""  # path of the JSON run metrics of a run to compare with
     RAW_FILE_NAME = "raw_file_ids"
     TRUNCATE_RAW_FILE_IDS = 10
 
@@ -44,6 +64,7 @@ class WorkflowErrorAggregatorParameters:
 
 class GetSourceFilesParameters(Protocol):
     PIPELINE_ID: str
+    BATCH_CONFIG: str
     BASE_URL: str
     ENV_URL: str
     TS_AUTH_TOKEN: str
@@ -51,16 +72,35 @@ class GetSourceFilesParameters(Protocol):
     LIMIT: int
     FILTER: str
     SIMILARITY_RATIO: float
+    CLUSTERING_ENGINE: str
+    WORKERS: int
+    SIMILARITY_BACKEND: str
+    MESSAGE_KEY: str
     START_DATETIME: str
     END_DATETIME: str
+    CONCURRENCY: int
+    TIME_WINDOWS: int
+    WATCH_INTERVAL: int
+    STREAM: bool
     VERIFY_SSL: bool
     USE_LATEST_PROTOCOL: bool
     PROTOCOL_VERSION: str
     USE_LATEST_PIPELINE: bool
     PLATFORM_VERSION: str
     LOG_ROOT: str
+    CACHE_PATH: str
+    CLUSTER_STORE: str
     SAVE_DIR: str
     HTML_OUTPUT_NAME: str
     CSV_OUTPUT_NAME: str
+    REPORT_MODE: str
+    JSON_OUTPUT_NAME: str
+    PARTIAL_OUTPUT_NAME: str
+    MERGE_PARTIALS: list
+    EXPORT_OUTPUT_NAME: str
+    EXPORT_FORMAT: str
+    METRICS_OUTPUT_NAME: str
+    PROMETHEUS_TEXTFILE: str
+    METRICS_BASELINE: str
     CREATE_RAW_FILE_ID_OUTPUT: bool
     RAW_FILE_NAME: str
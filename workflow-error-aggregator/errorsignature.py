@@ -0,0 +1,115 @@
+import os
+import re
+from typing import Optional
+
+from templateminer import mask_message
+
+# Innermost stack frames kept in a signature; outer frames are mostly the same entry
+# points for every error of a task script.
+SIGNATURE_FRAME_COUNT = 3
+# the exception message is cut to this many characters after masking
+SIGNATURE_MESSAGE_LENGTH = 200
+
+PYTHON_TRACEBACK_HEADER = "Traceback (most recent call last):"
+PYTHON_FRAME = re.compile(r'^\s+File "(?P<file>[^"]+)", line \d+, in (?P<function>\S+)')
+# e.g. "KeyError: 'sample'", "botocore.exceptions.ClientError: ..." or "StopIteration"
+EXCEPTION_LINE = re.compile(r"^(?P<type>[A-Za-z_][\w.]*)(?::\s*(?P<message>.*))?$")
+# e.g. "    at parseFile (/app/src/parser.js:10:5)" or "    at /app/src/index.js:3:1"
+JAVASCRIPT_FRAME = re.compile(
+    r"^\s+at (?:(?P<function>[^\s(]+)(?: \[as \w+\])? \()?(?P<file>[^()]+?)(?::\d+)*\)?$"
+)
+
+
+def unescape_trace(message: str) -> str:
+    """
+    Restores the line breaks of a stack trace that was serialized into a single line,
+    e.g. when the error is a dict or a JSON log entry.
+    """
+    if "\n" not in message.strip() and "\\n" in message:
+        return message.replace("\\n", "\n").replace('\\"', '"')
+    return message
+
+
+def normalize_frame(file: str, function: str) -> str:
+    """
+    Returns a frame as "<file name>:<function>", without the directories of the file
+    and the line number, which differ between installs and versions.
+    """
+    return f"{os.path.basename(file)}:{function or '<anonymous>'}"
+
+
+def format_signature(exception_type: str, exception_message: str, frames: list) -> str:
+    """
+    Returns a signature from the exception type, its message and the normalized frames,
+    innermost first.
+    """
+    masked, _ = mask_message((exception_message or "").strip())
+    signature = exception_type
+    if masked:
+        signature += f": {masked[:SIGNATURE_MESSAGE_LENGTH]}"
+    if frames:
+        signature += " @ " + " < ".join(frames[:SIGNATURE_FRAME_COUNT])
+    return signature
+
+
+def get_python_signature(message: str) -> Optional[str]:
+    """
+    Returns the signature of the last Python traceback in a message, or None if there is
+    none. With chained exceptions, the last traceback is the one that was raised.
+    """
+    if PYTHON_TRACEBACK_HEADER not in message:
+        return None
+    lines = message.rsplit(PYTHON_TRACEBACK_HEADER, 1)[1].splitlines()
+    frames = []
+    for line in lines:
+        frame = PYTHON_FRAME.match(line)
+        if frame:
+            frames.append(normalize_frame(frame["file"], frame["function"]))
+            continue
+        if not line.strip() or line[0].isspace():  # source lines and carets
+            continue
+        exception = EXCEPTION_LINE.match(line.strip())
+        if exception:
+            return format_signature(
+                exception["type"], exception["message"], frames[::-1]
+            )
+        break
+    return None
+
+
+def get_javascript_signature(message: str) -> Optional[str]:
+    """
+    Returns the signature of a JavaScript stack trace ("<type>: <message>" followed by
+    "at" frames, innermost first) in a message, or None if there is none.
+    """
+    lines = message.splitlines()
+    for index, line in enumerate(lines[:-1]):
+        exception = EXCEPTION_LINE.match(line.strip())
+        if not exception or not JAVASCRIPT_FRAME.match(lines[index + 1]):
+            continue
+        frames = []
+        for frame_line in lines[index + 1 :]:
+            frame = JAVASCRIPT_FRAME.match(frame_line)
+            if not frame:
+                break
+            frames.append(normalize_frame(frame["file"], frame["function"]))
+        return format_signature(exception["type"], exception["message"], frames)
+    return None
+
+
+def make_error_signature(message: str) -> str:
+    """
+    Returns a compact signature of an error message that holds a Python traceback or a
+    JavaScript stack trace: the exception type, its message with variable tokens masked
+    (see `mask_message`), and the file name and function of the innermost
+    `SIGNATURE_FRAME_COUNT` frames, e.g.
+
+        KeyError: 'sample' @ parser.py:read_row < parser.py:parse < main.py:run
+
+    Messages without a stack trace are returned unchanged.
+    """
+    trace = unescape_trace(message)
+    signature = get_python_signature(trace)
+    if signature is None:
+        signature = get_javascript_signature(trace)
+    return signature if signature is not None else message
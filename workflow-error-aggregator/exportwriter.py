@@ -0,0 +1,140 @@
+import json
+import os
+
+from loguru import logger
+
+from htmlwriter import get_group_message
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency, only needed for the columnar export
+    pa = None
+
+EXPORT_FORMATS = ["parquet", "arrow", "feather"]
+DEFAULT_EXPORT_FORMAT = "parquet"
+
+
+def timestamp_array(values: list):
+    """
+    Returns ISO-8601 times as a timestamp array, or as strings if they cannot be parsed.
+    """
+    strings = pa.array(values, pa.string())
+    try:
+        return strings.cast(pa.timestamp("s"))
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return strings
+
+
+def make_export_tables(errors: list, pipeline_config: dict) -> dict:
+    """
+    Builds the columnar tables of the export from the aggregated workflows:
+
+    - "workflows": one row per workflow, with the ID of the cluster (group) it belongs to:
+      its stable ID if a cluster store is used, otherwise its index
+    - "clusters": one row per cluster, with its representative message, workflow count
+      and the creation times of its first and last workflow
+    - "pipeline": a single row with the pipeline ID, name and full configuration (JSON)
+
+    Returns:
+        (dict): { table name: pyarrow.Table }
+    """
+    workflows = {
+        "workflow_id": [],
+        "created_at": [],
+        "last_updated_at": [],
+        "file_id": [],
+        "cluster_id": [],
+    }
+    clusters = {
+        "cluster_id": [],
+        "message": [],
+        "count": [],
+        "first_seen": [],
+        "last_seen": [],
+    }
+    for index, error in enumerate(errors):
+        cluster_id = error.get("cluster_id")
+        if cluster_id is None:
+            cluster_id = index
+        created_times = []
+        for workflow_id, created_at, last_updated_at, file_id in error["workflow_info"]:
+            workflows["workflow_id"].append(workflow_id)
+            workflows["created_at"].append(created_at)
+            workflows["last_updated_at"].append(last_updated_at)
+            workflows["file_id"].append(file_id)
+            workflows["cluster_id"].append(cluster_id)
+            created_times.append(created_at)
+        clusters["cluster_id"].append(cluster_id)
+        clusters["message"].append(get_group_message(error))
+        clusters["count"].append(error["count"])
+        clusters["first_seen"].append(min(created_times, default=None))
+        clusters["last_seen"].append(max(created_times, default=None))
+
+    pipeline_config = pipeline_config or {}
+    pipeline = {
+        "pipeline_id": [pipeline_config.get("id")],
+        "name": [pipeline_config.get("name") or pipeline_config.get("protocolSlug")],
+        "config": [json.dumps(pipeline_config, default=str)],
+    }
+
+    return {
+        "workflows": pa.table(
+            {
+                "workflow_id": pa.array(workflows["workflow_id"], pa.string()),
+                "created_at": timestamp_array(workflows["created_at"]),
+                "last_updated_at": timestamp_array(workflows["last_updated_at"]),
+                "file_id": pa.array(workflows["file_id"], pa.string()),
+                "cluster_id": pa.array(workflows["cluster_id"], pa.int32()),
+            }
+        ),
+        "clusters": pa.table(
+            {
+                "cluster_id": pa.array(clusters["cluster_id"], pa.int32()),
+                "message": pa.array(clusters["message"], pa.large_string()),
+                "count": pa.array(clusters["count"], pa.int64()),
+                "first_seen": timestamp_array(clusters["first_seen"]),
+                "last_seen": timestamp_array(clusters["last_seen"]),
+            }
+        ),
+        "pipeline": pa.table(
+            {
+                "pipeline_id": pa.array(pipeline["pipeline_id"], pa.string()),
+                "name": pa.array(pipeline["name"], pa.string()),
+                "config": pa.array(pipeline["config"], pa.large_string()),
+            }
+        ),
+    }
+
+
+def write_table(table, path: str, export_format: str) -> None:
+    if export_format == "parquet":
+        pq.write_table(table, path)
+    elif export_format == "feather":
+        feather.write_feather(table, path)
+    else:
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+
+def make_export_output(errors: list, params, pipeline_config: dict) -> None:
+    """
+    Writes the workflows, clusters and pipeline tables (see `make_export_tables`) as
+    <EXPORT_OUTPUT_NAME>_<table>.<format> files, in Parquet, Arrow IPC or Feather format.
+    Requires pyarrow.
+    """
+    if pa is None:
+        logger.error(
+            "The columnar export requires pyarrow, which is not installed. Install it with `poetry install -E export`. Skipping the export..."
+        )
+        return
+    export_format = params.export_format
+    for name, table in make_export_tables(errors, pipeline_config).items():
+        output_path = os.path.join(
+            params.save_dir,
+            f"{params.export_output_name}_{name}.{export_format}",
+        )
+        write_table(table, output_path, export_format)
+        logger.info(f"{table.num_rows} {name} rows are exported to {output_path}")
@@ -0,0 +1,259 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from loguru import logger
+
+DEFAULT_CONCURRENCY = 4
+MIN_WINDOW_LENGTH = timedelta(seconds=1)  # full windows shorter than this are not split
+
+
+class BoundedSession(requests.Session):
+    """
+    A requests session that allows at most `max_in_flight` requests at once, across all
+    threads using it. This makes the concurrency limit global when several fetches, e.g.
+    of different pipelines, share the session.
+    """
+
+    def __init__(self, max_in_flight: int = DEFAULT_CONCURRENCY):
+        super().__init__()
+        self.in_flight = threading.BoundedSemaphore(max(max_in_flight, 1))
+
+    def request(self, *args, **kwargs):
+        with self.in_flight:
+            return super().request(*args, **kwargs)
+
+
+def make_session(concurrency: int = DEFAULT_CONCURRENCY) -> requests.Session:
+    """
+    Returns a requests session whose connection pool can hold one connection per concurrent
+    request, so that TLS connections are reused across pages instead of being set up per call.
+    At most `concurrency` requests are made at once through the session.
+    """
+    session = BoundedSession(concurrency)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(concurrency, 1))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class PageStream:
+    """
+    Fetches enough pages of `page_size` results to cover `limit` results, with at most
+    `concurrency` page requests in flight at once. Every page is requested in full, since
+    page offsets depend on the page size; the caller truncates the merged results.
+
+    Iterating over the stream yields the pages in page order, each as soon as it and all
+    pages before it have been fetched, up to the first page that was not full. After
+    iteration, `all_found` is True if all available results were fetched, i.e. the limit
+    was reached or a page was not full, and no page request failed.
+
+    Args:
+        fetch_page (Callable): called as fetch_page(page); returns the list of results of
+            that page, or None if the request failed
+        limit (int): maximum number of results to fetch
+        page_size (int): number of results per page
+        concurrency (int): maximum number of concurrent page requests
+    """
+
+    def __init__(
+        self,
+        fetch_page: Callable[[int], Optional[list]],
+        limit: int,
+        page_size: int,
+        concurrency: int = DEFAULT_CONCURRENCY,
+    ):
+        self.fetch_page = fetch_page
+        self.limit = limit
+        self.page_size = page_size
+        self.concurrency = max(concurrency, 1)
+        self.all_found = None
+
+    def __iter__(self) -> Iterator[list]:
+        page_count = -(-self.limit // self.page_size)  # ceiling division
+
+        pages = {}  # { page number: results }, until yielded
+        last_page = page_count - 1  # no page after the first partial page is needed
+        failed = False
+        next_page = 0
+        next_yield = 0
+        in_flight = {}  # { future: page number }
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while in_flight or (next_page <= last_page and not failed):
+                while (
+                    next_page <= last_page
+                    and not failed
+                    and len(in_flight) < self.concurrency
+                ):
+                    future = executor.submit(self.fetch_page, next_page)
+                    in_flight[future] = next_page
+                    next_page += 1
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page = in_flight.pop(future)
+                    results = future.result()
+                    if results is None:
+                        logger.warning(
+                            f"Page {page} of the results could not be fetched."
+                        )
+                        failed = True
+                        last_page = min(last_page, page - 1)
+                        continue
+                    pages[page] = results
+                    if len(results) < self.page_size:
+                        last_page = min(last_page, page)
+                # pages beyond the last needed page may still be in flight; they are dropped
+                for future, page in list(in_flight.items()):
+                    if page > last_page and future.cancel():
+                        in_flight.pop(future)
+
+                while next_yield <= last_page and next_yield in pages:
+                    yield pages.pop(next_yield)
+                    next_yield += 1
+
+        self.all_found = not failed
+
+
+def fetch_pages(
+    fetch_page: Callable[[int], Optional[list]],
+    limit: int,
+    page_size: int,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> Tuple[List[list], bool]:
+    """
+    Fetches all pages of a `PageStream`.
+
+    Returns:
+        (list): fetched pages, in page order, up to the first page that was not full
+        (bool): True if all available results were fetched, i.e. the limit was reached or a
+            page was not full, and no page request failed
+    """
+    stream = PageStream(fetch_page, limit, page_size, concurrency=concurrency)
+    pages = list(stream)
+    return pages, stream.all_found
+
+
+def iter_unique_pages(pages: Iterable[list], limit: int = None, key: str = "id"):
+    """
+    Yields pages of results, dropping results whose `key` was already seen, until `limit`
+    results have been yielded. Results may be duplicated across pages if the results
+    shift while they are paged.
+    """
+    seen = set()
+    remaining = limit
+    for page in pages:
+        unique_page = []
+        for result in page:
+            result_key = result.get(key, id(result))
+            if result_key not in seen:
+                seen.add(result_key)
+                unique_page.append(result)
+        if remaining is not None:
+            unique_page = unique_page[:remaining]
+            remaining -= len(unique_page)
+        if unique_page:
+            yield unique_page
+
+
+def merge_pages(pages: List[list], key: str = "id") -> list:
+    """
+    Concatenates pages of results, keeping only the first result for each `key`.
+    """
+    return [result for page in iter_unique_pages(pages, key=key) for result in page]
+
+
+def split_time_range(start: datetime, end: datetime, count: int) -> List[tuple]:
+    """
+    Splits [start, end] into `count` consecutive windows of equal length, newest first.
+    """
+    step = (end - start) / max(count, 1)
+    bounds = [start + step * index for index in range(count)] + [end]
+    return [(bounds[index], bounds[index + 1]) for index in reversed(range(count))]
+
+
+def fetch_time_windows(
+    fetch_window: Callable[[datetime, datetime], Optional[Tuple[list, bool]]],
+    start: datetime,
+    end: datetime,
+    window_count: int,
+    limit: int,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> Tuple[List[list], bool]:
+    """
+    Fetches results in [start, end] by splitting the range into time windows that are
+    fetched independently, with at most `concurrency` windows in flight at once. A window
+    that comes back full is split in two and both halves are fetched again, so that no
+    query has to page deeply.
+
+    Once the newest windows hold at least `limit` results, older windows are skipped.
+
+    Args:
+        fetch_window (Callable): called as fetch_window(window_start, window_end); returns
+            the results in that window and whether the window was full, or None if the
+            request failed
+        start (datetime): start of the time range
+        end (datetime): end of the time range
+        window_count (int): number of windows to start with
+        limit (int): number of (newest) results needed
+        concurrency (int): maximum number of concurrent window requests
+
+    Returns:
+        (list): results of each window, newest window first
+        (bool): True if all windows were fetched successfully
+    """
+    pending = split_time_range(start, end, window_count)  # newest first
+    completed = {}  # { (window start, window end): results }
+    failed = False
+    in_flight = {}  # { future: window }
+
+    def covered_start() -> Optional[datetime]:
+        # start of the contiguous range, from `end`, already covered by completed windows
+        # once those windows hold at least `limit` results
+        boundary, count = end, 0
+        for (window_start, window_end), results in sorted(
+            completed.items(), key=lambda item: item[0][1], reverse=True
+        ):
+            if window_end != boundary:
+                return None
+            boundary, count = window_start, count + len(results)
+            if count >= limit:
+                return boundary
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        while pending or in_flight:
+            while pending and len(in_flight) < max(concurrency, 1):
+                window = pending.pop(0)
+                in_flight[executor.submit(fetch_window, *window)] = window
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                window = in_flight.pop(future)
+                result = future.result()
+                if result is None:
+                    logger.warning(
+                        f"Workflows between {window[0]} and {window[1]} could not be fetched."
+                    )
+                    failed = True
+                    continue
+                results, full = result
+                if full and window[1] - window[0] > MIN_WINDOW_LENGTH:
+                    # newer half first, ahead of older windows
+                    pending = split_time_range(*window, 2) + pending
+                    continue
+                if full:
+                    logger.warning(
+                        f"Time window starting at {window[0]} is full but too short to split; some workflows may be missing."
+                    )
+                completed[window] = results
+
+            boundary = covered_start()
+            if boundary is not None:
+                pending = [window for window in pending if window[1] > boundary]
+
+    ordered = sorted(completed.items(), key=lambda item: item[0][1], reverse=True)
+    return [results for _, results in ordered], not failed
@@ -0,0 +1,97 @@
+from functools import lru_cache
+from typing import Any, Callable, Iterable
+
+from pydash import get as _get
+
+_MISSING = object()
+
+
+def parse_path(location: str) -> tuple:
+    """
+    Splits a pydash.get() style path into its keys. Keys that look like integers, such as
+    the "-1" in "tasks.-1.output", are also kept as list indices.
+
+    Returns:
+        (tuple): (key, list index or None) for each part of the path
+    """
+    keys = []
+    for key in location.split("."):
+        try:
+            index = int(key)
+        except ValueError:
+            index = None
+        keys.append((key, index))
+    return tuple(keys)
+
+
+@lru_cache(maxsize=None)
+def compile_path(location: str) -> Callable[[Any], Any]:
+    """
+    Compiles a pydash.get() style path into an accessor function, so the path is parsed
+    once rather than on every call. The accessor returns None if the path does not exist.
+
+    Dicts and lists (including negative indices) are walked directly; any other object
+    falls back to pydash.get() for the rest of the path.
+    """
+    keys = parse_path(location)
+
+    def accessor(obj: Any) -> Any:
+        for position, (key, index) in enumerate(keys):
+            if isinstance(obj, dict):
+                obj = obj.get(key, _MISSING)
+                if obj is _MISSING:
+                    return None
+            elif isinstance(obj, (list, tuple)):
+                if index is None or not -len(obj) <= index < len(obj):
+                    return None
+                obj = obj[index]
+            elif obj is None:
+                return None
+            else:
+                return _get(obj, ".".join(k for k, _ in keys[position:]))
+        return obj
+
+    return accessor
+
+
+_KEEP_ALL = object()  # marks a path that ends at a node in a projection tree
+
+
+def compile_projection(locations: Iterable[str]) -> Callable[[Any], Any]:
+    """
+    Compiles pydash.get() style paths into a projection function, which copies only the
+    values at those paths into a new nested structure of dicts and lists. Each path
+    resolves to the same value in the projection as in the original object, so accessors
+    compiled with `compile_path` work on either.
+
+    Lists whose paths only use the index -1, like "tasks.-1.output", are reduced to their
+    last element; lists indexed otherwise are kept whole. A path that is a prefix of
+    another keeps its whole value.
+    """
+    tree = {}
+    for location in locations:
+        node = tree
+        for key in parse_path(location):
+            if _KEEP_ALL in node:
+                break
+            node = node.setdefault(key, {})
+        else:
+            node.clear()
+            node[_KEEP_ALL] = True
+
+    def project(obj: Any, node: dict) -> Any:
+        if _KEEP_ALL in node:
+            return obj
+        if isinstance(obj, dict):
+            return {
+                key: project(obj[key], child)
+                for (key, _), child in node.items()
+                if key in obj
+            }
+        if isinstance(obj, list):
+            if any(index != -1 for _, index in node):
+                return obj
+            return [project(obj[-1], node[("-1", -1)])] if obj else []
+        return obj
+
+    return lambda obj: project(obj, tree)
@@ -1,8 +1,108 @@
+import re
+from datetime import datetime
+
 from dateutil import parser
-from pydash import get as _get
 from defaultparams import GetSourceFilesParameters
+from fieldaccess import compile_path
 from loguru import logger
 
+# ISO-8601 timestamps as returned by TDP, e.g. "2022-11-27T23:40:00.000Z"
+ISO_TIMESTAMP = re.compile(
+    r"(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d{1,6}))?(Z|[+-]\d\d:\d\d)?"
+)
+
+get_input_file_key = compile_path("inputFile.fileKey")
+
+
+def parse_timestamp(timestamp: str) -> datetime:
+    """
+    Parses an ISO-8601 timestamp with `datetime.fromisoformat`, falling back to the much
+    slower `dateutil.parser.parse` for any other format.
+    """
+    match = ISO_TIMESTAMP.fullmatch(timestamp) if isinstance(timestamp, str) else None
+    if not match:
+        return parser.parse(timestamp)
+    seconds, fraction, offset = match.groups()
+    return datetime.fromisoformat(
+        seconds
+        + (f".{fraction.ljust(6, '0')}" if fraction else "")
+        + ("+00:00" if offset == "Z" else offset or "")
+    )
+
+
+def is_later(timestamp: str, other: str) -> bool:
+    """
+    Returns True if `timestamp` is later than `other`. UTC timestamps in the same format
+    (and so of the same length) are compared as strings, without parsing them.
+    """
+    if (
+        len(timestamp) == len(other)
+        and timestamp[-1:] == other[-1:] == "Z"
+        and ISO_TIMESTAMP.fullmatch(timestamp)
+        and ISO_TIMESTAMP.fullmatch(other)
+    ):
+        return timestamp > other
+    return parse_timestamp(timestamp) > parse_timestamp(other)
+
+
+class LatestWorkflowFilter:
+    """
+    Incrementally keeps only the latest workflow for each S3 input file key, and only the
+    workflows that match the protocol version if one is required.
+
+    Only the ID and last update time of the latest workflow of each input file key are
+    kept, so workflows can be passed through one at a time without holding on to them.
+    """
+
+    def __init__(self, pipeline_parameters: GetSourceFilesParameters):
+        # check whether version of workflow matches the current version of the protocol, if use_latest_protocol is True or PROTOCOL_VERSION is specified.
+        self.protocol_version = None
+        if ("v3.1" not in pipeline_parameters.platform_version) or (
+            "v3.1" in pipeline_parameters.platform_version
+            and pipeline_parameters.protocol_version
+        ):
+            self.protocol_version = pipeline_parameters.protocol_version
+            self.check_protocol = True
+        else:
+            self.check_protocol = False
+        # { "input_file_key": (workflow ID, lastUpdatedAt) }
+        self.input_file_with_latest_workflow = {}
+        self.protocol_workflow_count = 0
+        self.duplicates = 0
+
+    def add(self, workflow: dict):
+        """
+        Checks a workflow against the workflows seen so far.
+
+        Returns:
+            (bool): True if the workflow is the latest one for its input file
+            (str): ID of the workflow it supersedes, if any
+        """
+        if (
+            self.check_protocol
+            and workflow.get("protocolVersion") != self.protocol_version
+        ):
+            return False, None
+        self.protocol_workflow_count += 1
+
+        input_file_key = get_input_file_key(workflow)
+        latest = (workflow.get("id"), workflow.get("lastUpdatedAt"))
+
+        # no same file path found
+        if input_file_key not in self.input_file_with_latest_workflow:
+            self.input_file_with_latest_workflow[input_file_key] = latest
+            return True, None
+
+        # found the same file path: duplicate found
+        self.duplicates += 1
+        existing_id, existing_wf_last_updated_at = self.input_file_with_latest_workflow[
+            input_file_key
+        ]
+        if is_later(workflow.get("createdAt"), existing_wf_last_updated_at):
+            self.input_file_with_latest_workflow[input_file_key] = latest
+            return True, existing_id
+        return False, None
+
 
 def filter_latest_workflow(
     workflows: list, pipeline_parameters: GetSourceFilesParameters
@@ -22,55 +122,27 @@ def filter_latest_workflow(
     # strictly for logging messages
     filter_str = f"{pipeline_parameters.filter} " if pipeline_parameters.filter else ""
 
-    # first check whether version of workflow matches the current version of the protocol, if use_latest_protocol is True or PROTOCOL_VERSION is specified.
-    if ("v3.1" not in pipeline_parameters.platform_version) or (
-        "v3.1" in pipeline_parameters.platform_version
-        and pipeline_parameters.protocol_version
-    ):
-        protocol_workflows = []
-        for workflow in workflows:
-            if (
-                _get(workflow, "protocolVersion")
-                == pipeline_parameters.protocol_version
-            ):
-                protocol_workflows.append(workflow)
-        workflows = protocol_workflows
-
-        if len(protocol_workflows) == 0:
+    latest_filter = LatestWorkflowFilter(pipeline_parameters)
+    input_file_with_latest_workflow = {}  # { "input_file_key": <workflow dict> }
+    for workflow in workflows:
+        is_latest, _ = latest_filter.add(workflow)
+        if is_latest:
+            input_file_with_latest_workflow[get_input_file_key(workflow)] = workflow
+
+    if latest_filter.check_protocol:
+        if latest_filter.protocol_workflow_count == 0:
             logger.warning(
                 f"No {filter_str}workflows found with protocol version {pipeline_parameters.protocol_version}. No output will be generated."
             )
-            return workflows
+            return []
         else:
             logger.info(
-                f"{len(workflows)} {filter_str}workflows found with protocol version {pipeline_parameters.protocol_version}."
+                f"{latest_filter.protocol_workflow_count} {filter_str}workflows found with protocol version {pipeline_parameters.protocol_version}."
             )
 
-    input_file_with_latest_workflow = {}  # { "input_file_key": <workflow dict> }
-    duplicates = 0
-    for workflow in workflows:
-
-        input_file_key = _get(workflow, "inputFile.fileKey")
-
-        # found the same file path
-        if input_file_key in input_file_with_latest_workflow.keys():
-            # duplicate found
-            duplicates += 1
-            existing_wf = input_file_with_latest_workflow[input_file_key]
-            existing_wf_last_updated_at = parser.parse(
-                _get(existing_wf, "lastUpdatedAt")
-            )
-            current_wf_created_at = parser.parse(_get(workflow, "createdAt"))
-
-            if current_wf_created_at > existing_wf_last_updated_at:
-                input_file_with_latest_workflow[input_file_key] = workflow
-        # no same file path found
-        else:
-            input_file_with_latest_workflow[input_file_key] = workflow
-
-    latest_wfs = input_file_with_latest_workflow.values()
+    latest_wfs = list(input_file_with_latest_workflow.values())
     logger.info(
-        f"{len(latest_wfs)} {filter_str}workflows using different input files. {duplicates} duplicates found."
+        f"{len(latest_wfs)} {filter_str}workflows using different input files. {latest_filter.duplicates} duplicates found."
     )
 
     return latest_wfs
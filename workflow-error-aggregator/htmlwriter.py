@@ -1,91 +1,78 @@
-import pandas as pd
+import html
 import os
 from pydash import get as _get
 from loguru import logger
-from typing import Tuple
+from typing import TextIO, Tuple
 
-UNIQUE_DELINEATOR1 = "A+" * 8  # placeholder for adding html code
-UNIQUE_DELINEATOR2 = "B-" * 8  # placeholder for adding html code
-UNIQUE_DELINEATOR_LT = "C^" * 8  # placeholder for adding html code
-UNIQUE_DELINEATOR_GT = "D~" * 8  # placeholder for adding html code
 OMIT_CREATION_TIME = True
+COLUMN_WIDTHS = [512, 32, 520]  # minimum widths, in pixels, of the table columns
 
 
 def make_monospace_type(size: float = 80) -> Tuple[str, str]:
-    start = f"{UNIQUE_DELINEATOR_LT}font style='font-family:\"Courier New\", Courier, monospace; font-size:{size}%'{UNIQUE_DELINEATOR_GT}"
-    end = f"{UNIQUE_DELINEATOR_LT}/font{UNIQUE_DELINEATOR_GT}"
+    start = f"<font style='font-family:\"Courier New\", Courier, monospace; font-size:{size}%'>"
+    end = "</font>"
     return start, end
 
 
-def make_html_output(errors: dict, params, pipeline_config: dict) -> None:
+def make_html_text(text: str) -> str:
     """
-    Creates the html output for the aggregated workflow errors.
+    Escapes text for an html table cell, keeping its line breaks and indentation.
     """
-    # export to Pandas dataframe and export but make the it *~pretty~*.
-
-    def clean_errors():
-        nonlocal errors
-        for ind, error_list in enumerate(errors):
-            # get the workflow error looking nice
-            start, end = make_monospace_type()
-            error = str(_get(errors[ind]["value"], "result.message"))
-            if not error:
-                error = str(errors[ind]["value"])
-            error_value = start + error + end
-            error_value = error_value.replace("\n", UNIQUE_DELINEATOR1)
-            error_value = error_value.replace("  ", UNIQUE_DELINEATOR2)
-            errors[ind]["value"] = error_value
-
-            # Put each failed workflow on its own line
-            errors[ind]["workflow_info"] = UNIQUE_DELINEATOR1.join(
-                [make_file_links(a) for a in error_list["workflow_info"]]
-            )
+    return (
+        html.escape(text, quote=False).replace("\n", "<br>").replace("  ", "&nbsp;" * 2)
+    )
 
-            # add monospace type to this part
-            errors[ind]["workflow_info"] = start + errors[ind]["workflow_info"] + end
 
-    def make_file_links(workflow_line: str) -> str:
-        nonlocal params
+def make_html_link(url: str, text: str) -> str:
+    return f'<a href="{html.escape(url)}", target="_blank">{html.escape(text, quote=False)}</a>'
 
-        def make_html_link(url: str, text: str) -> str:
-            return f'{UNIQUE_DELINEATOR_LT}a href="{url}", target="_blank"{UNIQUE_DELINEATOR_GT}{text}{UNIQUE_DELINEATOR_LT}/a{UNIQUE_DELINEATOR_GT}'
 
-        if not params.env_url:
-            params.env_url = params.url.replace("//api.", "//").replace("/v1/", "/")
-        wf_link = params.env_url + "workflows/" + workflow_line[0]
-        fid_link = (
-            params.env_url
-            + "file-details/"
-            + workflow_line[3]
-            + "?pipelineId="
-            + workflow_line[0]
-        )
-        line_with_links = f"{make_html_link(wf_link, workflow_line[0])}"
-        if not OMIT_CREATION_TIME:
-            line_with_links += f": {workflow_line[1]}"
-        line_with_links += f", {workflow_line[2]}"
-        line_with_links += f", {make_html_link(fid_link, 'raw file')}"
-        return line_with_links
+def get_env_url(params) -> str:
+    """
+    Returns the TDP url used for links to workflows and files, derived from the API url if
+    it is not set.
+    """
+    return params.env_url or params.url.replace("//api.", "//").replace("/v1/", "/")
+
+
+def get_group_message(error: dict) -> str:
+    """
+    Returns the message shown for a group of aggregated workflows.
+    """
+    error_msg = str(_get(error["value"], "result.message"))
+    if not error_msg:
+        error_msg = str(error["value"])
+    return error_msg
+
+
+def get_group_label(index: int, error: dict) -> str:
+    """
+    Returns the label of a group in the report tables: its index, and its stable cluster
+    ID if it has one.
+    """
+    if error.get("cluster_id") is None:
+        return str(index)
+    return f"{index} (cluster {error['cluster_id']})"
 
-    clean_errors()
 
-    error_df = pd.DataFrame(errors)  # convert to dataframe
+def make_html_output(errors: list, params, pipeline_config: dict) -> None:
+    """
+    Creates the html output for the aggregated workflow errors.
 
+    The table is written to the output file one row, and one workflow, at a time, so the
+    size of a group does not affect memory use. `errors` is not modified.
+    """
+    env_url = get_env_url(params)
     output_path = os.path.join(params.save_dir, f"{params.html_output_name}.html")
-    tmp_path = os.path.join(params.log_root, "tmp.html")
-    error_df.to_html(tmp_path, col_space=[512, 32, 520], justify="left")
-    with open(tmp_path, "rt") as fin:
-        with open(output_path, "wt") as fout:
-            fout.write(
-                make_html_header(
-                    pipeline_config,
-                    version=params.platform_version,
-                    status=params.filter,
-                )
+    with open(output_path, "wt") as fout:
+        fout.write(
+            make_html_header(
+                pipeline_config,
+                version=params.platform_version,
+                status=params.filter,
             )
-            for line in fin:
-                fout.write(make_html_line(line, status=params.filter))
-    os.remove(tmp_path)
+        )
+        write_html_table(fout, errors, env_url, status=params.filter)
     logger.info(
         f"Detailed aggregated workflow and count table is saved to {output_path}"
     )
@@ -94,7 +81,39 @@ def make_html_output(errors: dict, params, pipeline_config: dict) -> None:
     )
 
 
-def make_html_line(line: str, status="failed") -> str:
+def write_html_table(
+    fout: TextIO, errors: list, env_url: str, status: str = "failed"
+) -> None:
+    """
+    Writes the table of aggregated workflows, one row per group.
+    """
+    start, end = make_monospace_type()
+    fout.write('<table border="1" class="dataframe">\n  <thead>\n')
+    fout.write('    <tr style="text-align: left;">\n      <th></th>\n')
+    for title, width in zip(make_column_titles(status), COLUMN_WIDTHS):
+        fout.write(f'      <th style="min-width: {width}px;">{title}</th>\n')
+    fout.write("    </tr>\n  </thead>\n  <tbody>\n")
+
+    for ind, error in enumerate(errors):
+        # get the workflow error looking nice
+        error_msg = get_group_message(error)
+        fout.write('    <tr style="text-align: left; vertical-align: top;">\n')
+        fout.write(f"      <th>{get_group_label(ind, error)}</th>\n")
+        fout.write(f"      <td>{start}{make_html_text(error_msg)}{end}</td>\n")
+        fout.write(f"      <td>{error['count']}</td>\n")
+
+        # Put each failed workflow on its own line
+        fout.write(f"      <td>{start}")
+        for line_ind, workflow_line in enumerate(error["workflow_info"]):
+            if line_ind:
+                fout.write("<br>")
+            fout.write(make_file_links(workflow_line, env_url))
+        fout.write(f"{end}</td>\n    </tr>\n")
+
+    fout.write("  </tbody>\n</table>")
+
+
+def make_column_titles(status: str = "failed") -> list:
     if status.lower() == "failed":
         value = "Error Message"
         wf_replace = "Failed "
@@ -102,27 +121,26 @@ def make_html_line(line: str, status="failed") -> str:
         value = "Message"
         wf_replace = ""
 
-    replacements = {
-        UNIQUE_DELINEATOR1: "<br>",
-        UNIQUE_DELINEATOR2: "&nbsp;" * 2,
-        UNIQUE_DELINEATOR_LT: "<",
-        UNIQUE_DELINEATOR_GT: ">",
-        "value": value,
-        "count": "Count",
-        "<tr>": r'<tr style="text-align: left; vertical-align: top;">',
-    }
-
     if OMIT_CREATION_TIME:
-        replacements[
-            "workflow_info"
-        ] = f"{wf_replace}Workflows (workflow ID, last update time, raw file ID)"
+        workflow_info = (
+            f"{wf_replace}Workflows (workflow ID, last update time, raw file ID)"
+        )
     else:
-        replacements[
-            "workflow_info"
-        ] = f"{wf_replace}Workflows (workflow ID, creation time, last update time, raw file ID)"
-    for k, v in replacements.items():
-        line = line.replace(k, v)
-    return line
+        workflow_info = f"{wf_replace}Workflows (workflow ID, creation time, last update time, raw file ID)"
+    return [value, "Count", workflow_info]
+
+
+def make_file_links(workflow_line: tuple, env_url: str) -> str:
+    wf_link = env_url + "workflows/" + workflow_line[0]
+    fid_link = (
+        env_url + "file-details/" + workflow_line[3] + "?pipelineId=" + workflow_line[0]
+    )
+    line_with_links = f"{make_html_link(wf_link, workflow_line[0])}"
+    if not OMIT_CREATION_TIME:
+        line_with_links += f": {html.escape(workflow_line[1], quote=False)}"
+    line_with_links += f", {html.escape(workflow_line[2], quote=False)}"
+    line_with_links += f", {make_html_link(fid_link, 'raw file')}"
+    return line_with_links
 
 
 def make_html_header(pipeline_config: dict, version="v3.3", status="failed") -> str:
@@ -159,6 +177,8 @@ def make_html_header(pipeline_config: dict, version="v3.3", status="failed") ->
             for k, v in config.items():
                 if type(v) is dict:
                     v = make_pretty_pipeline_config(k, v, indent=indent + 1)
+                else:
+                    v = html.escape(str(v), quote=False)
                 list.append(f"{k}: {v}")
             indent_str = f"<br>{'&nbsp;' * 4 * indent}"
             return f"{title}:{indent_str}" + indent_str.join(list)
@@ -173,5 +193,7 @@ def make_html_header(pipeline_config: dict, version="v3.3", status="failed") ->
         if v == "pipelineConfig":
             header += make_pretty_pipeline_config(k, _get(pipeline_config, v)) + "\n"
         else:
-            header += f"{k}: {_get(pipeline_config, v)}<br>\n"
+            header += (
+                f"{k}: {html.escape(str(_get(pipeline_config, v)), quote=False)}<br>\n"
+            )
     return header + "</p> \n"
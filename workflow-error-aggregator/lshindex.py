@@ -0,0 +1,121 @@
+import zlib
+import numpy as np
+
+# MinHash signature length. Each signature is split into bands of rows; two messages
+# become candidates when all rows of at least one band agree.
+NUM_PERMUTATIONS = 128
+SHINGLE_LENGTH = 3
+# Margin below the squared Dice-to-Jaccard mapping, see `similarity_to_jaccard`
+JACCARD_MARGIN = 0.85
+# Probability with which a pair at the Jaccard threshold must become a candidate
+CANDIDATE_RECALL = 0.99
+_MERSENNE_PRIME = (1 << 32) - 5  # largest prime below 2**32
+_SEED = 1729  # fixed seed so candidate sets are reproducible between runs
+
+
+def similarity_to_jaccard(similarity_ratio: float) -> float:
+    """
+    Maps a SequenceMatcher ratio to the shingle Jaccard similarity used to tune the index.
+
+    SequenceMatcher.ratio() is a Dice-style coefficient (2M/T), which corresponds to a
+    Jaccard similarity of R/(2-R) over characters. Edits break up to SHINGLE_LENGTH
+    shingles each, so shingle sets overlap less: on synthetic error messages, pairs at a
+    given ratio rarely had a shingle Jaccard similarity below JACCARD_MARGIN times the
+    square of that value.
+    """
+    jaccard = similarity_ratio / (2.0 - similarity_ratio)
+    return JACCARD_MARGIN * jaccard**2
+
+
+def choose_bands(
+    jaccard_threshold: float,
+    num_permutations: int = NUM_PERMUTATIONS,
+    recall: float = CANDIDATE_RECALL,
+):
+    """
+    Returns the most selective (bands, rows) that still make a pair with a Jaccard
+    similarity of `jaccard_threshold` a candidate with a probability of at least
+    `recall`, 1 - (1 - J^rows)^bands. A single row per band means that no banding reaches
+    that recall while pruning, see `MinHashLSHIndex.prunes`.
+    """
+    for rows in range(num_permutations, 1, -1):
+        bands = num_permutations // rows
+        if 1.0 - (1.0 - jaccard_threshold**rows) ** bands >= recall:
+            return bands, rows
+    return num_permutations, 1
+
+
+def shingle_hashes(message: str) -> np.ndarray:
+    """
+    Returns the 32-bit hashes of the character shingles of a message.
+    """
+    if len(message) <= SHINGLE_LENGTH:
+        shingles = {message}
+    else:
+        shingles = {
+            message[i : i + SHINGLE_LENGTH]
+            for i in range(len(message) - SHINGLE_LENGTH + 1)
+        }
+    return np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+
+
+class MinHashLSHIndex:
+    """
+    Locality-sensitive hashing index over character shingles of group messages.
+
+    The index only proposes candidate groups; callers are expected to confirm each
+    candidate with the exact similarity check, so the similarity ratio keeps its meaning.
+    Groups the index does not propose are never compared, which trades a small chance
+    of missing a borderline match for close to linear clustering time, so groups can
+    differ from exhaustive matching.
+
+    At low similarity ratios, similar pairs share no more shingles than unrelated ones,
+    and the index cannot prune without missing most matches (see `prunes`).
+    """
+
+    def __init__(
+        self, similarity_ratio: float, num_permutations: int = NUM_PERMUTATIONS
+    ):
+        self.bands, self.rows = choose_bands(
+            similarity_to_jaccard(similarity_ratio), num_permutations
+        )
+        rng = np.random.default_rng(_SEED)
+        # a < 2**31 and hashes < 2**32 keep a * x + b inside uint64
+        self._a = rng.integers(1, 1 << 31, size=(num_permutations, 1), dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=(num_permutations, 1), dtype=np.uint64)
+        self._buckets = [{} for _ in range(self.bands)]
+
+    @property
+    def prunes(self) -> bool:
+        """
+        False if the index is tuned with a single row per band, so it would propose
+        nearly every group as a candidate.
+        """
+        return self.rows > 1
+
+    def signature(self, message: str) -> np.ndarray:
+        hashes = shingle_hashes(message)
+        return ((self._a * hashes + self._b) % _MERSENNE_PRIME).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> list:
+        return [
+            signature[band * self.rows : (band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+
+    def add(self, message: str, group_index: int) -> None:
+        for bucket, key in zip(self._buckets, self._band_keys(self.signature(message))):
+            bucket.setdefault(key, []).append(group_index)
+
+    def query(self, message: str) -> list:
+        """
+        Returns the sorted indices of the groups that share at least one band with message.
+        """
+        candidates = set()
+        for bucket, key in zip(self._buckets, self._band_keys(self.signature(message))):
+            candidates.update(bucket.get(key, ()))
+        return sorted(candidates)
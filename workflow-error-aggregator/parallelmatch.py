@@ -0,0 +1,160 @@
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from similarity import DEFAULT_SIMILARITY_BACKEND, SIMILARITY_BACKENDS
+
+# Initial sizes of the shared memory blocks holding the group messages; both are doubled
+# when they are full.
+INITIAL_TEXT_SIZE = 1 << 20
+INITIAL_KEY_CAPACITY = 1 << 12
+# Each batch of messages is split into this many chunks per worker, to even out the load
+# as messages that match early are much cheaper than messages that match nothing.
+CHUNKS_PER_WORKER = 4
+
+# Group messages already decoded by this worker process: { "names": names of the shared
+# memory blocks, "blocks": attached blocks, "keys": decoded messages }
+_worker_state = {"names": None, "blocks": None, "keys": []}
+
+
+def _attach_keys(names: tuple, key_count: int) -> list:
+    """
+    Returns the first `key_count` group messages from the shared memory blocks `names`,
+    decoding only those this worker has not decoded yet.
+    """
+    if _worker_state["names"] != names:
+        if _worker_state["blocks"]:
+            for block in _worker_state["blocks"]:
+                block.close()
+        # the blocks are unlinked by the parent process, whose resource tracker the
+        # workers share
+        blocks = tuple(shared_memory.SharedMemory(name) for name in names)
+        _worker_state.update(names=names, blocks=blocks, keys=[])
+    keys = _worker_state["keys"]
+    if len(keys) < key_count:
+        text, ends = _worker_state["blocks"]
+        ends_view = ends.buf.cast("I")
+        start = ends_view[len(keys) - 1] if keys else 0
+        for index in range(len(keys), key_count):
+            end = ends_view[index]
+            keys.append(bytes(text.buf[start:end]).decode("utf-8"))
+            start = end
+        ends_view.release()
+    return keys
+
+
+def _match_messages(
+    names: tuple, key_count: int, messages: list, ratio: float, backend: str
+):
+    """
+    Worker task: returns, for each message, the index of the first of the `key_count`
+    shared group messages that is at least `ratio` similar by the similarity `backend`,
+    or -1, and the number of comparisons made.
+    """
+    keys = _attach_keys(names, key_count)
+    is_similar = SIMILARITY_BACKENDS[backend]
+    matches = array("i")
+    compared = 0
+    for message in messages:
+        match = -1
+        for index in range(key_count):
+            compared += 1
+            if is_similar(message, keys[index], ratio):
+                match = index
+                break
+        matches.append(match)
+    return matches, compared
+
+
+class ParallelMatcher:
+    """
+    Compares batches of messages with the messages of the existing groups across a pool
+    of worker processes.
+
+    Group messages only ever get appended, so they are kept in two shared memory blocks,
+    the UTF-8 text of all messages and an array of their end offsets, which each worker
+    decodes once. Tasks only carry the names of the blocks, the number of groups and a
+    chunk of messages to compare.
+
+    Args:
+        workers (int): number of worker processes; the number of CPUs if 0
+        truncation_length (int): messages are compared up to this many characters
+    """
+
+    def __init__(self, workers: int = 0, truncation_length: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.truncation_length = truncation_length
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.text = shared_memory.SharedMemory(create=True, size=INITIAL_TEXT_SIZE)
+        self.ends = shared_memory.SharedMemory(
+            create=True, size=INITIAL_KEY_CAPACITY * 4
+        )
+        self.text_size = 0
+        self.key_count = 0
+
+    def close(self) -> None:
+        self.executor.shutdown()
+        for block in (self.text, self.ends):
+            block.close()
+            block.unlink()
+
+    def _grow(self, block, size: int):
+        new_block = shared_memory.SharedMemory(create=True, size=size)
+        new_block.buf[: block.size] = block.buf[: block.size]
+        block.close()
+        block.unlink()
+        return new_block
+
+    def _share_keys(self, group_keys: list) -> None:
+        """
+        Appends the group messages that are not shared yet to the shared memory blocks.
+        """
+        for key in group_keys[self.key_count :]:
+            data = key[: self.truncation_length].encode("utf-8")
+            while self.text_size + len(data) > self.text.size:
+                self.text = self._grow(self.text, self.text.size * 2)
+            if (self.key_count + 1) * 4 > self.ends.size:
+                self.ends = self._grow(self.ends, self.ends.size * 2)
+            self.text.buf[self.text_size : self.text_size + len(data)] = data
+            self.text_size += len(data)
+            ends_view = self.ends.buf.cast("I")
+            ends_view[self.key_count] = self.text_size
+            ends_view.release()
+            self.key_count += 1
+
+    def match(
+        self,
+        messages: list,
+        group_keys: list,
+        similarity_ratio: float,
+        backend: str = DEFAULT_SIMILARITY_BACKEND,
+    ):
+        """
+        Returns, for each message, the index of the first group in `group_keys` whose
+        message is at least `similarity_ratio` similar, or None, and the number of
+        comparisons made. The result is the same as comparing the messages one by one
+        with `find_similar_group`.
+        """
+        self._share_keys(group_keys)
+        names = (self.text.name, self.ends.name)
+        truncated = [message[: self.truncation_length] for message in messages]
+        chunk_size = max(-(-len(truncated) // (self.workers * CHUNKS_PER_WORKER)), 1)
+        futures = [
+            self.executor.submit(
+                _match_messages,
+                names,
+                len(group_keys),
+                truncated[start : start + chunk_size],
+                similarity_ratio,
+                backend,
+            )
+            for start in range(0, len(truncated), chunk_size)
+        ]
+        matches = []
+        compared = 0
+        for future in futures:
+            chunk_matches, chunk_compared = future.result()
+            matches.extend(index if index >= 0 else None for index in chunk_matches)
+            compared += chunk_compared
+        return matches, compared
@@ -0,0 +1,341 @@
+import glob
+import json
+import os
+from datetime import datetime, timezone
+from typing import TextIO
+
+from loguru import logger
+
+from aggregate_workflow_errors import make_partial_aggregate
+from htmlwriter import (
+    get_env_url,
+    get_group_label,
+    get_group_message,
+    make_column_titles,
+    make_html_header,
+    make_html_text,
+)
+
+REPORT_MODES = ["table", "paged"]
+DEFAULT_REPORT_MODE = "table"
+REPORT_CHUNK_SIZE = 500  # workflows per data file of the paged report
+JSON_SCHEMA_VERSION = 1
+WORKFLOW_INFO_FIELDS = ["id", "created_at", "last_updated_at", "file_id"]
+
+
+def to_json(value) -> str:
+    """
+    Serializes a value as JSON; values JSON cannot represent (e.g. from parsed task
+    logs) are written as strings.
+    """
+    return json.dumps(value, default=str)
+
+
+def to_script_json(value) -> str:
+    """
+    Serializes a value as JSON that is safe to embed in an html <script> element.
+    """
+    return to_json(value).replace("</", "<\\/")
+
+
+def make_json_output(errors: list, params, pipeline_config: dict) -> None:
+    """
+    Writes the aggregated workflows as JSON, for other tools to consume.
+
+    The layout is versioned by "schema_version" and only changes in a backwards
+    compatible way within a version:
+
+        {
+            "schema_version": 1,
+            "generated_at": "<ISO-8601 UTC time>",
+            "status": "<FILTER>",
+            "similarity_ratio": <SIMILARITY_RATIO>,
+            "pipeline": {<pipeline configuration>},
+            "groups": [
+                {
+                    "index": <int>,
+                    "cluster_id": <stable cluster ID with CLUSTER_STORE, otherwise null>,
+                    "message": "<message of the group>",
+                    "count": <int>,
+                    "value": <extracted error of the first workflow of the group>,
+                    "workflows": [
+                        {"id": ..., "created_at": ..., "last_updated_at": ..., "file_id": ...},
+                        ...
+                    ]
+                },
+                ...
+            ]
+        }
+
+    Groups are written one at a time, so the whole document is never held in memory.
+    """
+    output_path = os.path.join(params.save_dir, f"{params.json_output_name}.json")
+    header = {
+        "schema_version": JSON_SCHEMA_VERSION,
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "status": params.filter,
+        "similarity_ratio": params.similarity_ratio,
+        "pipeline": pipeline_config,
+    }
+    with open(output_path, "wt") as fout:
+        fout.write(to_json(header)[:-1] + ', "groups": [')
+        for index, error in enumerate(errors):
+            group = {
+                "index": index,
+                "cluster_id": error.get("cluster_id"),
+                "message": get_group_message(error),
+                "count": error["count"],
+                "value": error["value"],
+                "workflows": [
+                    dict(zip(WORKFLOW_INFO_FIELDS, workflow_info))
+                    for workflow_info in error["workflow_info"]
+                ],
+            }
+            fout.write(("\n" if index == 0 else ",\n") + to_json(group))
+        fout.write("\n]}\n")
+    logger.info(f"Aggregated workflows are saved as JSON to {output_path}")
+
+
+def make_partial_output(errors: list, params, pipeline_config: dict) -> None:
+    """
+    Writes the aggregated workflows as a partial aggregate (see `make_partial_aggregate`),
+    to be merged with the partial aggregates of other shards of workflows.
+    """
+    output_path = os.path.join(params.save_dir, f"{params.partial_output_name}.json")
+    partial = make_partial_aggregate(
+        errors,
+        params.similarity_ratio,
+        status=params.filter,
+        message_key=params.message_key,
+        pipeline_config=pipeline_config,
+    )
+    with open(output_path, "wt") as fout:
+        fout.write(to_json(partial))
+    logger.info(f"Partial aggregate is saved to {output_path}")
+
+
+def make_paged_html_output(errors: list, params, pipeline_config: dict) -> None:
+    """
+    Creates a paged html report for the aggregated workflow errors, for aggregations too
+    large to open as a single table.
+
+    The index page (<HTML_OUTPUT_NAME>.html) only holds a summary of each group. The
+    workflows of each group are written to data files of `REPORT_CHUNK_SIZE` workflows in
+    the <HTML_OUTPUT_NAME>_data folder, which the page loads when a group is opened. Data
+    files are scripts that pass their JSON rows to the page, rather than plain JSON files,
+    so that the report also works when it is opened from disk (file://), where browsers
+    block loading JSON files.
+    """
+    data_dir_name = f"{params.html_output_name}_data"
+    data_dir = os.path.join(params.save_dir, data_dir_name)
+    os.makedirs(data_dir, exist_ok=True)
+    for stale_path in glob.glob(os.path.join(data_dir, "group-*.js")):
+        os.remove(stale_path)
+
+    summaries = []
+    for index, error in enumerate(errors):
+        workflow_info = error["workflow_info"]
+        chunk_count = 0
+        for chunk_start in range(0, len(workflow_info), REPORT_CHUNK_SIZE):
+            chunk_path = os.path.join(data_dir, f"group-{index}-{chunk_count}.js")
+            with open(chunk_path, "wt") as fout:
+                rows = workflow_info[chunk_start : chunk_start + REPORT_CHUNK_SIZE]
+                fout.write(
+                    f"weaReport.load({index}, {chunk_count}, {to_script_json([list(row) for row in rows])});\n"
+                )
+            chunk_count += 1
+        summaries.append({"count": error["count"], "chunks": chunk_count})
+
+    output_path = os.path.join(params.save_dir, f"{params.html_output_name}.html")
+    with open(output_path, "wt") as fout:
+        fout.write("<!DOCTYPE html>\n<html>\n<head>\n<meta charset='utf-8'>\n")
+        fout.write(f"<style>{REPORT_STYLE}</style>\n</head>\n<body>\n")
+        fout.write(
+            make_html_header(
+                pipeline_config,
+                version=params.platform_version,
+                status=params.filter,
+            )
+        )
+        write_paged_table(fout, errors, status=params.filter)
+        settings = {
+            "envUrl": get_env_url(params),
+            "dataDir": data_dir_name,
+            "chunkSize": REPORT_CHUNK_SIZE,
+            "groups": summaries,
+        }
+        fout.write(
+            f"<script>\nvar weaReport = {REPORT_SCRIPT.strip()};\n"
+            f"weaReport.init({to_script_json(settings)});\n</script>\n"
+        )
+        fout.write("</body>\n</html>\n")
+    logger.info(
+        f"Paged aggregated workflow report is saved to {output_path}, with workflow data in {data_dir}"
+    )
+
+
+def write_paged_table(fout: TextIO, errors: list, status: str = "failed") -> None:
+    """
+    Writes the summary table of the paged report, one row per group. The workflows of a
+    group are shown in its row when it is opened.
+    """
+    value, count, workflow_info = make_column_titles(status)
+    fout.write(
+        "<p><input id='wea-search' type='search' size='60' "
+        "placeholder='Search messages' oninput='weaReport.searchGroups(this.value)'></p>\n"
+    )
+    fout.write('<table border="1" class="dataframe wea-report">\n  <thead>\n')
+    fout.write('    <tr style="text-align: left;">\n      <th></th>\n')
+    fout.write(f"      <th>{value}</th>\n      <th>{count}</th>\n")
+    fout.write(f"      <th>{workflow_info}</th>\n    </tr>\n  </thead>\n  <tbody>\n")
+    for index, error in enumerate(errors):
+        fout.write(f'    <tr class="wea-group" data-group="{index}">\n')
+        fout.write(f"      <th>{get_group_label(index, error)}</th>\n")
+        fout.write(
+            f"      <td class='wea-message'>{make_html_text(get_group_message(error))}</td>\n"
+        )
+        fout.write(f"      <td>{error['count']}</td>\n")
+        fout.write(
+            f"      <td><button type='button' onclick='weaReport.toggle({index})'>Show workflows</button>"
+            f"<div id='wea-workflows-{index}' hidden></div></td>\n"
+        )
+        fout.write("    </tr>\n")
+    fout.write("  </tbody>\n</table>\n")
+
+
+REPORT_STYLE = """
+.wea-report { border-collapse: collapse; }
+.wea-report tr { text-align: left; vertical-align: top; }
+.wea-report th:nth-child(2), .wea-report td:nth-child(2) { min-width: 512px; }
+.wea-report th:nth-child(4), .wea-report td:nth-child(4) { min-width: 520px; }
+.wea-message, .wea-rows { font-family: "Courier New", Courier, monospace; font-size: 80%; }
+.wea-pager { margin: 4px 0; }
+"""
+
+# Client-side paging and search for the paged report. Data files call weaReport.load().
+REPORT_SCRIPT = """
+{
+  init: function (settings) {
+    this.settings = settings;
+    this.chunks = {};
+    this.callbacks = {};
+    this.pages = {};
+    this.filters = {};
+  },
+  load: function (group, chunk, rows) {
+    var key = group + "-" + chunk;
+    this.chunks[key] = rows;
+    (this.callbacks[key] || []).forEach(function (callback) { callback(rows); });
+    delete this.callbacks[key];
+  },
+  getChunk: function (group, chunk, callback) {
+    var key = group + "-" + chunk;
+    if (this.chunks[key]) { callback(this.chunks[key]); return; }
+    if (this.callbacks[key]) { this.callbacks[key].push(callback); return; }
+    this.callbacks[key] = [callback];
+    var script = document.createElement("script");
+    script.src = this.settings.dataDir + "/group-" + key + ".js";
+    script.onerror = function () { alert("Could not load " + script.src); };
+    document.head.appendChild(script);
+  },
+  getAllChunks: function (group, callback) {
+    var self = this, count = this.settings.groups[group].chunks, rows = [], loaded = 0;
+    if (count === 0) { callback(rows); return; }
+    for (var chunk = 0; chunk < count; chunk++) {
+      this.getChunk(group, chunk, function () {
+        if (++loaded < count) return;
+        for (var index = 0; index < count; index++) {
+          rows = rows.concat(self.chunks[group + "-" + index]);
+        }
+        callback(rows);
+      });
+    }
+  },
+  toggle: function (group) {
+    var panel = document.getElementById("wea-workflows-" + group);
+    panel.hidden = !panel.hidden;
+    if (!panel.hidden && !panel.firstChild) this.showPage(group, 0);
+  },
+  makeLink: function (url, text) {
+    var link = document.createElement("a");
+    link.href = url;
+    link.target = "_blank";
+    link.textContent = text;
+    return link;
+  },
+  renderRows: function (rows) {
+    var list = document.createElement("div"), envUrl = this.settings.envUrl, self = this;
+    list.className = "wea-rows";
+    rows.forEach(function (row) {
+      var line = document.createElement("div");
+      line.appendChild(self.makeLink(envUrl + "workflows/" + row[0], row[0]));
+      line.appendChild(document.createTextNode(", " + row[2] + ", "));
+      line.appendChild(self.makeLink(
+        envUrl + "file-details/" + row[3] + "?pipelineId=" + row[0], "raw file"));
+      list.appendChild(line);
+    });
+    return list;
+  },
+  renderPanel: function (group, label, rows, page, pageCount) {
+    var self = this, panel = document.getElementById("wea-workflows-" + group);
+    var pager = document.createElement("div");
+    pager.className = "wea-pager";
+    var previous = document.createElement("button");
+    previous.type = "button";
+    previous.textContent = "<";
+    previous.disabled = page <= 0;
+    previous.onclick = function () { self.showPage(group, page - 1); };
+    var next = document.createElement("button");
+    next.type = "button";
+    next.textContent = ">";
+    next.disabled = page >= pageCount - 1;
+    next.onclick = function () { self.showPage(group, page + 1); };
+    var search = document.createElement("input");
+    search.type = "search";
+    search.placeholder = "Search workflows";
+    search.value = this.filters[group] || "";
+    search.onchange = function () { self.searchWorkflows(group, search.value); };
+    pager.appendChild(previous);
+    pager.appendChild(document.createTextNode(" " + label + " "));
+    pager.appendChild(next);
+    pager.appendChild(document.createTextNode(" "));
+    pager.appendChild(search);
+    panel.replaceChildren(pager, this.renderRows(rows));
+  },
+  showPage: function (group, page) {
+    var self = this, pageCount = this.settings.groups[group].chunks;
+    this.pages[group] = page;
+    if (this.filters[group]) { this.searchWorkflows(group, this.filters[group], page); return; }
+    if (pageCount === 0) { this.renderPanel(group, "no workflows", [], 0, 0); return; }
+    this.getChunk(group, page, function (rows) {
+      var first = page * self.settings.chunkSize;
+      self.renderPanel(group, (first + 1) + "-" + (first + rows.length) + " of " +
+        self.settings.groups[group].count, rows, page, pageCount);
+    });
+  },
+  searchWorkflows: function (group, text, page) {
+    var self = this, size = this.settings.chunkSize;
+    this.filters[group] = text;
+    if (!text) { this.showPage(group, 0); return; }
+    page = page || 0;
+    this.getAllChunks(group, function (rows) {
+      var needle = text.toLowerCase();
+      var matches = rows.filter(function (row) {
+        return row.join(" ").toLowerCase().indexOf(needle) !== -1;
+      });
+      var pageCount = Math.max(1, Math.ceil(matches.length / size));
+      page = Math.min(page, pageCount - 1);
+      var pageRows = matches.slice(page * size, (page + 1) * size);
+      self.renderPanel(group, matches.length + " matching, page " + (page + 1) + " of " +
+        pageCount, pageRows, page, pageCount);
+    });
+  },
+  searchGroups: function (text) {
+    var needle = text.toLowerCase();
+    document.querySelectorAll(".wea-group").forEach(function (row) {
+      var message = row.querySelector(".wea-message").textContent.toLowerCase();
+      row.hidden = needle !== "" && message.indexOf(needle) === -1;
+    });
+  }
+}
+"""
@@ -0,0 +1,295 @@
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from loguru import logger
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+METRICS_SCHEMA_VERSION = 1
+LATENCY_PERCENTILES = [50, 90, 99]
+# a stage is reported as a regression if it is this much slower than in the baseline...
+REGRESSION_THRESHOLD = 1.2
+# ...and took at least this many seconds, so that noise in short stages is ignored
+REGRESSION_MIN_WALL_TIME = 0.5
+
+
+def percentile(values: list, percent: float) -> float:
+    """
+    Returns the nearest-rank percentile of a list of values, or None if it is empty.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def get_peak_rss() -> int:
+    """
+    Returns the peak resident set size of the process in bytes, or None if unknown.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RunMetrics:
+    """
+    Collects performance metrics of a run: wall and CPU time per stage, HTTP requests
+    (count, failures, retries, latencies and bytes downloaded), the number of message
+    similarity comparisons and the peak memory use of the process.
+
+    A single instance, `metrics`, is shared by the modules of the program. HTTP metrics
+    may be recorded from several threads at once.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.started_at = datetime.now(timezone.utc)
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.stages = {}  # { stage: {"wall_time": s, "cpu_time": s} }
+        self.requests = 0
+        self.failed_requests = 0
+        self.retries = 0
+        self.latencies = []
+        self.bytes_downloaded = 0
+        self.comparisons = 0
+        self.counts = {}  # e.g. { "workflows": int, "groups": int }
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Context manager that adds the wall and CPU time of its block to a stage. If a
+        stage runs in several threads at once, e.g. for several pipelines, their times
+        add up. CPU time is that of the whole process.
+        """
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - wall_start
+            cpu_time = time.process_time() - cpu_start
+            with self.lock:
+                stage = self.stages.setdefault(
+                    name, {"wall_time": 0.0, "cpu_time": 0.0}
+                )
+                stage["wall_time"] += wall_time
+                stage["cpu_time"] += cpu_time
+
+    def record_request(
+        self, latency: float, bytes_downloaded: int = 0, failed: bool = False
+    ) -> None:
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            self.bytes_downloaded += bytes_downloaded
+            if failed:
+                self.failed_requests += 1
+
+    def add_count(self, item: str, count: int) -> None:
+        with self.lock:
+            self.counts[item] = self.counts.get(item, 0) + count
+
+    def record_retry(self) -> None:
+        with self.lock:
+            self.retries += 1
+
+    def summary(self) -> dict:
+        """
+        Returns the metrics of the run so far as a JSON-serializable dict.
+        """
+        latency = {
+            f"p{percent}": percentile(self.latencies, percent)
+            for percent in LATENCY_PERCENTILES
+        }
+        latency["max"] = max(self.latencies, default=None)
+        latency["mean"] = (
+            sum(self.latencies) / len(self.latencies) if self.latencies else None
+        )
+        return {
+            "schema_version": METRICS_SCHEMA_VERSION,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "total": {
+                "wall_time": time.perf_counter() - self.wall_start,
+                "cpu_time": time.process_time() - self.cpu_start,
+            },
+            "stages": self.stages,
+            "http": {
+                "requests": self.requests,
+                "failed_requests": self.failed_requests,
+                "retries": self.retries,
+                "bytes_downloaded": self.bytes_downloaded,
+                "latency": latency,
+            },
+            "similarity_comparisons": self.comparisons,
+            "peak_rss_bytes": get_peak_rss(),
+            "counts": self.counts,
+        }
+
+
+metrics = RunMetrics()
+
+
+def compare_to_baseline(summary: dict, baseline: dict) -> dict:
+    """
+    Compares the wall time of each stage, and of the whole run, with a previous run's
+    summary. Stages that became more than `REGRESSION_THRESHOLD` times slower (and took
+    at least `REGRESSION_MIN_WALL_TIME` seconds) are flagged as regressions.
+
+    Returns:
+        (dict): { stage: {"wall_time", "baseline_wall_time", "ratio", "regression"} }
+    """
+    pairs = {"total": (summary["total"], baseline.get("total", {}))}
+    for stage, values in summary["stages"].items():
+        pairs[stage] = (values, baseline.get("stages", {}).get(stage, {}))
+
+    comparison = {}
+    for stage, (values, baseline_values) in pairs.items():
+        wall_time = values["wall_time"]
+        baseline_wall_time = baseline_values.get("wall_time")
+        ratio = wall_time / baseline_wall_time if baseline_wall_time else None
+        comparison[stage] = {
+            "wall_time": wall_time,
+            "baseline_wall_time": baseline_wall_time,
+            "ratio": ratio,
+            "regression": ratio is not None
+            and ratio > REGRESSION_THRESHOLD
+            and wall_time >= REGRESSION_MIN_WALL_TIME,
+        }
+    return comparison
+
+
+def make_prometheus_text(summary: dict, labels: dict) -> str:
+    """
+    Formats a run summary in the Prometheus text exposition format, e.g. for the
+    node_exporter textfile collector.
+    """
+    label_str = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    lines = []
+
+    def add_metric(name: str, help_text: str, samples: list) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for extra_labels, value in samples:
+            if value is None:
+                continue
+            all_labels = ",".join(filter(None, [label_str, extra_labels]))
+            lines.append(f"{name}{{{all_labels}}} {value}")
+
+    stages = summary["stages"]
+    add_metric(
+        "wea_stage_wall_seconds",
+        "Wall time of each stage of the last run.",
+        [(f'stage="{stage}"', values["wall_time"]) for stage, values in stages.items()]
+        + [('stage="total"', summary["total"]["wall_time"])],
+    )
+    add_metric(
+        "wea_stage_cpu_seconds",
+        "CPU time of each stage of the last run.",
+        [(f'stage="{stage}"', values["cpu_time"]) for stage, values in stages.items()]
+        + [('stage="total"', summary["total"]["cpu_time"])],
+    )
+    http = summary["http"]
+    add_metric("wea_http_requests", "HTTP requests made.", [("", http["requests"])])
+    add_metric(
+        "wea_http_failed_requests",
+        "HTTP requests that failed.",
+        [("", http["failed_requests"])],
+    )
+    add_metric(
+        "wea_http_retries", "HTTP requests that were retried.", [("", http["retries"])]
+    )
+    add_metric(
+        "wea_http_downloaded_bytes",
+        "Bytes downloaded from the API.",
+        [("", http["bytes_downloaded"])],
+    )
+    add_metric(
+        "wea_http_latency_seconds",
+        "HTTP request latency percentiles.",
+        [
+            (f'quantile="{percent / 100}"', http["latency"][f"p{percent}"])
+            for percent in LATENCY_PERCENTILES
+        ],
+    )
+    add_metric(
+        "wea_similarity_comparisons",
+        "Message similarity comparisons made.",
+        [("", summary["similarity_comparisons"])],
+    )
+    add_metric(
+        "wea_peak_rss_bytes",
+        "Peak resident set size of the process.",
+        [("", summary["peak_rss_bytes"])],
+    )
+    add_metric(
+        "wea_count",
+        "Numbers of workflows and groups of the last run.",
+        [(f'item="{item}"', count) for item, count in summary["counts"].items()],
+    )
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(params) -> None:
+    """
+    Logs the metrics of the run and writes them as configured: a JSON summary, a
+    Prometheus textfile, and a comparison with a baseline summary.
+    """
+    summary = metrics.summary()
+    summary["pipeline_id"] = params.pipeline_id
+
+    for stage, values in summary["stages"].items():
+        logger.info(
+            f"Stage {stage}: {values['wall_time']:.2f} s wall time, {values['cpu_time']:.2f} s CPU time."
+        )
+    http = summary["http"]
+    if http["requests"]:
+        logger.info(
+            f"{http['requests']} API requests ({http['failed_requests']} failed, {http['retries']} retries), {http['bytes_downloaded']} bytes downloaded, median latency {http['latency']['p50']:.3f} s."
+        )
+
+    if params.metrics_baseline:
+        try:
+            with open(params.metrics_baseline, "rt") as fin:
+                baseline = json.load(fin)
+        except (OSError, ValueError) as err:
+            logger.warning(f"Baseline metrics could not be read: {err}")
+        else:
+            summary["baseline_comparison"] = compare_to_baseline(summary, baseline)
+            for stage, values in summary["baseline_comparison"].items():
+                if values["regression"]:
+                    logger.warning(
+                        f"Stage {stage} took {values['wall_time']:.2f} s, {values['ratio']:.2f} times as long as in the baseline ({values['baseline_wall_time']:.2f} s)."
+                    )
+
+    if params.metrics_output_name:
+        output_path = os.path.join(
+            params.save_dir, f"{params.metrics_output_name}.json"
+        )
+        with open(output_path, "wt") as fout:
+            json.dump(summary, fout, indent=2)
+        logger.info(f"Run metrics are saved to {output_path}")
+
+    if params.prometheus_textfile:
+        # written to a temporary file first, so a collector never reads a partial file
+        tmp_path = f"{params.prometheus_textfile}.{os.getpid()}.tmp"
+        with open(tmp_path, "wt") as fout:
+            fout.write(
+                make_prometheus_text(summary, {"pipeline_id": params.pipeline_id})
+            )
+        os.replace(tmp_path, params.prometheus_textfile)
+        logger.info(f"Prometheus metrics are saved to {params.prometheus_textfile}")
@@ -0,0 +1,108 @@
+import re
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+# Similarity backends decide whether two (truncated) messages are at least
+# `similarity_ratio` similar: backend(message, group_message, similarity_ratio) -> bool.
+# Backends only need to answer that question, so they can stop as soon as a bound rules
+# out a match instead of computing the full similarity.
+DEFAULT_SIMILARITY_BACKEND = "sequence"
+TOKEN_PATTERN = re.compile(r"\w+")
+# token sets cached by `get_token_set`, mostly those of group messages
+TOKEN_CACHE_SIZE = 1 << 16
+
+
+def sequence_similar(message: str, other: str, similarity_ratio: float) -> bool:
+    """
+    `SequenceMatcher.ratio()`, computed in full for every pair.
+    """
+    return SequenceMatcher(None, message, other).ratio() >= similarity_ratio
+
+
+def bounded_sequence_similar(message: str, other: str, similarity_ratio: float) -> bool:
+    """
+    `SequenceMatcher.ratio()`, only computed for pairs that pass its cheaper upper
+    bounds: the length ratio (what `real_quick_ratio()` returns, without building a
+    matcher) and `quick_ratio()`. Gives the same result as `sequence_similar`.
+    """
+    total = len(message) + len(other)
+    if total and 2.0 * min(len(message), len(other)) / total < similarity_ratio:
+        return False
+    matcher = SequenceMatcher(None, message, other)
+    return (
+        matcher.quick_ratio() >= similarity_ratio
+        and matcher.ratio() >= similarity_ratio
+    )
+
+
+def levenshtein_within(message: str, other: str, max_distance: int) -> bool:
+    """
+    Returns whether the Levenshtein distance of two strings is at most `max_distance`.
+    Only the diagonal band of the distance matrix that can stay within `max_distance` is
+    computed, and the computation stops as soon as a whole row exceeds it.
+    """
+    if abs(len(message) - len(other)) > max_distance:
+        return False
+    if not other:
+        return len(message) <= max_distance
+    out_of_reach = max_distance + 1
+    previous = [min(j, out_of_reach) for j in range(len(other) + 1)]
+    for i, char in enumerate(message, 1):
+        current = [out_of_reach] * (len(other) + 1)
+        current[0] = min(i, out_of_reach)
+        row_min = current[0]
+        for j in range(max(1, i - max_distance), min(len(other), i + max_distance) + 1):
+            distance = min(
+                previous[j - 1] + (char != other[j - 1]),
+                current[j - 1] + 1,
+                previous[j] + 1,
+                out_of_reach,
+            )
+            current[j] = distance
+            if distance < row_min:
+                row_min = distance
+        if row_min > max_distance:
+            return False
+        previous = current
+    return previous[-1] <= max_distance
+
+
+def levenshtein_similar(message: str, other: str, similarity_ratio: float) -> bool:
+    """
+    Normalized Levenshtein similarity, 1 - distance / length of the longer message,
+    with the distance computed up to the most edits `similarity_ratio` allows.
+    """
+    longest = max(len(message), len(other))
+    if not longest:
+        return True
+    # rounded down, with a margin for ratios like 0.7 that are not exact in binary
+    max_distance = int((1 - similarity_ratio) * longest + 1e-9)
+    return levenshtein_within(message, other, max_distance)
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def get_token_set(message: str) -> frozenset:
+    return frozenset(TOKEN_PATTERN.findall(message))
+
+
+def jaccard_similar(message: str, other: str, similarity_ratio: float) -> bool:
+    """
+    Jaccard similarity of the sets of word tokens of the messages. Word order and
+    repeated words are ignored, so this is the fastest backend but also the coarsest.
+    """
+    tokens, other_tokens = get_token_set(message), get_token_set(other)
+    if not tokens or not other_tokens:
+        return message == other
+    smaller, larger = sorted((len(tokens), len(other_tokens)))
+    if smaller / larger < similarity_ratio:  # the Jaccard similarity's upper bound
+        return False
+    shared = len(tokens & other_tokens)
+    return shared / (len(tokens) + len(other_tokens) - shared) >= similarity_ratio
+
+
+SIMILARITY_BACKENDS = {
+    "sequence": sequence_similar,
+    "bounded": bounded_sequence_similar,
+    "levenshtein": levenshtein_similar,
+    "jaccard": jaccard_similar,
+}
@@ -0,0 +1,141 @@
+import re
+from hashlib import sha1
+from typing import List, NamedTuple
+
+WILDCARD = "<*>"
+
+# Masks applied before tokenizing, in order. Earlier patterns take precedence, e.g. a
+# UUID is masked as a whole before its digits could be masked as numbers.
+MASKING_PATTERNS = [
+    (
+        "<UUID>",
+        r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b",
+    ),
+    (
+        "<TIMESTAMP>",
+        r"\b\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?\b",
+    ),
+    ("<PATH>", r"(?:[\w.-]+:/)?/?(?:[\w.@%+=-]+/)+[\w.@%+=-]*"),
+    (
+        "<HEX>",
+        r"\b0[xX][0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)(?=[0-9a-fA-F]*[a-fA-F])[0-9a-fA-F]{8,}\b",
+    ),
+    ("<NUM>", r"(?<![\w.])[-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b"),
+]
+_MASKING_REGEX = re.compile(
+    "|".join(
+        f"(?P<m{index}>{pattern})"
+        for index, (_, pattern) in enumerate(MASKING_PATTERNS)
+    )
+)
+
+# Minimum fraction of matching token positions for a message to join a template cluster.
+DEFAULT_TEMPLATE_SIMILARITY = 0.6
+# Number of leading tokens used, with the token count, to bucket messages (Drain's tree depth).
+PREFIX_DEPTH = 1
+
+
+class MessageTemplate(NamedTuple):
+    template_id: str
+    template: str
+    parameters: list
+
+
+def mask_message(message: str):
+    """
+    Replaces variable tokens (UUIDs, timestamps, file keys/paths, hex values and numbers)
+    with placeholders.
+
+    Returns:
+        (str): masked message
+        (list): masked values, in order of appearance
+    """
+    parameters = []
+
+    def replace(match: re.Match) -> str:
+        parameters.append(match.group(0))
+        return MASKING_PATTERNS[int(match.lastgroup[1:])][0]
+
+    return _MASKING_REGEX.sub(replace, message), parameters
+
+
+def _token_similarity(template: list, tokens: list) -> float:
+    matches = sum(
+        1 for t, token in zip(template, tokens) if t == token or t == WILDCARD
+    )
+    return matches / len(tokens) if tokens else 1.0
+
+
+class TemplateMiner:
+    """
+    Drain-style log template miner.
+
+    Messages are masked, split on whitespace and bucketed by token count and leading
+    tokens. Within a bucket, a message joins the template with the most matching token
+    positions, if at least a `similarity` fraction of them match; token positions that
+    differ become wildcards.
+    """
+
+    def __init__(self, similarity: float = DEFAULT_TEMPLATE_SIMILARITY):
+        self.similarity = similarity
+        self._buckets = {}  # { (token count, *leading tokens): [template token lists] }
+
+    @staticmethod
+    def _bucket_key(tokens: list) -> tuple:
+        # leading tokens that are placeholders are not used to bucket messages
+        prefix = tuple(
+            WILDCARD if token.startswith("<") and token.endswith(">") else token
+            for token in tokens[:PREFIX_DEPTH]
+        )
+        return (len(tokens), *prefix)
+
+    def _find(self, tokens: list):
+        best, best_similarity = None, -1.0
+        for template in self._buckets.get(self._bucket_key(tokens), []):
+            similarity = _token_similarity(template, tokens)
+            if similarity >= self.similarity and similarity > best_similarity:
+                best, best_similarity = template, similarity
+        return best
+
+    def add(self, message: str) -> None:
+        """
+        Learns the template of a message, generalizing an existing template if needed.
+        """
+        tokens = mask_message(message)[0].split()
+        template = self._find(tokens)
+        if template is None:
+            self._buckets.setdefault(self._bucket_key(tokens), []).append(tokens)
+            return
+        for position, token in enumerate(tokens):
+            if template[position] != token:
+                template[position] = WILDCARD
+
+    def match(self, message: str) -> MessageTemplate:
+        """
+        Returns the learned template of a message and the values of its variable parts.
+        """
+        masked, parameters = mask_message(message)
+        tokens = masked.split()
+        template = self._find(tokens) or tokens
+        parameters = parameters + [
+            token for t, token in zip(template, tokens) if t == WILDCARD
+        ]
+        template_str = " ".join(template)
+        template_id = sha1(template_str.encode("utf-8")).hexdigest()[:12]
+        return MessageTemplate(template_id, template_str, parameters)
+
+
+def mine_templates(
+    messages: List[str], similarity: float = DEFAULT_TEMPLATE_SIMILARITY
+) -> List[MessageTemplate]:
+    """
+    Returns the template of each message. Templates are learned from all messages first,
+    so every message is matched against its final, fully generalized template, and all
+    messages sharing a template get the same template ID.
+    """
+    unique_messages = dict.fromkeys(messages)
+    miner = TemplateMiner(similarity)
+    for message in unique_messages:
+        miner.add(message)
+    templates = {message: miner.match(message) for message in unique_messages}
+    return [templates[message] for message in messages]
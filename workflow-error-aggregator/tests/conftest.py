@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the WEA modules are imported by name, like the scripts in this folder import them, and
+# the synthetic workflow generator is shared with the benchmarks
+FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, FOLDER)
+sys.path.insert(0, os.path.join(FOLDER, "benchmarks"))
@@ -0,0 +1,50 @@
+from aggregate_workflow_errors import (
+    aggregate_workflow_errors,
+    workflow_result_to_dataframe,
+)
+from clusterstore import make_signature
+from synthetic import make_workflows
+
+
+def aggregate(messages: list, clusters: list) -> list:
+    workflows = make_workflows(len(messages), duplicate_rate=0, log_ratio=0, seed=3)
+    for workflow, message in zip(workflows, messages):
+        workflow["tasks"][0]["output"]["result"]["message"] = message
+    errors, _ = aggregate_workflow_errors(
+        workflow_result_to_dataframe(workflows), 0.8, clusters=clusters
+    )
+    return errors
+
+
+def make_cluster(cluster_id: int, message: str) -> dict:
+    return {
+        "cluster_id": cluster_id,
+        "message": message,
+        "signature": make_signature(message),
+    }
+
+
+def test_message_with_the_signature_of_a_cluster_joins_it_if_similar():
+    cluster = make_cluster(7, "File /data/plate_1.csv has 12 rows")
+    errors = aggregate(["File /data/plate_2.csv has 96 rows"], [cluster])
+    assert [error["cluster_id"] for error in errors] == [7]
+
+
+def test_message_with_the_signature_of_a_cluster_is_still_compared():
+    # the masked messages are equal, but the paths make up most of them
+    cluster = make_cluster(7, "Missing /data/2022/instrument_a/run_1/plate_1.csv")
+    message = "Missing /srv/uploads/other_lab/batch_99/export.csv"
+    assert make_signature(message) == cluster["signature"]
+    errors = aggregate([message], [cluster])
+    assert [error["cluster_id"] for error in errors] == [None]
+    assert errors[0]["key"] == message
+
+
+def test_groups_are_reported_in_the_order_of_their_first_workflow():
+    clusters = [make_cluster(1, "Unknown instrument"), make_cluster(2, "Timeout")]
+    errors = aggregate(["Timeout", "Bad header", "Unknown instrument"], clusters)
+    assert [error["key"] for error in errors] == [
+        "Timeout",
+        "Bad header",
+        "Unknown instrument",
+    ]
@@ -0,0 +1,79 @@
+import json
+
+import pandas as pd
+
+from aggregate_workflow_errors import (
+    add_message_signatures,
+    aggregate_workflow_errors,
+    parse_task_log,
+)
+from errorsignature import make_error_signature
+
+KEY_ERROR = """Traceback (most recent call last):
+  File "/app/main.py", line 12, in run
+    parse(f)
+  File "/app/parser.py", line 88, in read_row
+    return row["sample"]
+KeyError: 'sample'
+"""
+VALUE_ERROR = """Traceback (most recent call last):
+  File "/app/upload.py", line 7, in put
+    size = int(header)
+ValueError: invalid literal for int() with base 10: 'abc'
+"""
+
+
+def make_log(message: str) -> str:
+    return "\n".join(
+        [
+            json.dumps({"level": "info", "message": "Task started"}),
+            json.dumps({"level": "error", "message": message}),
+            json.dumps({"level": "info", "message": "Task finished"}),
+        ]
+    )
+
+
+def make_record(workflow_id: str, task_log=None, master_script_logs=None) -> dict:
+    return {
+        "id": workflow_id,
+        "createdAt": "2024-01-01T00:00:00Z",
+        "lastUpdatedAt": "2024-01-01T00:00:00Z",
+        "tasks": [{"log": task_log}],
+        "task_output": None,
+        "task_log": parse_task_log(task_log) if task_log else None,
+        "masterScriptLogs": master_script_logs,
+        "file_id": f"file-{workflow_id}",
+    }
+
+
+def test_tracebacks_in_logs_are_signed_by_their_log_message():
+    workflows = pd.DataFrame(
+        [
+            make_record("1", task_log=make_log(KEY_ERROR)),
+            make_record("2", task_log=make_log(VALUE_ERROR)),
+            make_record(
+                "3", master_script_logs=[{"level": "error", "message": KEY_ERROR}]
+            ),
+        ]
+    )
+    signatures = add_message_signatures(workflows)["signature"].tolist()
+    assert signatures == [
+        "KeyError: 'sample' @ parser.py:read_row < main.py:run",
+        "ValueError: invalid literal for int() with base <NUM>: 'abc' @ upload.py:put",
+        "KeyError: 'sample' @ parser.py:read_row < main.py:run",
+    ]
+
+    errors, _ = aggregate_workflow_errors(
+        add_message_signatures(workflows), message_field="signature"
+    )
+    assert sorted(error["count"] for error in errors) == [1, 2]
+
+
+def test_messages_without_stack_trace_are_returned_unchanged():
+    for message in ["plain error 123", "escaped\\nline", 'quoted \\"value\\"']:
+        assert make_error_signature(message) == message
+
+
+def test_escaped_tracebacks_are_signed():
+    escaped = KEY_ERROR.replace("\n", "\\n")
+    assert make_error_signature(escaped) == make_error_signature(KEY_ERROR)
@@ -0,0 +1,46 @@
+from loguru import logger
+
+from aggregate_workflow_errors import (
+    aggregate_workflow_errors,
+    workflow_result_to_dataframe,
+)
+from lshindex import MinHashLSHIndex
+from synthetic import make_workflows
+
+
+def get_groups(errors: list) -> set:
+    return {
+        frozenset(summary[0] for summary in error["workflow_info"]) for error in errors
+    }
+
+
+def test_index_only_prunes_at_high_ratios():
+    assert not MinHashLSHIndex(0.5).prunes
+    assert not MinHashLSHIndex(0.6).prunes
+    assert MinHashLSHIndex(0.8).prunes
+
+
+def test_low_ratio_falls_back_to_exhaustive():
+    messages = []
+    handler = logger.add(messages.append, level="WARNING")
+    workflow_df = workflow_result_to_dataframe(make_workflows(200, seed=3))
+    try:
+        lsh_errors, _ = aggregate_workflow_errors(workflow_df, 0.5, engine="lsh")
+    finally:
+        logger.remove(handler)
+    exhaustive_errors, _ = aggregate_workflow_errors(workflow_df, 0.5)
+    assert get_groups(lsh_errors) == get_groups(exhaustive_errors)
+    assert any("cannot prune" in message for message in messages)
+
+
+def test_high_ratio_matches_exhaustive_on_synthetic_workflows():
+    workflow_df = workflow_result_to_dataframe(
+        make_workflows(400, duplicate_rate=0, seed=4)
+    )
+    lsh_errors, _ = aggregate_workflow_errors(
+        workflow_df, 0.9, engine="lsh", similarity="bounded"
+    )
+    exhaustive_errors, _ = aggregate_workflow_errors(
+        workflow_df, 0.9, similarity="bounded"
+    )
+    assert get_groups(lsh_errors) == get_groups(exhaustive_errors)
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from aggregate_workflow_errors import (
+    aggregate_workflow_errors,
+    make_partial_aggregate,
+    merge_partial_aggregates,
+    workflow_result_to_dataframe,
+)
+from synthetic import make_workflows
+
+
+def make_partials(workflow_df, similarity_ratio: float, shard_count: int) -> list:
+    """
+    Returns the partial aggregates of consecutive shards of the workflows, as they are
+    read back from their JSON files.
+    """
+    shard_size = -(-len(workflow_df) // shard_count)
+    partials = []
+    for start in range(0, len(workflow_df), shard_size):
+        errors, _ = aggregate_workflow_errors(
+            workflow_df.iloc[start : start + shard_size],
+            similarity_ratio,
+            similarity="bounded",
+        )
+        partial = make_partial_aggregate(errors, similarity_ratio)
+        partials.append(json.loads(json.dumps(partial, default=str)))
+    return partials
+
+
+def get_groups(errors: list) -> list:
+    return [
+        (error["key"], error["count"], [tuple(info) for info in error["workflow_info"]])
+        for error in errors
+    ]
+
+
+@pytest.fixture(scope="module")
+def workflow_df():
+    return workflow_result_to_dataframe(make_workflows(400, duplicate_rate=0, seed=7))
+
+
+def test_merged_shards_match_a_single_run_at_ratio_1(workflow_df):
+    errors, file_ids = aggregate_workflow_errors(workflow_df, 1)
+    partials = make_partials(workflow_df, 1, shard_count=3)
+    # a workflow in several partial aggregates is only counted once
+    merged, merged_file_ids = merge_partial_aggregates(partials + partials[:1], 1)
+    assert get_groups(merged) == get_groups(errors)
+    assert sorted(merged_file_ids) == sorted(file_ids)
+
+
+def test_merged_shards_match_a_single_run_on_distinct_templates_at_ratio_0_8(
+    workflow_df,
+):
+    # not guaranteed below a ratio of 1, but the case for these workflows, most of which
+    # are in groups of their own
+    errors, _ = aggregate_workflow_errors(workflow_df, 0.8, similarity="bounded")
+    partials = make_partials(workflow_df, 0.8, shard_count=2)
+    merged, _ = merge_partial_aggregates(partials, 0.8, similarity="bounded")
+    assert get_groups(merged) == get_groups(errors)
+
+
+def test_merged_shards_count_each_workflow_once_at_ratio_0_5(workflow_df):
+    errors, _ = aggregate_workflow_errors(workflow_df, 0.5, similarity="bounded")
+    partials = make_partials(workflow_df, 0.5, shard_count=2)
+    merged, _ = merge_partial_aggregates(
+        partials + partials[:1], 0.5, similarity="bounded"
+    )
+    merged_ids = [info[0] for error in merged for info in error["workflow_info"]]
+    assert sorted(merged_ids) == sorted(workflow_df["id"])
+    # groups are merged by their keys only, so a shard's group may join a group its
+    # workflows would not have joined one by one: the groups differ from a single run
+    assert get_groups(merged) != get_groups(errors)
+    assert len(merged) <= len(errors)
@@ -0,0 +1,84 @@
+import copy
+import random
+from types import SimpleNamespace
+
+from aggregate_workflow_errors import (
+    ErrorAggregator,
+    aggregate_workflow_errors,
+    extract_workflow_fields,
+    stream_aggregate_workflow_errors,
+    workflow_result_to_dataframe,
+)
+from filter_latest_workflow import filter_latest_workflow
+from synthetic import PROTOCOL_VERSION, make_workflows
+
+PARAMETERS = SimpleNamespace(
+    platform_version="v3.5", protocol_version=PROTOCOL_VERSION, filter="failed"
+)
+
+
+def aggregate_batch(workflows: list, similarity_ratio: float) -> list:
+    latest = filter_latest_workflow(copy.deepcopy(workflows), PARAMETERS)
+    errors, _ = aggregate_workflow_errors(
+        workflow_result_to_dataframe(latest), similarity_ratio
+    )
+    return errors
+
+
+def aggregate_stream(workflows: list, similarity_ratio: float) -> list:
+    pages = [workflows[start : start + 50] for start in range(0, len(workflows), 50)]
+    for aggregator in stream_aggregate_workflow_errors(
+        copy.deepcopy(pages), PARAMETERS, similarity_ratio
+    ):
+        pass
+    return aggregator.errors
+
+
+def test_replacing_workflow_takes_the_place_of_the_group_value():
+    old, other, new = make_workflows(3, duplicate_rate=0, log_ratio=0, seed=5)
+    new["inputFile"] = old["inputFile"]
+    for workflow, created_at, message in [
+        (old, "2022-11-01", "Error while parsing sample plate 1: old run"),
+        (other, "2022-11-02", "Error while parsing sample plate 2: new run"),
+        (new, "2022-11-03", "Error while parsing sample plate 1: new run"),
+    ]:
+        workflow["createdAt"] = workflow["lastUpdatedAt"] = (
+            f"{created_at}T00:00:00.000Z"
+        )
+        workflow["tasks"][0]["output"]["result"]["message"] = message
+    # fetched oldest first, so the new workflow supersedes one that was already added
+    for similarity_ratio in (1, 0.8):
+        errors = aggregate_stream([old, other, new], similarity_ratio)
+        assert errors == aggregate_batch([old, other, new], similarity_ratio)
+        assert errors[0]["key"] == "Error while parsing sample plate 1: new run"
+
+
+def test_stream_report_matches_batch_with_superseded_workflows():
+    workflows = make_workflows(600, duplicate_rate=0.3, seed=6)
+    random.Random(6).shuffle(workflows)
+    assert aggregate_stream(workflows, 1) == aggregate_batch(workflows, 1)
+
+
+def test_removing_first_workflows_of_a_large_group_keeps_its_key():
+    aggregator = ErrorAggregator(0.8)
+    workflows = make_workflows(200, duplicate_rate=0, log_ratio=0, seed=7)
+    for index, workflow in enumerate(workflows):
+        workflow["tasks"][0]["output"]["result"]["message"] = f"Timeout after {index} s"
+        aggregator.add(extract_workflow_fields(workflow))
+    for workflow in workflows[:150]:
+        aggregator.remove(workflow["id"])
+    (error,) = aggregator.errors
+    assert error["count"] == 50
+    assert error["key"] == "Timeout after 150 s"
+    group = aggregator.groups[aggregator.exact_match_index[error["key"]]]
+    assert len(group["seqs"]) == len(group["messages"]) == 50
+
+
+def test_removing_a_workflow_with_no_error_uncounts_it():
+    aggregator = ErrorAggregator()
+    workflow = make_workflows(1, duplicate_rate=0, log_ratio=0, seed=8)[0]
+    workflow["tasks"][0] = {"output": None, "log": ""}
+    aggregator.add({**extract_workflow_fields(workflow), "file_id": None})
+    assert aggregator.no_error_found_workflow_count == 1
+    aggregator.remove(workflow["id"])
+    assert aggregator.no_error_found_workflow_count == 0
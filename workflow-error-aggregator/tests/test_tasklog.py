@@ -0,0 +1,14 @@
+from aggregate_workflow_errors import parse_task_log
+
+
+def test_entries_are_parsed_as_json_or_python_literals():
+    log = '{"level": "error", "message": "Failed"}\n\n{\'level\': \'info\'}'
+    assert parse_task_log(log) == [
+        {"level": "error", "message": "Failed"},
+        {"level": "info"},
+    ]
+
+
+def test_lines_that_cannot_be_parsed_are_kept():
+    lines = ["Task failed", "{[1]: 2}", "[" * 100000, "x = 1"]
+    assert parse_task_log("\n".join(lines)) == lines
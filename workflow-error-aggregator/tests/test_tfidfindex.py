@@ -0,0 +1,49 @@
+import pytest
+
+from aggregate_workflow_errors import (
+    aggregate_workflow_errors,
+    workflow_result_to_dataframe,
+)
+from synthetic import make_workflows
+
+pytest.importorskip("scipy")
+
+
+def get_groups(errors: list) -> set:
+    return {
+        frozenset(summary[0] for summary in error["workflow_info"]) for error in errors
+    }
+
+
+def aggregate(message_length: int, similarity_ratio: float) -> tuple:
+    workflow_df = workflow_result_to_dataframe(
+        make_workflows(
+            300,
+            duplicate_rate=0,
+            template_count=50,
+            message_length=message_length,
+            seed=9,
+        )
+    )
+    exhaustive, _ = aggregate_workflow_errors(
+        workflow_df, similarity_ratio, similarity="bounded"
+    )
+    tfidf, _ = aggregate_workflow_errors(workflow_df, similarity_ratio, engine="tfidf")
+    return get_groups(exhaustive), get_groups(tfidf)
+
+
+@pytest.mark.parametrize("similarity_ratio", [0.8, 0.9])
+def test_tfidf_groups_match_exhaustive_on_short_messages_at_high_ratios(
+    similarity_ratio,
+):
+    exhaustive, tfidf = aggregate(60, similarity_ratio)
+    assert tfidf == exhaustive
+
+
+def test_tfidf_ratio_is_a_cosine_threshold_on_a_different_scale():
+    # the same ratio is much stricter as a cosine similarity of short messages, and
+    # looser for longer messages with more random tokens
+    exhaustive, tfidf = aggregate(60, 0.5)
+    assert len(tfidf) > 3 * len(exhaustive)
+    exhaustive, tfidf = aggregate(200, 0.8)
+    assert len(tfidf) < len(exhaustive)
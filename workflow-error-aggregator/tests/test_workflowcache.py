@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+from workflow_error_aggregator import get_incremental_start, update_fetched_range
+from workflowcache import WorkflowCache
+
+
+def make_workflows(count: int, day: int = 1) -> list:
+    # newest first, one minute apart
+    return [
+        {
+            "id": f"{day}-{index}",
+            "createdAt": f"2024-01-{day:02d}T{23 - index // 60:02d}:{59 - index % 60:02d}:00.000Z",
+            "lastUpdatedAt": f"2024-01-{day:02d}T23:59:00.000Z",
+        }
+        for index in range(count)
+    ]
+
+
+def make_params(limit: int, start_datetime: str = "") -> SimpleNamespace:
+    return SimpleNamespace(
+        pipeline_id="pipeline",
+        filter="failed",
+        limit=limit,
+        start_datetime=start_datetime,
+        end_datetime="",
+    )
+
+
+def fetch(cache: WorkflowCache, params: SimpleNamespace, workflows: list):
+    fetch_start = get_incremental_start(params, cache, params.start_datetime)
+    fetched = [
+        workflow
+        for workflow in workflows
+        if not fetch_start or workflow["createdAt"] >= fetch_start
+    ][: params.limit]
+    cache.add_workflows(params.pipeline_id, params.filter, fetched)
+    update_fetched_range(params, cache, fetched, params.start_datetime, fetch_start)
+    return fetch_start
+
+
+def test_larger_limit_fetches_all_workflows_again(tmp_path):
+    cache = WorkflowCache(str(tmp_path / "cache.db"))
+    workflows = make_workflows(300)
+    assert fetch(cache, make_params(100), workflows) is None
+    assert fetch(cache, make_params(1000), workflows) is None
+    assert cache.count_workflows("pipeline", "failed") == 300
+    # the cache now holds every workflow, so later runs are incremental
+    assert fetch(cache, make_params(1000), workflows) is not None
+
+
+def test_smaller_limit_and_later_start_fetch_incrementally(tmp_path):
+    cache = WorkflowCache(str(tmp_path / "cache.db"))
+    workflows = make_workflows(300)
+    fetch(cache, make_params(100), workflows)
+    assert fetch(cache, make_params(50), workflows) == "2024-01-01T23:59:00"
+    assert fetch(cache, make_params(100, "2024-01-01T22:00:00"), workflows)
+
+
+def test_earlier_start_fetches_all_workflows_again(tmp_path):
+    cache = WorkflowCache(str(tmp_path / "cache.db"))
+    workflows = make_workflows(300, day=2) + make_workflows(300, day=1)
+    fetch(cache, make_params(1000, "2024-01-02"), workflows)
+    assert fetch(cache, make_params(1000, "2024-01-02"), workflows) is not None
+    assert fetch(cache, make_params(1000, "2024-01-01"), workflows) is None
+    assert cache.count_workflows("pipeline", "failed") == 600
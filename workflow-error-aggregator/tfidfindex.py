@@ -0,0 +1,184 @@
+from collections import Counter
+
+import numpy as np
+
+try:
+    from scipy import sparse
+except ImportError:  # optional dependency, only needed for the "tfidf" engine
+    sparse = None
+
+NGRAM_LENGTH = 3
+# Similarities are computed for blocks of this many messages against blocks of this many
+# groups, which bounds the memory of each sparse product. Messages that matched a group
+# are not compared with later blocks.
+MESSAGE_BLOCK_SIZE = 1024
+GROUP_BLOCK_SIZE = 4096
+# cosine similarities of identical messages may come out just below 1
+SIMILARITY_TOLERANCE = 1e-9
+
+
+def get_ngrams(message: str) -> Counter:
+    """
+    Returns the counts of the character n-grams of a message, padded with a space on
+    each side so its first and last characters are weighted like the others.
+    """
+    padded = f" {message} "
+    if len(padded) <= NGRAM_LENGTH:
+        return Counter([padded])
+    return Counter(
+        padded[i : i + NGRAM_LENGTH] for i in range(len(padded) - NGRAM_LENGTH + 1)
+    )
+
+
+def first_hits(similarities, threshold: float) -> np.ndarray:
+    """
+    Returns, for each row of a sparse similarity matrix, the first column whose value is
+    at least `threshold`, or -1.
+    """
+    similarities = similarities.tocsr()
+    rows = np.repeat(np.arange(similarities.shape[0]), np.diff(similarities.indptr))
+    hits = similarities.data >= threshold - SIMILARITY_TOLERANCE
+    no_hit = np.iinfo(np.int64).max
+    first = np.full(similarities.shape[0], no_hit, dtype=np.int64)
+    np.minimum.at(first, rows[hits], similarities.indices[hits])
+    first[first == no_hit] = -1
+    return first
+
+
+class TfidfIndex:
+    """
+    Character n-gram TF-IDF vectors of messages, compared by cosine similarity with
+    batched sparse-matrix products instead of one comparison per pair. Requires scipy.
+
+    Document frequencies are counted over the distinct messages observed, both those of
+    the groups and those matched against them, and apply to all vectors from the next
+    `match` on.
+
+    The cosine similarity is not a `SequenceMatcher` ratio, and there is no fixed
+    conversion: random tokens like UUIDs have rare n-grams with high weights, so how the
+    two relate depends on the length of the messages and how much of them varies.
+
+    Args:
+        similarity_ratio (float): minimum cosine similarity of a match
+        truncation_length (int): messages are compared up to this many characters
+    """
+
+    def __init__(self, similarity_ratio: float, truncation_length: int = None):
+        if sparse is None:
+            raise ImportError(
+                "The 'tfidf' clustering engine requires scipy, which is not installed. Install it with `poetry install -E tfidf`."
+            )
+        self.similarity_ratio = similarity_ratio
+        self.truncation_length = truncation_length
+        self.vocabulary = {}  # { n-gram: column }
+        self.document_frequency = []  # number of observed messages with each n-gram
+        self.observed = set()
+        # n-gram columns and counts of each group's message
+        self.group_columns = []
+        self.group_counts = []
+
+    def observe(self, messages) -> None:
+        """
+        Counts the n-grams of messages that were not observed before.
+        """
+        for message in messages:
+            message = message[: self.truncation_length]
+            if message in self.observed:
+                continue
+            self.observed.add(message)
+            for ngram in get_ngrams(message):
+                column = self.vocabulary.setdefault(ngram, len(self.vocabulary))
+                if column == len(self.document_frequency):
+                    self.document_frequency.append(0)
+                self.document_frequency[column] += 1
+
+    def add(self, message: str) -> None:
+        """
+        Adds the message of a new group; groups are numbered in the order they are added.
+        """
+        self.observe([message])
+        ngrams = get_ngrams(message[: self.truncation_length])
+        self.group_columns.append(
+            np.fromiter((self.vocabulary[ngram] for ngram in ngrams), dtype=np.int64)
+        )
+        self.group_counts.append(np.fromiter(ngrams.values(), dtype=np.float64))
+
+    def _matrix(self, columns: list, counts: list, idf: np.ndarray):
+        """
+        Returns the L2-normalized TF-IDF vectors of the rows as a sparse matrix.
+        """
+        indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in columns], out=indptr[1:])
+        indices = np.concatenate(columns) if columns else np.zeros(0, np.int64)
+        data = np.concatenate(counts) if counts else np.zeros(0)
+        data = data * idf[indices]
+        norms = np.sqrt(np.add.reduceat(data**2, indptr[:-1])) if len(data) else data
+        data /= np.repeat(np.where(norms > 0, norms, 1.0), np.diff(indptr))
+        return sparse.csr_matrix(
+            (data, indices, indptr), shape=(len(columns), len(idf))
+        )
+
+    def match(self, messages: list, group_count: int) -> tuple:
+        """
+        Compares a batch of messages with the first `group_count` groups, and with each
+        other.
+
+        Returns:
+            (list): for each message, the index of the first group that is at least
+                `similarity_ratio` similar, or None
+            (list): for each message, the sorted indices of the earlier messages of the
+                batch that are at least `similarity_ratio` similar to it
+            (int): number of pairs compared
+        """
+        self.observe(messages)
+        document_frequency = np.asarray(self.document_frequency, dtype=np.float64)
+        idf = np.log((1 + len(self.observed)) / (1 + document_frequency)) + 1
+        message_ngrams = [
+            get_ngrams(message[: self.truncation_length]) for message in messages
+        ]
+        vectors = self._matrix(
+            [
+                np.fromiter((self.vocabulary[ngram] for ngram in ngrams), np.int64)
+                for ngrams in message_ngrams
+            ],
+            [np.fromiter(ngrams.values(), np.float64) for ngrams in message_ngrams],
+            idf,
+        )
+        groups = self._matrix(
+            self.group_columns[:group_count], self.group_counts[:group_count], idf
+        )
+
+        compared = len(messages) * (len(messages) - 1) // 2
+        first = np.full(len(messages), -1, dtype=np.int64)
+        unmatched = np.arange(len(messages))
+        for group_start in range(0, group_count, GROUP_BLOCK_SIZE):
+            group_block = groups[group_start : group_start + GROUP_BLOCK_SIZE].T
+            compared += len(unmatched) * group_block.shape[1]
+            for start in range(0, len(unmatched), MESSAGE_BLOCK_SIZE):
+                rows = unmatched[start : start + MESSAGE_BLOCK_SIZE]
+                hits = first_hits(vectors[rows] @ group_block, self.similarity_ratio)
+                first[rows[hits >= 0]] = hits[hits >= 0] + group_start
+            unmatched = unmatched[first[unmatched] < 0]
+            if not len(unmatched):
+                break
+
+        similar_rows, similar_columns = [np.zeros(0, np.int64)], [np.zeros(0, np.int64)]
+        for start in range(0, len(messages), MESSAGE_BLOCK_SIZE):
+            similarities = (
+                vectors[start : start + MESSAGE_BLOCK_SIZE] @ vectors.T
+            ).tocoo()
+            rows = similarities.row.astype(np.int64) + start
+            hits = (similarities.col < rows) & (
+                similarities.data >= self.similarity_ratio - SIMILARITY_TOLERANCE
+            )
+            similar_rows.append(rows[hits])
+            similar_columns.append(similarities.col[hits].astype(np.int64))
+        rows, columns = np.concatenate(similar_rows), np.concatenate(similar_columns)
+        order = np.lexsort((columns, rows))
+        earlier = np.split(
+            columns[order],
+            np.cumsum(np.bincount(rows, minlength=len(messages)))[:-1],
+        )
+
+        matches = [int(index) if index >= 0 else None for index in first]
+        return matches, [indices.tolist() for indices in earlier], compared
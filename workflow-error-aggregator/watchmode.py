@@ -0,0 +1,300 @@
+import copy
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List
+
+from loguru import logger
+
+from aggregate_workflow_errors import DEFAULT_SIMILARITY_RATIO, find_similar_group
+from batchrunner import make_pipeline_params
+from defaultparams import GetSourceFilesParameters
+from fetchengine import make_session
+from htmlwriter import get_group_message
+from runmetrics import metrics
+from similarity import DEFAULT_SIMILARITY_BACKEND
+from workflowcache import WorkflowCache
+
+WATCH_STATE_NAME = "watch_state"  # file name of the persisted cluster state
+WATCH_DELTA_NAME = "watch_deltas"  # file name of the delta log, one JSON line per poll
+WATCH_STATE_SCHEMA_VERSION = 1
+# The search API filters on "createdAt", so each poll also fetches workflows created up
+# to this many seconds before the latest workflow seen, to catch those that were still
+# running at the previous poll. Workflows that were already counted are skipped.
+WATCH_LOOKBACK = 3600
+# a cluster that has not grown for this many polls is reported as stopped
+STOPPED_AFTER_POLLS = 3
+WATCH_LOG_LIMIT = 10  # clusters logged per kind of change; the delta log has them all
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+class WatchState:
+    """
+    Cluster state of a watched pipeline, persisted as JSON between polls and between runs.
+
+    Clusters hold {"message", "count", "first_seen", "last_grown", "last_grown_poll",
+    "stopped"}, where the times are those of the polls in UTC. Counts are the number of
+    workflows seen while watching. The workflows seen in the lookback window are kept, so
+    that a workflow fetched by two polls is only counted once.
+    """
+
+    def __init__(self, path: str, pipeline_id: str):
+        self.path = path
+        self.pipeline_id = pipeline_id
+        self.polls = 0
+        self.high_water_mark = None  # latest "createdAt" seen, as YYYY-MM-DDTHH:MM:SS
+        self.clusters = []
+        self.seen = {}  # { workflow ID: createdAt }
+        self.exact_match_index = {}  # { message: index into clusters }
+
+    @classmethod
+    def load(cls, path: str, pipeline_id: str) -> "WatchState":
+        """
+        Returns the state saved at `path`, or an empty state if there is none.
+        """
+        state = cls(path, pipeline_id)
+        if not os.path.isfile(path):
+            return state
+        with open(path, "rt") as fin:
+            data = json.load(fin)
+        if data.get("schema_version") != WATCH_STATE_SCHEMA_VERSION:
+            logger.warning(
+                f"Watch state {path} has an unknown schema version. Starting over..."
+            )
+            return state
+        state.polls = data["polls"]
+        state.high_water_mark = data["high_water_mark"]
+        state.clusters = data["clusters"]
+        state.seen = data["seen"]
+        state.exact_match_index = {
+            cluster["message"]: index for index, cluster in enumerate(state.clusters)
+        }
+        logger.info(
+            f"Watch state loaded from {path}: {len(state.clusters)} clusters after {state.polls} polls."
+        )
+        return state
+
+    def save(self) -> None:
+        # written to a temporary file first, so an interrupted run keeps the last state
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wt") as fout:
+            json.dump(
+                {
+                    "schema_version": WATCH_STATE_SCHEMA_VERSION,
+                    "pipeline_id": self.pipeline_id,
+                    "polls": self.polls,
+                    "high_water_mark": self.high_water_mark,
+                    "clusters": self.clusters,
+                    "seen": self.seen,
+                },
+                fout,
+            )
+        os.replace(tmp_path, self.path)
+
+    def fetch_start(self, start_datetime: str) -> str:
+        """
+        Returns the start of the next poll's search: `WATCH_LOOKBACK` seconds before the
+        high-water mark, or `start_datetime` if it is later.
+        """
+        if not self.high_water_mark:
+            return start_datetime
+        lookback_start = (
+            datetime.strptime(self.high_water_mark, TIMESTAMP_FORMAT)
+            - timedelta(seconds=WATCH_LOOKBACK)
+        ).strftime(TIMESTAMP_FORMAT)
+        return max(lookback_start, start_datetime or "")
+
+    def fold(
+        self,
+        errors: list,
+        fetch_start: str,
+        similarity_ratio: float = DEFAULT_SIMILARITY_RATIO,
+        similarity: str = DEFAULT_SIMILARITY_BACKEND,
+    ) -> dict:
+        """
+        Folds the aggregated errors of a poll into the clusters, skipping workflows that
+        were already counted, and returns the delta of the poll. Messages are matched
+        like within a run, with the `similarity` backend.
+
+        Returns:
+            (dict): {"poll", "polled_at", "new", "growing", "stopped"}, where each list
+                holds clusters as {"index", "message", "count", "added"}
+        """
+        self.polls += 1
+        polled_at = utc_now()
+        added = {}  # { cluster index: workflows added in this poll }
+        new_clusters = set()
+        for error in errors or []:
+            workflow_info = [
+                info for info in error["workflow_info"] if info[0] not in self.seen
+            ]
+            if not workflow_info:
+                continue
+            message = get_group_message(error)
+            index = self.exact_match_index.get(message)
+            if index is None and similarity_ratio != DEFAULT_SIMILARITY_RATIO:
+                keys = [cluster["message"] for cluster in self.clusters]
+                index = find_similar_group(
+                    message, keys, similarity_ratio, backend=similarity
+                )
+            if index is None:
+                index = len(self.clusters)
+                self.exact_match_index[message] = index
+                self.clusters.append(
+                    {"message": message, "count": 0, "first_seen": polled_at}
+                )
+                new_clusters.add(index)
+            cluster = self.clusters[index]
+            cluster["count"] += len(workflow_info)
+            cluster["last_grown"] = polled_at
+            cluster["last_grown_poll"] = self.polls
+            cluster["stopped"] = False
+            added[index] = added.get(index, 0) + len(workflow_info)
+            for workflow_id, created_at, *_ in workflow_info:
+                self.seen[workflow_id] = created_at
+                if not self.high_water_mark or created_at > self.high_water_mark:
+                    self.high_water_mark = created_at
+
+        stopped = []
+        for index, cluster in enumerate(self.clusters):
+            if (
+                not cluster["stopped"]
+                and self.polls - cluster["last_grown_poll"] >= STOPPED_AFTER_POLLS
+            ):
+                cluster["stopped"] = True
+                stopped.append(index)
+
+        # workflows created before the next poll's search start are never fetched again
+        next_start = self.fetch_start(fetch_start)
+        self.seen = {
+            workflow_id: created_at
+            for workflow_id, created_at in self.seen.items()
+            if not next_start or created_at >= next_start
+        }
+
+        def summarize(indices) -> list:
+            return [
+                {
+                    "index": index,
+                    "message": self.clusters[index]["message"],
+                    "count": self.clusters[index]["count"],
+                    "added": added.get(index, 0),
+                }
+                for index in indices
+            ]
+
+        return {
+            "poll": self.polls,
+            "polled_at": polled_at,
+            "new": summarize(sorted(new_clusters)),
+            "growing": summarize(
+                sorted(set(added) - new_clusters, key=lambda index: -added[index])
+            ),
+            "stopped": summarize(stopped),
+        }
+
+
+def poll_pipeline(
+    params: GetSourceFilesParameters,
+    state: WatchState,
+    aggregate_pipeline: Callable,
+    session=None,
+    cache: WorkflowCache = None,
+) -> dict:
+    """
+    Fetches and aggregates the workflows of a pipeline created since the last poll (minus
+    `WATCH_LOOKBACK`), folds them into the state, saves it, and logs and appends the delta
+    to the delta log.
+    """
+    poll_params = copy.copy(params)
+    poll_params.start_datetime = state.fetch_start(params.start_datetime)
+    # the delta log replaces the usual outputs, which would be rewritten on every poll
+    poll_params.html_output_name = ""
+    poll_params.csv_output_name = ""
+    poll_params.json_output_name = ""
+    poll_params.export_output_name = ""
+    poll_params.raw_file_name = ""
+    with metrics.stage(f"poll {params.pipeline_id}"):
+        errors = aggregate_pipeline(poll_params, session=session, cache=cache)
+    delta = state.fold(
+        errors,
+        poll_params.start_datetime,
+        params.similarity_ratio,
+        params.similarity_backend,
+    )
+    delta["pipeline_id"] = params.pipeline_id
+    state.save()
+
+    with open(os.path.join(params.save_dir, f"{WATCH_DELTA_NAME}.jsonl"), "at") as fout:
+        fout.write(json.dumps(delta) + "\n")
+    logger.info(
+        f"Poll {delta['poll']} of pipeline {params.pipeline_id}: {len(delta['new'])} new, {len(delta['growing'])} growing and {len(delta['stopped'])} stopped clusters."
+    )
+    for change in ("new", "growing", "stopped"):
+        for cluster in delta[change][:WATCH_LOG_LIMIT]:
+            logger.info(
+                f"{change.capitalize()} cluster {cluster['index']} (count {cluster['count']}, +{cluster['added']}): {cluster['message'][:200]}"
+            )
+        if len(delta[change]) > WATCH_LOG_LIMIT:
+            logger.info(
+                f"... and {len(delta[change]) - WATCH_LOG_LIMIT} more {change} clusters."
+            )
+    return delta
+
+
+def run_watch(
+    params: GetSourceFilesParameters,
+    pipelines: List[dict],
+    aggregate_pipeline: Callable,
+    batch: bool = False,
+) -> None:
+    """
+    Polls the pipelines every `params.watch_interval` seconds until interrupted. Each
+    pipeline's cluster state is saved to `WATCH_STATE_NAME.json` in its save directory, so
+    a restarted watch continues where it stopped.
+
+    Args:
+        params (GetSourceFilesParameters): parameters shared by all pipelines
+        pipelines (list): pipelines, as returned by `get_batch_pipelines`
+        aggregate_pipeline (Callable): called as aggregate_pipeline(params, session=...,
+            cache=...); returns the aggregated errors or None
+        batch (bool): if true, each pipeline is saved to its own folder, like in a batch
+    """
+    session = make_session(params.concurrency)
+    cache = WorkflowCache(params.cache_path) if params.cache_path else None
+    watched = []
+    for pipeline in pipelines:
+        pipeline_params = make_pipeline_params(params, pipeline) if batch else params
+        state_path = os.path.join(pipeline_params.save_dir, f"{WATCH_STATE_NAME}.json")
+        watched.append(
+            (pipeline_params, WatchState.load(state_path, pipeline_params.pipeline_id))
+        )
+    logger.info(
+        f"Watching {len(watched)} pipelines every {params.watch_interval} seconds. Press Ctrl+C to stop."
+    )
+
+    def poll(pipeline_params, state):
+        try:
+            poll_pipeline(
+                pipeline_params, state, aggregate_pipeline, session=session, cache=cache
+            )
+        except Exception:
+            logger.exception(
+                f"Poll of pipeline {pipeline_params.pipeline_id} failed. Continuing..."
+            )
+
+    with ThreadPoolExecutor(max_workers=max(params.concurrency, 1)) as executor:
+        try:
+            while True:
+                poll_start = time.monotonic()
+                list(executor.map(lambda args: poll(*args), watched))
+                elapsed = time.monotonic() - poll_start
+                time.sleep(max(params.watch_interval - elapsed, 0))
+        except KeyboardInterrupt:
+            logger.info("Watch stopped.")
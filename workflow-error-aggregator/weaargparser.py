@@ -1,5 +1,9 @@
 import argparse
 from defaultparams import GetSourceFilesParameters
+from aggregate_workflow_errors import CLUSTERING_ENGINES, MESSAGE_KEYS
+from similarity import SIMILARITY_BACKENDS
+from reportwriter import REPORT_MODES
+from exportwriter import EXPORT_FORMATS
 from loguru import logger
 import re
 
@@ -31,6 +35,14 @@ class WeaArgParser:
         """
         return self.__assure_positive_int(val, allow_neg_one=True)
 
+    def __assure_non_negative_int(self, val):
+        """
+        wrapper function to also allow 0
+        """
+        if str(val).strip() in ["0", "0.0"]:
+            return 0
+        return self.__assure_positive_int(val)
+
     def __assure_between_zero_one(self, val):
         try:
             float_val = float(val)
@@ -85,7 +97,16 @@ class WeaArgParser:
             "--pipeline-id",
             dest="pipeline_id",
             default=default.PIPELINE_ID,
-            help="UUID of the pipeline to be used.",
+            help="UUID of the pipeline to be used. Several pipelines can be given, separated by commas, to aggregate them in one batch.",
+        )
+
+        self.parser.add_argument(
+            "-a",
+            "--batch-config",
+            type=str,
+            dest="batch_config",
+            default=default.BATCH_CONFIG,
+            help="Path of a file listing the pipelines to aggregate in one batch: a text file with one pipeline ID per line, or a JSON file with per-pipeline parameters. If set, PIPELINE_ID is ignored.",
         )
 
         self.parser.add_argument(
@@ -146,7 +167,46 @@ class WeaArgParser:
             dest="similarity_ratio",
             type=self.__assure_between_zero_one,
             default=default.SIMILARITY_RATIO,
-            help="Number between 0 and 1 (inclusive) for how similar error messages can be and still be grouped together. Setting to 1 means errors must be identical to be grouped together.",
+            help="Number between 0 and 1 (inclusive) for how similar error messages can be and still be grouped together. Setting to 1 means errors must be identical to be grouped together. With the 'tfidf' engine, this is the minimum cosine similarity instead.",
+        )
+
+        self.parser.add_argument(
+            "-g",
+            "--engine",
+            dest="clustering_engine",
+            type=self.__make_lowercase_str,
+            choices=CLUSTERING_ENGINES,
+            default=default.CLUSTERING_ENGINE,
+            help="Engine used to group similar error messages when the similarity ratio is below 1. 'exhaustive' compares each message with every group; 'lsh' only compares with candidate groups from a locality-sensitive hashing index, which is much faster for many groups but approximate, as it may miss a borderline match, and falls back to 'exhaustive' at ratios of 0.7 and below; 'parallel' compares messages with every group like 'exhaustive', spread across worker processes; 'tfidf' compares batches of messages as character n-gram TF-IDF vectors, which is the fastest for very large runs and requires scipy. With 'tfidf', the similarity ratio is the minimum cosine similarity instead of a SequenceMatcher ratio, so the same value groups messages very differently; tune it for this engine.",
+        )
+
+        self.parser.add_argument(
+            "-N",
+            "--workers",
+            dest="workers",
+            type=self.__assure_non_negative_int,
+            default=default.WORKERS,
+            help="Number of worker processes of the 'parallel' engine. Defaults to the number of CPUs if 0.",
+        )
+
+        self.parser.add_argument(
+            "-y",
+            "--similarity",
+            dest="similarity_backend",
+            type=self.__make_lowercase_str,
+            choices=list(SIMILARITY_BACKENDS),
+            default=default.SIMILARITY_BACKEND,
+            help="How the similarity of two error messages is measured when the similarity ratio is below 1. 'sequence' is the SequenceMatcher ratio; 'bounded' gives the same result, but skips pairs whose length ratio or quick ratio already rule out a match; 'levenshtein' is the normalized edit distance, computed only up to the number of edits the ratio allows; 'jaccard' is the overlap of the sets of words, which is the fastest but ignores word order.",
+        )
+
+        self.parser.add_argument(
+            "-m",
+            "--message-key",
+            dest="message_key",
+            type=self.__make_lowercase_str,
+            choices=MESSAGE_KEYS,
+            default=default.MESSAGE_KEY,
+            help="What error messages are grouped by. 'message' uses the error message itself; 'template' first masks variable tokens (UUIDs, timestamps, file keys, numbers, ...) and groups messages by the resulting log template; 'signature' groups messages holding a Python or JavaScript stack trace by their exception type, masked final message line and innermost stack frames.",
         )
 
         self.parser.add_argument(
@@ -167,6 +227,42 @@ class WeaArgParser:
             help="Latest date/time for the file search.",
         )
 
+        self.parser.add_argument(
+            "-c",
+            "--concurrency",
+            dest="concurrency",
+            type=self.__assure_positive_int,
+            default=default.CONCURRENCY,
+            help="Maximum number of concurrent API requests used to fetch pages of workflows.",
+        )
+
+        self.parser.add_argument(
+            "-w",
+            "--time-windows",
+            dest="time_windows",
+            type=self.__assure_non_negative_int,
+            default=default.TIME_WINDOWS,
+            help="If greater than 0, the search between the start and end date/times is split into this many time windows, which are fetched independently and in parallel. Windows that come back full are split again. If 0, results are paged in a single search.",
+        )
+
+        self.parser.add_argument(
+            "-W",
+            "--watch",
+            dest="watch_interval",
+            type=self.__assure_non_negative_int,
+            default=default.WATCH_INTERVAL,
+            help="If greater than 0, the pipelines are polled every this many seconds until the program is stopped. Each poll only fetches recent workflows, folds them into the cluster state saved in SAVE_DIR, and logs the new, growing and stopped clusters. If 0, the pipelines are aggregated once.",
+        )
+
+        self.parser.add_argument(
+            "-i",
+            "--stream",
+            action="store_true",
+            dest="stream",
+            default=default.STREAM,
+            help="If true, each page of workflows is filtered, extracted and aggregated as soon as it is fetched, instead of after all workflows are fetched. Cannot be used with `TIME_WINDOWS`, `CACHE_PATH`, `CSV_OUTPUT_NAME` or a `MESSAGE_KEY` of 'template' or 'signature'.",
+        )
+
         self.parser.add_argument(
             "-S",
             "--ssl",
@@ -246,6 +342,90 @@ class WeaArgParser:
             help=f"File name of csv output file of the aggregated workflow errors. Should not contain the extension or path. If set to 'None' or '' (empty string), then no file is generated. Default: {default.CSV_OUTPUT_NAME}",
         )
 
+        self.parser.add_argument(
+            "-R",
+            "--report-mode",
+            dest="report_mode",
+            type=self.__make_lowercase_str,
+            choices=REPORT_MODES,
+            default=default.REPORT_MODE,
+            help=f"Layout of the html output. 'table' writes a single table with every workflow. 'paged' writes a summary page that loads the workflows of each group on demand from data files, for very large aggregations. Default: {default.REPORT_MODE}",
+        )
+
+        self.parser.add_argument(
+            "-J",
+            "--json-output",
+            type=str,
+            dest="json_output_name",
+            default=default.JSON_OUTPUT_NAME,
+            help=f"File name of the JSON output file of the aggregated workflow errors. Should not contain the extension or path. If set to 'None' or '' (empty string), then no file is generated. Default: {default.JSON_OUTPUT_NAME}",
+        )
+
+        self.parser.add_argument(
+            "-A",
+            "--partial-output",
+            type=str,
+            dest="partial_output_name",
+            default=default.PARTIAL_OUTPUT_NAME,
+            help=f"File name of a partial aggregate (JSON) of the aggregated workflow errors, which can be merged with those of other runs with `--merge-partials`. Should not contain the extension or path. If empty, no file is generated. Default: {default.PARTIAL_OUTPUT_NAME}",
+        )
+
+        self.parser.add_argument(
+            "-G",
+            "--merge-partials",
+            type=str,
+            nargs="+",
+            dest="merge_partials",
+            default=default.MERGE_PARTIALS,
+            help="Paths of partial aggregates of other runs to merge into one aggregate, instead of fetching workflows. The outputs are written from the merged aggregate.",
+        )
+
+        self.parser.add_argument(
+            "-x",
+            "--export-output",
+            type=str,
+            dest="export_output_name",
+            default=default.EXPORT_OUTPUT_NAME,
+            help=f"File name prefix of the columnar export of the workflows, clusters and pipeline configuration, which are written to <prefix>_workflows, <prefix>_clusters and <prefix>_pipeline files. Should not contain the extension or path. If set to 'None' or '' (empty string), then no files are generated. Requires pyarrow. Default: {default.EXPORT_OUTPUT_NAME}",
+        )
+
+        self.parser.add_argument(
+            "-X",
+            "--export-format",
+            dest="export_format",
+            type=self.__make_lowercase_str,
+            choices=EXPORT_FORMATS,
+            default=default.EXPORT_FORMAT,
+            help=f"Format of the columnar export: 'parquet', 'arrow' (Arrow IPC file) or 'feather'. Default: {default.EXPORT_FORMAT}",
+        )
+
+        self.parser.add_argument(
+            "-M",
+            "--metrics-output",
+            type=str,
+            dest="metrics_output_name",
+            default=default.METRICS_OUTPUT_NAME,
+            help=f"File name of the JSON file of run metrics: time per stage, API requests and latencies, similarity comparisons and peak memory. Should not contain the extension or path. If set to 'None' or '' (empty string), then no file is generated. Default: {default.METRICS_OUTPUT_NAME}",
+        )
+
+        self.parser.add_argument(
+            "-O",
+            "--prometheus-textfile",
+            type=str,
+            dest="prometheus_textfile",
+            default=default.PROMETHEUS_TEXTFILE,
+            help="Path of a file to write the run metrics to in the Prometheus text format, e.g. in the directory of the node_exporter textfile collector. If empty, no file is generated.",
+        )
+
+        self.parser.add_argument(
+            "-B",
+            "--metrics-baseline",
+            type=str,
+            dest="metrics_baseline",
+            default=default.METRICS_BASELINE,
+            help="Path of the JSON run metrics of an earlier run. If set, the time of each stage is compared with that run, and stages that became much slower are reported.",
+        )
+
         self.parser.add_argument(
             "-L",
             "--log-root",
@@ -254,6 +434,22 @@ class WeaArgParser:
             help="Sets the base directory for log files from the program.",
         )
 
+        self.parser.add_argument(
+            "-k",
+            "--cache",
+            dest="cache_path",
+            default=default.CACHE_PATH,
+            help="Path to a local SQLite workflow cache file, which is created if it does not exist. If set, only workflows created since the latest cached workflow are fetched, and the rest are read from the cache. If empty, no cache is used.",
+        )
+
+        self.parser.add_argument(
+            "-K",
+            "--cluster-store",
+            dest="cluster_store",
+            default=default.CLUSTER_STORE,
+            help="Path to a local SQLite cluster store file, which is created if it does not exist. If set, error groups are matched against the clusters of earlier runs first and keep their cluster IDs across runs. If empty, groups are only numbered by their index.",
+        )
+
         self.parser.add_argument(
             "-T",
             "--truncate",
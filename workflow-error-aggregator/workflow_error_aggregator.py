@@ -1,52 +1,260 @@
-from requests import get
+import requests
+from requests import Session
+from requests.exceptions import RequestException
 from loguru import logger
+import json
 import os
-from typing import Tuple
+from typing import Callable, Iterator, Optional, Tuple
 from pydash import get as _get
-from time import sleep
+from time import perf_counter, sleep
+from datetime import datetime, timezone
+from dateutil.parser import parse as parse_datetime
 
 from filter_latest_workflow import filter_latest_workflow
 from aggregate_workflow_errors import (
+    add_message_signatures,
+    add_message_templates,
     aggregate_workflow_errors,
+    make_workflow_projection,
+    merge_partial_aggregates,
+    stream_aggregate_workflow_errors,
     workflow_result_to_dataframe,
 )
 from defaultparams import WorkflowErrorAggregatorParameters, GetSourceFilesParameters
 from weaargparser import WeaArgParser
 from logfolder import configure_logging, log_parameters
 from htmlwriter import make_html_output
+from reportwriter import (
+    make_json_output,
+    make_paged_html_output,
+    make_partial_output,
+)
+from exportwriter import make_export_output
+from fetchengine import (
+    PageStream,
+    fetch_pages,
+    fetch_time_windows,
+    iter_unique_pages,
+    make_session,
+    merge_pages,
+)
+from workflowcache import WorkflowCache
+from clusterstore import ClusterStore
+from runmetrics import metrics, write_metrics
+from batchrunner import get_batch_pipelines, run_batch
+from watchmode import run_watch
 
 
 API_REQUEST_TIMEOUT = 30  # timeout time for API requests in seconds
 MAX_API_RETRY = 3
+MAX_WINDOW_PAGES = 10  # time windows with more pages of results than this are split
+TIME_WINDOW_FORMAT = "%Y-%m-%dT%H:%M:%S"
+PAGE_SIZE = 100  # max value allowed by "workflow/search" API
+
+
+def project_workflows(workflows: list) -> list:
+    """
+    Reduces each workflow of a page to the fields that are used (see
+    `make_workflow_projection`), so the rest of the API results can be freed as soon as
+    the page arrives. Returns None if `workflows` is None, i.e. the request failed.
+    """
+    if workflows is None:
+        return None
+    project_workflow = make_workflow_projection()
+    return [project_workflow(workflow) for workflow in workflows]
 
 
-def get_pipeline_info(params: GetSourceFilesParameters) -> Tuple[list, dict]:
+def get_pipeline_info(
+    params: GetSourceFilesParameters,
+    session: Session = None,
+    cache: WorkflowCache = None,
+) -> Tuple[list, dict]:
     """Fetches pipeline information based off of the pipeline_id and the limit
      of records to be returned
 
+    Workflow pages are fetched concurrently (up to `params.concurrency` requests at once)
+    over a single pooled HTTP session, reassembled in page order and deduplicated by
+    workflow ID. If `params.time_windows` is set, the search is instead split into time
+    windows that are fetched independently and split again when they come back full.
+
+    If a cache is given and the search fits within the range the cache was fetched for
+    (see `get_incremental_start`), only workflows created since the end of that range are
+    fetched; the rest are read from the cache. Otherwise, all workflows are fetched again.
+
+    Each page of workflows is reduced to the fields that are used as soon as it arrives
+    (see `project_workflows`).
+
     Args:
         params (GetSourceFilesParameters): Class wrapper of all user-configurable parameters
+        session (Session): HTTP session to use. If None, a new session is created.
+        cache (WorkflowCache): local workflow cache to use. If None, no cache is used.
 
     Returns:
         list: List of dicts of pipeline logs
         dict: Dictionary of pipeline configuration parameters
     """
 
+    if session is None:
+        session = make_session(params.concurrency)
+
+    pipeline_config = fetch_pipeline_config(params, session=session, cache=cache)
+    if pipeline_config is None:
+        return [None, None]
+
+    search_start = get_search_start(params)
+    fetch_start = None  # overrides the start of the search for incremental fetches
+    if cache is not None:
+        fetch_start = get_incremental_start(params, cache, search_start)
+    logger.info(f"Fetching workflows.")
+
+    api_endpoint = get_workflow_api_endpoint(params)
+
+    def fetch_window(start_time: datetime, end_time: datetime) -> Tuple[list, bool]:
+        window_results = []
+        for page in range(MAX_WINDOW_PAGES):
+            paged_url = make_url(
+                parameters=params,
+                api_endpoint=api_endpoint,
+                page=page,
+                page_size=PAGE_SIZE,
+                start_time=start_time.strftime(TIME_WINDOW_FORMAT),
+                end_time=end_time.strftime(TIME_WINDOW_FORMAT),
+            )
+            current_list = project_workflows(
+                fetch_results_with_retry(paged_url, params, session)
+            )
+            if current_list is None:
+                return None
+            window_results.extend(current_list)
+            if len(current_list) < PAGE_SIZE:
+                return window_results, False
+        return window_results, True  # window is full and should be split
+
+    start_time, end_time = None, None
+    if params.time_windows:
+        start_time, end_time = get_time_range(params, pipeline_config, fetch_start)
+
+    if start_time is not None:
+        logger.info(
+            f"Fetching workflows from {start_time} to {end_time} in {params.time_windows} time windows."
+        )
+        pages, all_found = fetch_time_windows(
+            fetch_window,
+            start_time,
+            end_time,
+            params.time_windows,
+            params.limit,
+            concurrency=params.concurrency,
+        )
+    else:
+        pages, all_found = fetch_pages(
+            make_page_fetcher(params, session, start_time=fetch_start),
+            params.limit,
+            PAGE_SIZE,
+            concurrency=params.concurrency,
+        )
+    results_full_list = merge_pages(pages)[: params.limit]
+    logger.info(f"{len(results_full_list)} total workflows retrieved.")
+
+    if cache is not None:
+        cache.add_workflows(params.pipeline_id, params.filter, results_full_list)
+        if all_found:
+            update_fetched_range(
+                params, cache, results_full_list, search_start, fetch_start
+            )
+        # workflows cached by earlier versions were saved in full
+        results_full_list = project_workflows(
+            cache.get_workflows(
+                params.pipeline_id,
+                params.filter,
+                start_time=search_start,
+                end_time=params.end_datetime,
+                limit=params.limit,
+            )
+        )
+        logger.info(
+            f"{len(results_full_list)} total workflows, including cached workflows."
+        )
+
+    log_fetch_summary(params, len(results_full_list), all_found)
+
+    return results_full_list, pipeline_config
+
+
+def stream_pipeline_info(
+    params: GetSourceFilesParameters, session: Session = None
+) -> Tuple[Iterator[list], dict]:
+    """
+    Like `get_pipeline_info`, but instead of the list of workflows, returns an iterator
+    over pages of workflows. Pages are fetched concurrently in the background and yielded
+    in page order as soon as they are available, deduplicated by workflow ID, so they can
+    be processed while later pages are still being fetched.
+
+    Returns:
+        Iterator[list]: pages of dicts of pipeline logs
+        dict: Dictionary of pipeline configuration parameters
+    """
+    if session is None:
+        session = make_session(params.concurrency)
+
+    pipeline_config = fetch_pipeline_config(params, session=session)
+    if pipeline_config is None:
+        return None, None
+
+    logger.info(f"Fetching workflows.")
+    stream = PageStream(
+        make_page_fetcher(params, session),
+        params.limit,
+        PAGE_SIZE,
+        concurrency=params.concurrency,
+    )
+
+    def iter_workflow_pages():
+        workflow_count = 0
+        for page in iter_unique_pages(stream, limit=params.limit):
+            workflow_count += len(page)
+            logger.info(f"{workflow_count} total workflows retrieved.")
+            yield page
+        log_fetch_summary(params, workflow_count, stream.all_found)
+
+    return iter_workflow_pages(), pipeline_config
+
+
+def fetch_pipeline_config(
+    params: GetSourceFilesParameters,
+    session: Session = None,
+    cache: WorkflowCache = None,
+) -> dict:
+    """
+    Fetches the pipeline configuration, retrying failed requests, and saves the latest
+    protocol version and pipeline update time to `params` if they are used.
+
+    Returns:
+        dict: Dictionary of pipeline configuration parameters, or None if it could not be
+            retrieved
+    """
     # Fetch pipeline version/update time information
     logger.info(f"Fetching the pipeline configuration.")
     retry_count = 0
     pipeline_config = None
+    if cache is not None:
+        pipeline_config = cache.get_pipeline_config(params.pipeline_id)
+        if pipeline_config:
+            logger.info(f"Using the cached pipeline configuration.")
     while not pipeline_config:
         retry_count += 1
-        pipeline_config = get_pipeline_config(params)
+        pipeline_config = get_pipeline_config(params, session=session)
         if pipeline_config is None and retry_count >= MAX_API_RETRY:
             logger.error(f"Pipeline configuration could not be retrieved.")
-            return [None, None]
+            return None
         if not pipeline_config:
+            metrics.record_retry()
             logger.warning(
                 f"API request for pipeline configuration failed. Retrying (attempt {retry_count})."
             )
             sleep(2.0)
+        elif cache is not None:
+            cache.add_pipeline_config(params.pipeline_id, pipeline_config)
 
     if params.use_latest_protocol or params.use_latest_pipeline:
         # save version/update time information to param class.
@@ -65,65 +273,51 @@ def get_pipeline_info(params: GetSourceFilesParameters) -> Tuple[list, dict]:
             # No pipeline update time present in 3.1 workflow object.
             setattr(params, "updated_time", None)
 
+    return pipeline_config
+
+
+def get_workflow_api_endpoint(params: GetSourceFilesParameters) -> str:
     # API should use pagination.
     if "v3.1" in params.platform_version:
-        api_endpoint = "workflow/workflows"
+        return "workflow/workflows"
     else:
-        api_endpoint = "workflow/search"
+        return "workflow/search"
 
-    curr_results_needed = params.limit
-    page = 0  # zero-indexed page number
-    PAGE_SIZE = 100  # max value allowed by "workflow/search" API
-    results_full_list = []
-    retry_count = 0
-    logger.info(f"Fetching workflows.")
-    all_found = False
-    while True:
-        # do-while loop for retrieving results
-        results_per_page = (
-            PAGE_SIZE if PAGE_SIZE < curr_results_needed else curr_results_needed
-        )
+
+def make_page_fetcher(
+    params: GetSourceFilesParameters, session: Session, start_time: str = None
+) -> Callable[[int], list]:
+    """
+    Returns a function that fetches a page of workflows by page number, with retries.
+    """
+    api_endpoint = get_workflow_api_endpoint(params)
+
+    def fetch_page(page: int) -> list:
         paged_url = make_url(
             parameters=params,
             api_endpoint=api_endpoint,
             page=page,
-            page_size=results_per_page,
+            page_size=PAGE_SIZE,
+            start_time=start_time,
         )
-        current_list = fetch_results(paged_url, params=params)
+        return project_workflows(fetch_results_with_retry(paged_url, params, session))
 
-        if current_list is None and retry_count >= MAX_API_RETRY:
-            logger.warning(
-                f"API request failed. Retried {MAX_API_RETRY} time{'s' if MAX_API_RETRY != 1 else ''}."
-            )
-            if len(results_full_list) > 0:
-                logger.warning(
-                    f"Proceeding with current list of workflows. Be aware that there may be more {params.filter} workflows not included in this analysis."
-                )
-            break
-        elif current_list is None:
-            retry_count += 1
-            PAGE_SIZE = max(int(PAGE_SIZE / 2), 5)
-            logger.warning(
-                f"API request failed. Retrying with {PAGE_SIZE} results per page (attempt {retry_count})."
-            )
-            sleep(2.0)
-            continue
-        elif not current_list:
-            logger.warning(f"No workflows matching the specified criteria we found.")
-            break
-
-        # Merge previous results with new results
-        results_full_list = [*results_full_list, *current_list]
-        page += 1  # increment page
-        curr_results_needed -= PAGE_SIZE  # decrement remaining results needed
-        logger.info(f"{len(results_full_list)} total workflows retrieved.")
-        if curr_results_needed <= 0 or len(current_list) < PAGE_SIZE:
-            all_found = True
-            break  # all needed results retrieved
+    return fetch_page
+
+
+def log_fetch_summary(
+    params: GetSourceFilesParameters, workflow_count: int, all_found: bool
+) -> None:
+    if not workflow_count:
+        logger.warning(f"No workflows matching the specified criteria we found.")
+    elif not all_found:
+        logger.warning(
+            f"Proceeding with current list of workflows. Be aware that there may be more {params.filter} workflows not included in this analysis."
+        )
 
     filter_str = f"{params.filter} " if params.filter else ""
     logger.info(
-        f"{params.limit} {filter_str}workflows requested; {len(results_full_list)} {filter_str}workflows found."
+        f"{params.limit} {filter_str}workflows requested; {workflow_count} {filter_str}workflows found."
     )
 
     if all_found:
@@ -133,7 +327,153 @@ def get_pipeline_info(params: GetSourceFilesParameters) -> Tuple[list, dict]:
             f"There may be remaining {filter_str}workflows not included in this aggregation."
         )
 
-    return results_full_list, pipeline_config
+
+def get_search_start(params: GetSourceFilesParameters) -> str:
+    """
+    Returns the start date/time of the workflow search: `START_DATETIME`, or the pipeline
+    update time if it is later and `USE_LATEST_PIPELINE` is set.
+    """
+    if params.use_latest_pipeline and "v3.1" not in params.platform_version:
+        # determine if specified start datetime is more recent:
+        return determine_latest_date_from_strings(
+            params.updated_time, params.start_datetime
+        )
+    return params.start_datetime
+
+
+def get_incremental_start(
+    params: GetSourceFilesParameters, cache: WorkflowCache, search_start: str
+) -> Optional[str]:
+    """
+    Returns the start of an incremental fetch from the end of the cache's fetched range
+    (see `WorkflowCache.get_fetched_range`), or None if the cache cannot complete the
+    search and all workflows have to be fetched again.
+
+    The search fits the cache if the fetched range reaches back to the start of the
+    search, or if it already holds at least `LIMIT` workflows of the search, so the newest
+    `LIMIT` workflows are all either cached or created since the end of the range.
+    """
+    fetched_range = cache.get_fetched_range(params.pipeline_id, params.filter)
+    if fetched_range is None:
+        return None
+    range_start, range_end = fetched_range
+    if not (
+        not range_start
+        or (search_start and range_start <= search_start)
+        or cache.count_workflows(
+            params.pipeline_id,
+            params.filter,
+            start_time=determine_latest_date_from_strings(search_start, range_start),
+            end_time=params.end_datetime,
+        )
+        >= params.limit
+    ):
+        logger.info(
+            f"Cached workflows only cover workflows created since {range_start}. Fetching all workflows again."
+        )
+        return None
+    fetch_start = determine_latest_date_from_strings(search_start, range_end[:19])
+    if fetch_start:
+        logger.info(
+            f"Cached workflows found. Fetching workflows created since {fetch_start}."
+        )
+    return fetch_start
+
+
+def update_fetched_range(
+    params: GetSourceFilesParameters,
+    cache: WorkflowCache,
+    workflows: list,
+    search_start: str,
+    fetch_start: str = None,
+) -> None:
+    """
+    Records the range the cache holds every workflow of after a successful fetch of
+    `workflows`, which started at `fetch_start` for an incremental fetch, or else at
+    `search_start`.
+
+    If `LIMIT` workflows were fetched, older ones may be missing, so the range only
+    starts at the oldest workflow fetched. Otherwise it extends the cache's range for an
+    incremental fetch, or starts at the start of the search. It ends at `END_DATETIME`,
+    or at the newest workflow fetched.
+    """
+    fetched_range = (
+        cache.get_fetched_range(params.pipeline_id, params.filter)
+        if fetch_start is not None
+        else None
+    )
+    created = [_get(workflow, "createdAt") for workflow in workflows]
+    created = [created_at for created_at in created if created_at]
+    if len(workflows) >= params.limit:
+        range_start = min(created, default=fetch_start or search_start)
+    elif fetched_range is not None:
+        range_start = fetched_range[0]
+    else:
+        range_start = search_start
+    range_end = params.end_datetime or max(created, default="")
+    range_end = determine_latest_date_from_strings(
+        range_end, fetch_start or search_start
+    )
+    if fetched_range is not None:
+        range_end = determine_latest_date_from_strings(range_end, fetched_range[1])
+    cache.set_fetched_range(params.pipeline_id, params.filter, range_start, range_end)
+
+
+def get_time_range(
+    params: GetSourceFilesParameters, pipeline_config: dict, start_str: str = None
+) -> Tuple[datetime, datetime]:
+    """
+    Returns the (start, end) datetimes of the workflow search as naive UTC datetimes, for
+    splitting the search into time windows. If no start can be determined, returns
+    (None, None).
+
+    `start_str` overrides the start of the search, e.g. for an incremental fetch.
+    """
+    if not start_str:
+        start_str = get_search_start(params)
+    if not start_str and "v3.1" not in params.platform_version:
+        # no workflow can be older than its pipeline. (In v3.1, the pipeline configuration
+        # is taken from a workflow, so its "createdAt" is not the pipeline's.)
+        start_str = _get(pipeline_config, "createdAt")
+    if not start_str:
+        logger.warning(
+            f"No start date/time available to split the search into time windows. Set START_DATETIME to use time windows. Continuing without time windows..."
+        )
+        return None, None
+
+    def to_naive_utc(value: datetime) -> datetime:
+        if value.tzinfo is None:
+            return value
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    start_time = to_naive_utc(parse_datetime(start_str))
+    if params.end_datetime:
+        end_time = to_naive_utc(parse_datetime(params.end_datetime))
+    else:
+        end_time = datetime.utcnow()
+    return start_time, end_time
+
+
+def fetch_results_with_retry(
+    url: str, params: GetSourceFilesParameters, session: Session = None
+) -> list:
+    """
+    Calls fetch_results, retrying failed requests up to MAX_API_RETRY times.
+    """
+    retry_count = 0
+    while True:
+        current_list = fetch_results(url, params=params, session=session)
+        if current_list is not None:
+            return current_list
+        if retry_count >= MAX_API_RETRY:
+            logger.warning(
+                f"API request failed. Retried {MAX_API_RETRY} time{'s' if MAX_API_RETRY != 1 else ''}."
+            )
+            return None
+        retry_count += 1
+        metrics.record_retry()
+        logger.warning(f"API request failed. Retrying (attempt {retry_count}).")
+        sleep(2.0)
 
 
 def attempt_error_diagnosis(api_request: dict) -> None:
@@ -145,23 +485,28 @@ def attempt_error_diagnosis(api_request: dict) -> None:
     )
 
 
-def get_pipeline_config(params: GetSourceFilesParameters) -> dict:
+def get_pipeline_config(
+    params: GetSourceFilesParameters, session: Session = None
+) -> dict:
     if "v3.1" not in params.platform_version:
         api_endpoint = "pipeline"
         pipeline_url = make_url(params, api_endpoint)
-        return fetch_results(pipeline_url, params, api_endpoint)
+        return fetch_results(pipeline_url, params, api_endpoint, session=session)
     else:
         # TDP 3.1 compatibility: v3.1.* does not have a pipeline API endpoint, so we must instead fetch a single workflow to get pipeline parameters.
         api_endpoint = "workflow/workflows"
         pipeline_url = make_url(params, api_endpoint, page=1, page_size=1, status="")
         try:
-            return fetch_results(pipeline_url, params, api_endpoint)[0]
+            return fetch_results(pipeline_url, params, api_endpoint, session=session)[0]
         except Exception:
             return None
 
 
 def fetch_results(
-    url: str, params: GetSourceFilesParameters, api_endpoint="workflow"
+    url: str,
+    params: GetSourceFilesParameters,
+    api_endpoint="workflow",
+    session: Session = None,
 ) -> list:
     """
     Performs API call to TDP to get results.
@@ -169,20 +514,41 @@ def fetch_results(
     Args:
         url (str): URL to make API call to
         params (GetSourceFilesParameters): user-set parameters
+        session (Session): pooled HTTP session to make the call with. If None, a one-off
+            connection is used.
 
     Returns:
-        (list): list of dicts of pipeline logs
+        (list): list of dicts of pipeline logs, or None if the request failed
     """
     # retrieve results via API call
     headers = {
         "ts-auth-token": params.user_token,
         "x-org-slug": params.org_slug,
     }
-    api_request = get(
-        url, headers=headers, verify=params.verify_ssl, timeout=API_REQUEST_TIMEOUT
-    ).json()
+    request_start = perf_counter()
+    response = None
+    try:
+        response = (session or requests).get(
+            url,
+            headers=headers,
+            verify=params.verify_ssl,
+            timeout=API_REQUEST_TIMEOUT,
+        )
+        api_request = response.json()
+    except (RequestException, ValueError) as err:
+        metrics.record_request(
+            perf_counter() - request_start,
+            len(response.content) if response is not None else 0,
+            failed=True,
+        )
+        logger.error(f"API request failed! {err}")
+        return None
 
-    if "statusCode" in api_request and _get(api_request, "statusCode") != 200:
+    failed = "statusCode" in api_request and _get(api_request, "statusCode") != 200
+    metrics.record_request(
+        perf_counter() - request_start, len(response.content), failed=failed
+    )
+    if failed:
         attempt_error_diagnosis(api_request)
         logger.error("API request failed!")
         return None
@@ -200,6 +566,8 @@ def make_url(
     page: int = 0,
     page_size=100,
     status=None,
+    start_time: str = None,
+    end_time: str = None,
 ) -> str:
     """
     Returns a url for the API call based on the specified parameters and platform version numbers.
@@ -208,6 +576,8 @@ def make_url(
         parameters (GetSourceFilesParameters): default parameters set by user
         api_endpoint (str): API endpoint for the query
         page (int): page number for retrieving results with pagination.
+        start_time (str): overrides the start of the search, e.g. for a time window
+        end_time (str): overrides the end of the search, e.g. for a time window
 
     Returns:
         (str): Complete URL for making an API call
@@ -237,16 +607,14 @@ def make_url(
     else:
         append_search_criterion("filter", status)
 
-    if parameters.use_latest_pipeline and "v3.1" not in parameters.platform_version:
-        # determine if specified start datetime is more recent:
-        initial_time = determine_latest_date_from_strings(
-            parameters.updated_time, parameters.start_datetime
-        )
-        append_search_criterion("startTime", initial_time)
-    elif parameters.start_datetime:
-        append_search_criterion("startTime", parameters.start_datetime)
+    if not start_time:
+        start_time = get_search_start(parameters)
+    if start_time:
+        append_search_criterion("startTime", start_time)
 
-    if parameters.end_datetime:
+    if end_time:
+        append_search_criterion("endTime", end_time)
+    elif parameters.end_datetime:
         append_search_criterion("endTime", parameters.end_datetime)
 
     if "v3.1" in parameters.platform_version:
@@ -326,54 +694,241 @@ def main():
             )
             exit()
 
+    metrics.reset()
+    try:
+        pipelines = get_batch_pipelines(params)
+        batch = bool(params.batch_config) or len(pipelines) > 1
+        if params.merge_partials:
+            merge_partial_outputs(params)
+        elif params.watch_interval:
+            run_watch(params, pipelines, aggregate_pipeline_errors, batch=batch)
+        elif batch:
+            run_batch(params, pipelines, aggregate_pipeline_errors)
+        else:
+            aggregate_pipeline_errors(params)
+    finally:
+        write_metrics(params)
+
+
+def aggregate_pipeline_errors(
+    params: GetSourceFilesParameters,
+    session: Session = None,
+    cache: WorkflowCache = None,
+) -> list:
+    """
+    Fetches, filters and aggregates the workflows of a pipeline and writes the outputs,
+    recording the time of each stage in `metrics`.
+
+    Args:
+        params (GetSourceFilesParameters): Class wrapper of all user-configurable parameters
+        session (Session): HTTP session to use. If None, a new session is created.
+        cache (WorkflowCache): local workflow cache to use. If None, the cache at
+            `params.cache_path` is used, if any.
+
+    Returns:
+        list: aggregated errors, or None if no workflows were aggregated
+    """
+    if cache is None and params.cache_path:
+        cache = WorkflowCache(params.cache_path)
+    cluster_store, clusters = None, None
+    if params.cluster_store:
+        cluster_store = ClusterStore(params.cluster_store)
+        clusters = cluster_store.get_clusters(params.pipeline_id)
+
+    if params.stream:
+        if (
+            params.time_windows
+            or cache is not None
+            or params.message_key in ("template", "signature")
+            or params.csv_output_name
+        ):
+            logger.warning(
+                f"Streaming cannot be used with `TIME_WINDOWS`, `CACHE_PATH`, `CSV_OUTPUT_NAME` or a `MESSAGE_KEY` of 'template' or 'signature'. Continuing without streaming..."
+            )
+        else:
+            with metrics.stage("stream"):
+                result = stream_workflow_errors(
+                    params, session=session, clusters=clusters
+                )
+            if result is None:
+                return None
+            if cluster_store is not None:
+                cluster_store.update(params.pipeline_id, result[0])
+            with metrics.stage("outputs"):
+                write_outputs(params, *result)
+            return result[0]
+
     # get workflows
-    response, pipeline_config = get_pipeline_info(params)
+    with metrics.stage("fetch"):
+        response, pipeline_config = get_pipeline_info(
+            params, session=session, cache=cache
+        )
 
     if not response:
-        return
+        return None
 
     if isinstance(response, dict) and response["error"]:
         logger.info(response)
-        return
+        return None
 
     workflows = response
+    metrics.add_count("workflows", len(workflows))
     if len(workflows) == 0:
         logger.info("No workflow found with given condition")
-        return
+        return None
 
     # aggregate errors
-    latest_wfs = filter_latest_workflow(workflows, params)
+    with metrics.stage("filter"):
+        latest_wfs = filter_latest_workflow(workflows, params)
+    metrics.add_count("latest_workflows", len(latest_wfs))
     if not latest_wfs:
-        return
-    workflow_df = workflow_result_to_dataframe(
-        latest_wfs,
-        task_result_message="tasks.-1.output.result.message",
-    )
+        return None
+    # the task result message is only needed for the CSV output
+    extract_fields = {}
+    if params.csv_output_name:
+        extract_fields["task_result_message"] = "tasks.-1.output.result.message"
+    with metrics.stage("dataframe"):
+        workflow_df = workflow_result_to_dataframe(latest_wfs, **extract_fields)
+
+    csv_columns = [
+        "id",
+        "createdAt",
+        "lastUpdatedAt",
+        "file_id",
+        "task_result_message",
+    ]
+    message_field = None
+    if params.message_key == "template":
+        with metrics.stage("templates"):
+            workflow_df = add_message_templates(workflow_df)
+        csv_columns.append("template_id")
+        message_field = "template"
+    elif params.message_key == "signature":
+        with metrics.stage("signatures"):
+            workflow_df = add_message_signatures(workflow_df)
+        csv_columns.append("signature")
+        message_field = "signature"
 
     if params.csv_output_name:
-        workflow_df[
-            [
-                "id",
-                "createdAt",
-                "lastUpdatedAt",
-                "file_id",
-                "task_result_message",
-            ]
-        ].to_csv(f"{params.csv_output_name}.csv")
-
-    errors, file_id_list = aggregate_workflow_errors(
-        workflow_df, params.similarity_ratio, status=params.filter
-    )
+        with metrics.stage("outputs"):
+            workflow_df[csv_columns].to_csv(f"{params.csv_output_name}.csv")
+
+    with metrics.stage("aggregate"):
+        errors, file_id_list = aggregate_workflow_errors(
+            workflow_df,
+            params.similarity_ratio,
+            status=params.filter,
+            engine=params.clustering_engine,
+            message_field=message_field,
+            clusters=clusters,
+            workers=params.workers,
+            similarity=params.similarity_backend,
+        )
+    if cluster_store is not None:
+        cluster_store.update(params.pipeline_id, errors)
+
+    with metrics.stage("outputs"):
+        write_outputs(params, errors, file_id_list, pipeline_config)
+    return errors
+
 
+def merge_partial_outputs(params: GetSourceFilesParameters) -> list:
+    """
+    Merges the partial aggregates at `params.merge_partials` and writes the outputs of the
+    merged aggregate, with the pipeline configuration of the first partial.
+
+    Returns:
+        list: aggregated errors
+    """
+    settings = {"similarity_ratio": params.similarity_ratio, "status": params.filter}
+    partials = []
+    with metrics.stage("merge"):
+        for path in params.merge_partials:
+            with open(path, "rt") as fin:
+                partial = json.load(fin)
+            for setting, value in settings.items():
+                if partial.get(setting) != value:
+                    logger.warning(
+                        f"Partial aggregate {path} was made with {setting} {partial.get(setting)}, not {value}. Continuing..."
+                    )
+            partials.append(partial)
+        logger.info(f"Merging {len(partials)} partial aggregates.")
+        errors, file_id_list = merge_partial_aggregates(
+            partials,
+            params.similarity_ratio,
+            engine=params.clustering_engine,
+            workers=params.workers,
+            similarity=params.similarity_backend,
+        )
+    metrics.add_count("workflows", sum(error["count"] for error in errors))
+
+    with metrics.stage("outputs"):
+        write_outputs(
+            params, errors, file_id_list, partials[0]["pipeline"] if partials else None
+        )
+    return errors
+
+
+def stream_workflow_errors(
+    params: GetSourceFilesParameters, session: Session = None, clusters: list = None
+) -> Tuple[list, list, dict]:
+    """
+    Fetches and aggregates workflows page by page, so that aggregation runs while later
+    pages are still being fetched. `clusters` are the known clusters of a `ClusterStore`.
+
+    Returns:
+        list: aggregated errors
+        list: file IDs of the workflows with an error
+        dict: Dictionary of pipeline configuration parameters
+        or None if nothing was found
+    """
+    workflow_pages, pipeline_config = stream_pipeline_info(params, session=session)
+    if workflow_pages is None:
+        return None
+
+    aggregator = None
+    for aggregator in stream_aggregate_workflow_errors(
+        workflow_pages,
+        params,
+        params.similarity_ratio,
+        status=params.filter,
+        engine=params.clustering_engine,
+        clusters=clusters,
+        workers=params.workers,
+        similarity=params.similarity_backend,
+    ):
+        pass  # progress is logged as each page is aggregated
+
+    if aggregator is None:
+        logger.info("No workflow found with given condition")
+        return None
+    return aggregator.errors, aggregator.file_id_list, pipeline_config
+
+
+def write_outputs(
+    params: GetSourceFilesParameters,
+    errors: list,
+    file_id_list: list,
+    pipeline_config: dict,
+) -> None:
+    """
+    Logs the summary report and writes the output files.
+    """
     # summary report
     msg = "error" if params.filter.lower() == "failed" else "message"
+    metrics.add_count("groups", len(errors))
 
     logger.info(
         f"With similarity ratio: {params.similarity_ratio}, the unique {msg} count is: {len(errors)}, distribution:"
     )
     for index, existing_err in enumerate(errors):
         count = existing_err["count"]
-        logger.info(f"Index: {index}, Count: {count}")
+        if existing_err.get("cluster_id") is None:
+            logger.info(f"Index: {index}, Count: {count}")
+        else:
+            logger.info(
+                f"Index: {index}, Count: {count}, Cluster ID: {existing_err['cluster_id']}"
+            )
 
     # save raw file IDs to a file
 
@@ -381,7 +936,19 @@ def main():
         save_raw_file_ids(errors, file_id_list, params)
 
     if params.html_output_name:
-        make_html_output(errors, params, pipeline_config)
+        if params.report_mode == "paged":
+            make_paged_html_output(errors, params, pipeline_config)
+        else:
+            make_html_output(errors, params, pipeline_config)
+
+    if params.json_output_name:
+        make_json_output(errors, params, pipeline_config)
+
+    if params.partial_output_name:
+        make_partial_output(errors, params, pipeline_config)
+
+    if params.export_output_name:
+        make_export_output(errors, params, pipeline_config)
 
 
 if __name__ == "__main__":
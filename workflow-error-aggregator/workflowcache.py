@@ -0,0 +1,199 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from pydash import get as _get
+from loguru import logger
+
+# Cached pipeline configurations older than this (in seconds) are fetched again.
+PIPELINE_CONFIG_MAX_AGE = 3600
+
+
+class WorkflowCache:
+    """
+    On-disk SQLite cache of workflows and pipeline configurations. The cache may be
+    shared by threads; its connection is only used by one thread at a time.
+
+    Workflows are keyed by pipeline ID and workflow ID, and a cached workflow is only
+    replaced by a copy with a later "lastUpdatedAt". The fetched range of a pipeline and
+    status is the range of "createdAt", which is what the "startTime" search parameter
+    filters on, for which the cache holds every workflow. A new run whose search fits
+    within that range only needs to fetch workflows created since its end.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS workflows (
+                    pipeline_id TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    status TEXT,
+                    created_at TEXT,
+                    last_updated_at TEXT,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (pipeline_id, id)
+                )
+                """
+            )
+            self.connection.execute(
+                """
+                CREATE INDEX IF NOT EXISTS workflows_by_created_at
+                ON workflows (pipeline_id, status, created_at)
+                """
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS fetched_ranges (
+                    pipeline_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    start_time TEXT NOT NULL,
+                    end_time TEXT NOT NULL,
+                    PRIMARY KEY (pipeline_id, status)
+                )
+                """
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pipeline_configs (
+                    pipeline_id TEXT PRIMARY KEY,
+                    fetched_at REAL NOT NULL,
+                    data TEXT NOT NULL
+                )
+                """
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def get_fetched_range(self, pipeline_id: str, status: str) -> Optional[tuple]:
+        """
+        Returns the (start, end) "createdAt" range within which every workflow of a
+        pipeline with the given status is cached, or None if no range was recorded. The
+        start is "" if the range reaches back to the first workflow.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT start_time, end_time FROM fetched_ranges WHERE pipeline_id = ? AND status = ?",
+                (pipeline_id, status),
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def set_fetched_range(
+        self, pipeline_id: str, status: str, start_time: str, end_time: str
+    ) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO fetched_ranges (pipeline_id, status, start_time, end_time) VALUES (?, ?, ?, ?)",
+                (pipeline_id, status, start_time or "", end_time or ""),
+            )
+
+    def count_workflows(
+        self,
+        pipeline_id: str,
+        status: str,
+        start_time: str = None,
+        end_time: str = None,
+    ) -> int:
+        """
+        Returns the number of cached workflows of a pipeline with the given status, within
+        the same start and end times as `get_workflows`.
+        """
+        query = "SELECT COUNT(*) FROM workflows WHERE pipeline_id = ? AND status = ?"
+        arguments = [pipeline_id, status]
+        if start_time:
+            query += " AND created_at >= ?"
+            arguments.append(start_time)
+        if end_time:
+            query += " AND created_at < ?"
+            arguments.append(end_time)
+        with self.lock:
+            return self.connection.execute(query, arguments).fetchone()[0]
+
+    def add_workflows(self, pipeline_id: str, status: str, workflows: list) -> None:
+        """
+        Inserts workflows, replacing cached copies that were last updated earlier.
+        """
+        with self.lock, self.connection:
+            self.connection.executemany(
+                """
+                INSERT INTO workflows (pipeline_id, id, status, created_at, last_updated_at, data)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (pipeline_id, id) DO UPDATE SET
+                    status = excluded.status,
+                    created_at = excluded.created_at,
+                    last_updated_at = excluded.last_updated_at,
+                    data = excluded.data
+                WHERE excluded.last_updated_at >= workflows.last_updated_at
+                    OR workflows.last_updated_at IS NULL
+                """,
+                [
+                    (
+                        pipeline_id,
+                        _get(workflow, "id"),
+                        status,
+                        _get(workflow, "createdAt"),
+                        _get(workflow, "lastUpdatedAt"),
+                        json.dumps(workflow),
+                    )
+                    for workflow in workflows
+                ],
+            )
+        logger.debug(f"{len(workflows)} workflows saved to cache {self.path}.")
+
+    def get_workflows(
+        self,
+        pipeline_id: str,
+        status: str,
+        start_time: str = None,
+        end_time: str = None,
+        limit: int = None,
+    ) -> list:
+        """
+        Returns the cached workflows of a pipeline with the given status, newest first.
+        Start and end times are compared lexicographically with "createdAt", like
+        `determine_latest_date_from_strings`.
+        """
+        query = "SELECT data FROM workflows WHERE pipeline_id = ? AND status = ?"
+        arguments = [pipeline_id, status]
+        if start_time:
+            query += " AND created_at >= ?"
+            arguments.append(start_time)
+        if end_time:
+            query += " AND created_at < ?"
+            arguments.append(end_time)
+        query += " ORDER BY created_at DESC"
+        if limit:
+            query += " LIMIT ?"
+            arguments.append(limit)
+        with self.lock:
+            rows = self.connection.execute(query, arguments).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_pipeline_config(
+        self, pipeline_id: str, max_age: float = PIPELINE_CONFIG_MAX_AGE
+    ) -> Optional[dict]:
+        """
+        Returns the cached pipeline configuration, or None if it is missing or older than
+        `max_age` seconds.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT fetched_at, data FROM pipeline_configs WHERE pipeline_id = ?",
+                (pipeline_id,),
+            ).fetchone()
+        if row is None or time.time() - row[0] > max_age:
+            return None
+        return json.loads(row[1])
+
+    def add_pipeline_config(self, pipeline_id: str, pipeline_config: dict) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pipeline_configs (pipeline_id, fetched_at, data) VALUES (?, ?, ?)",
+                (pipeline_id, time.time(), json.dumps(pipeline_config)),
+            )